@@ -0,0 +1,269 @@
+# alerts.py
+# Серверные напоминания о перерывах и лимитах. Для каждого водителя с открытой
+# активностью держим дедлайны в колесе таймеров (timing_wheel.py):
+#   break_due  — непрерывная езда дойдёт до 4ч30м;
+#   drive_9h / drive_10h — дневная езда дойдёт до 9ч / 10ч (по жетону);
+#   rest_due   — 13ч от начала рабочего периода, пора начинать ежедневный отдых.
+# Дедлайны пересчитываются на каждом переходе активности (transitions.py),
+# срабатывают за TT_ALERT_LEAD_MIN до срока: строка в таблицу alerts и
+# пробуждение подписчиков SSE /api/alerts/stream.
+#
+# Колесом владеет один фоновый поток на процесс. При нескольких воркерах
+# gunicorn дубль алерта отсекает уникальный ключ (user_id, shift_id, kind), а
+# устаревший таймер — проверка, что смена всё ещё открыта; SSE читает алерты
+# из таблицы, поэтому подписчик получает их от любого воркера. Для SSE нужны
+# потоковые воркеры (gthread/gevent), sync-воркер занят на всё соединение.
+
+from __future__ import annotations
+
+import os, json, time, queue, logging, threading
+from datetime import datetime, timezone
+from flask import Response, request, jsonify
+
+import transitions
+from auth import access_claims, decode_access, require_auth
+from compliance import (today_counters, recent_segments, duty_start,
+                        DAILY_DRIVE_S, DAILY_DRIVE_EXT_S, DUTY_SPAN_S)
+from db import raw_connect
+from query_log import query_budget
+from timing_wheel import TimingWheel
+
+log = logging.getLogger("triketime.alerts")
+
+ENABLED  = os.getenv("TT_ALERTS", "1") != "0"
+TICK_SEC = float(os.getenv("TT_ALERTS_TICK_SEC", "1"))
+LEAD_S   = float(os.getenv("TT_ALERT_LEAD_MIN", "15")) * 60
+POLL_SEC = float(os.getenv("TT_ALERTS_POLL_SEC", "5"))
+
+KINDS = ("break_due", "drive_9h", "drive_10h", "rest_due")
+MESSAGES = {
+    "break_due": "Нужен перерыв 45 мин",
+    "drive_9h":  "Дневная езда подходит к 9 ч",
+    "drive_10h": "Дневная езда подходит к 10 ч (жетон продления)",
+    "rest_due":  "Пора начинать ежедневный отдых",
+}
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def deadlines(counters: dict, activity: str | None, duty_from: float | None, now_ts: float) -> dict[str, float]:
+    """Сроки (unix-время) по видам алертов для текущего состояния водителя."""
+    out = {}
+    if activity == "drive":
+        out["break_due"] = now_ts + counters["next_break_in"]
+        for kind, limit in (("drive_9h", DAILY_DRIVE_S), ("drive_10h", DAILY_DRIVE_EXT_S)):
+            if counters["drive_today"] < limit:
+                out[kind] = now_ts + limit - counters["drive_today"]
+    if activity in ("drive", "other") and duty_from is not None:
+        out["rest_due"] = duty_from + DUTY_SPAN_S
+    return out
+
+
+def refire(conn, user_id: int, now_ts: float | None = None, lead_s: float = LEAD_S) -> int:
+    """
+    Алерты открытой смены по текущим правилам (пересборка, rebuild.py): уже
+    наступившие записываются, не наступившие по новым правилам — снимаются.
+    Алерты закрытых смен — история, их не трогаем. commit делает вызывающий.
+    """
+    now_ts = now_ts if now_ts is not None else time.time()
+    row = conn.execute(
+        "SELECT id FROM shifts WHERE user_id = ? AND end_time IS NULL ORDER BY id DESC LIMIT 1",
+        (user_id,)).fetchone()
+    if row is None:
+        return 0
+    shift_id = row[0]
+    counters = today_counters(conn, now_ts, user_id)
+    duty_from = duty_start(recent_segments(conn, now_ts - 24 * 3600, now_ts, user_id))
+    due = {kind: at for kind, at in deadlines(counters, counters["activity"], duty_from, now_ts).items()
+           if at - lead_s <= now_ts}
+    keep = f" AND kind NOT IN ({','.join('?' * len(due))})" if due else ""
+    conn.execute(f"DELETE FROM alerts WHERE shift_id = ?{keep}", (shift_id, *due))
+    conn.executemany(
+        "INSERT OR IGNORE INTO alerts (user_id, shift_id, kind, due_at, created_at, message) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [(user_id, shift_id, kind, _iso(at), _iso(now_ts), MESSAGES[kind]) for kind, at in due.items()])
+    return len(due)
+
+
+class AlertScheduler:
+    """Колесо дедлайнов + поток, который его крутит и перевооружает по переходам."""
+
+    def __init__(self, tick: float = TICK_SEC, lead_s: float = LEAD_S):
+        self.wheel = TimingWheel(tick=tick, now=time.time())
+        self.lead_s = lead_s
+        self._inbox: queue.Queue = queue.Queue()
+        self._listeners: dict[int, set[queue.Queue]] = {}
+        self._listeners_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tt-alerts", daemon=True)
+
+    # ----- вызывается из потоков запросов -----
+    def on_transition(self, user_id, activity, ts) -> None:
+        if user_id is not None:
+            self._inbox.put(user_id)
+
+    def listen(self, user_id: int) -> queue.Queue:
+        q: queue.Queue = queue.Queue()
+        with self._listeners_lock:
+            self._listeners.setdefault(user_id, set()).add(q)
+        return q
+
+    def unlisten(self, user_id: int, q: queue.Queue) -> None:
+        with self._listeners_lock:
+            qs = self._listeners.get(user_id)
+            if qs:
+                qs.discard(q)
+                if not qs:
+                    del self._listeners[user_id]
+
+    def _wake(self, user_id: int) -> None:
+        with self._listeners_lock:
+            for q in self._listeners.get(user_id, ()):
+                q.put_nowait(None)
+
+    # ----- поток колеса -----
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def rearm(self, conn, user_id: int, now_ts: float | None = None) -> None:
+        """Снять старые дедлайны водителя и поставить новые по состоянию из БД."""
+        now_ts = now_ts if now_ts is not None else time.time()
+        for kind in KINDS:
+            self.wheel.cancel((user_id, kind))
+        row = conn.execute(
+            "SELECT id FROM shifts WHERE user_id = ? AND end_time IS NULL ORDER BY id DESC LIMIT 1",
+            (user_id,)).fetchone()
+        if row is None:
+            return
+        shift_id = row[0]
+        counters = today_counters(conn, now_ts, user_id)
+        duty_from = duty_start(recent_segments(conn, now_ts - 24 * 3600, now_ts, user_id))
+        for kind, due in deadlines(counters, counters["activity"], duty_from, now_ts).items():
+            self.wheel.schedule((user_id, kind), due - self.lead_s, {"shift_id": shift_id, "due": due})
+
+    def warm(self, conn) -> int:
+        """Дедлайны для всех открытых смен (старт процесса)."""
+        users = [r[0] for r in conn.execute(
+            "SELECT DISTINCT user_id FROM shifts WHERE end_time IS NULL AND user_id IS NOT NULL")]
+        for user_id in users:
+            self.rearm(conn, user_id)
+        return len(users)
+
+    def fire(self, conn, user_id: int, kind: str, payload: dict) -> bool:
+        """Записать алерт, если смена всё ещё открыта и такого алерта ещё нет."""
+        row = conn.execute(
+            "SELECT 1 FROM shifts WHERE id = ? AND user_id = ? AND end_time IS NULL",
+            (payload["shift_id"], user_id)).fetchone()
+        if row is None:
+            return False
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO alerts (user_id, shift_id, kind, due_at, created_at, message) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (user_id, payload["shift_id"], kind, _iso(payload["due"]), _iso(time.time()), MESSAGES[kind]))
+        conn.commit()
+        if cur.rowcount:
+            self._wake(user_id)
+        return bool(cur.rowcount)
+
+    def _run(self) -> None:
+        conn = raw_connect()
+        try:
+            log.info("alerts: armed %d drivers", self.warm(conn))
+            while not self._stop.wait(self.wheel.tick):
+                try:
+                    self._tick(conn)
+                except Exception:
+                    log.exception("alerts tick failed")
+        finally:
+            conn.close()
+
+    def _tick(self, conn) -> None:
+        users = set()
+        while True:
+            try:
+                users.add(self._inbox.get_nowait())
+            except queue.Empty:
+                break
+        for user_id in users:
+            self.rearm(conn, user_id)
+        for (user_id, kind), _, payload in self.wheel.advance(time.time()):
+            self.fire(conn, user_id, kind, payload)
+
+
+scheduler = AlertScheduler()
+
+
+# ---------- чтение ----------
+def _row(r) -> dict:
+    return {"id": r[0], "kind": r[1], "due_at": r[2], "created_at": r[3], "message": r[4]}
+
+
+def recent(conn, user_id: int, after_id: int = 0, limit: int = 50) -> list[dict]:
+    """Следующие limit алертов после after_id, от старых к новым (дальше — с id последнего)."""
+    rows = conn.execute(
+        "SELECT id, kind, due_at, created_at, message FROM alerts "
+        "WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?", (user_id, after_id, limit)).fetchall()
+    return [_row(r) for r in rows]
+
+
+def stream(user_id: int, last_id: int):
+    """SSE: новые алерты водителя; между ними — пинги раз в POLL_SEC."""
+    q = scheduler.listen(user_id)
+    conn = raw_connect()
+    try:
+        yield f"retry: {int(POLL_SEC * 1000)}\n\n"
+        while True:
+            page = recent(conn, user_id, last_id, 100)
+            for a in page:
+                last_id = a["id"]
+                yield f"id: {a['id']}\nevent: alert\ndata: {json.dumps(a, ensure_ascii=False)}\n\n"
+            if len(page) == 100:
+                continue        # после обрыва связи накопилось больше страницы — догоняем без ожидания
+            try:
+                q.get(timeout=POLL_SEC)
+            except queue.Empty:
+                yield ": ping\n\n"
+    finally:
+        scheduler.unlisten(user_id, q)
+        conn.close()
+
+
+def init_app(app) -> None:
+    if not ENABLED:
+        return
+    transitions.subscribe(scheduler.on_transition)
+    scheduler.start()
+
+    @app.route("/api/alerts", methods=["GET"])
+    @require_auth()
+    @query_budget(1)
+    def api_alerts():
+        after = request.args.get("after", "0")
+        if not after.isdigit():
+            return jsonify(error="after must be an alert id"), 422
+        with raw_connect() as conn:
+            return jsonify(recent(conn, request.user_id, int(after))), 200
+
+    @app.route("/api/alerts/stream", methods=["GET"])
+    @query_budget(1)
+    def api_alerts_stream():
+        # EventSource не умеет заголовки — access-токен можно передать ?access=
+        claims = access_claims() or decode_access(request.args.get("access", ""))
+        if not claims:
+            return jsonify(error="no_token"), 401
+        user_id = int(claims["sub"])
+        last = request.headers.get("Last-Event-ID") or request.args.get("after")
+        if last is not None and last.isdigit():
+            last_id = int(last)
+        else:
+            with raw_connect() as conn:
+                last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM alerts WHERE user_id = ?",
+                                       (user_id,)).fetchone()[0]
+        return Response(stream(user_id, last_id), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,30 +1,81 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, current_app, make_response
+from flask import Flask, render_template, request, jsonify, send_from_directory, send_file, current_app, make_response
 from flask_cors import CORS
 import sqlite3
 import os
-from datetime import datetime, timezone, timedelta
+import time
+import threading
+from cachetools import TTLCache
+from datetime import datetime, date, timezone, timedelta
+from dataclasses import asdict
 from dotenv import load_dotenv
 from sqlalchemy import select, update
+from sqlalchemy.exc import OperationalError as SAOperationalError
 from sqlalchemy.orm import joinedload
-from db import engine, SessionLocal, create_tables
+import db
+from db import engine, SessionLocal, create_tables, raw_connect
 from models import Base, User, Shift, RefreshToken
-from auth import register_user, login_user, require_auth, make_access, make_refresh, verify_refresh, set_refresh_cookie, clear_refresh_cookie
+from auth import register_user, login_user, require_auth, make_access, make_refresh, verify_refresh, set_refresh_cookie, clear_refresh_cookie, current_user_id
+from static_manifest import StaticManifest
+from compliance import today_counters, parse_ts, DAY_TZ, LEGACY_ACTIVITY
+import rollup
+import metrics
+import query_log
+from query_log import query_budget
+import profiler
+import transitions
+import alerts
+import fleet
+import availability
+import planner
+import classifier
+import feature_store
+import telemetry
+import motion
+import restareas
+import ledger
+import rebuild
+import tachograph
+from jinja2.utils import htmlsafe_json_dumps
 
 # Загружаем переменные окружения из .env (если файл есть)
 load_dotenv()
 create_tables()
 
 # ---------- БАЗА ДАННЫХ ----------
-DB_PATH = "database.db"
+DB_PATH = db.DB_PATH   # TT_DB_PATH, по умолчанию database.db
 
 # где лежит НОВЫЙ фронт
 FRONT_DIR = "triketime-spa/public/triketime-beta"
 
 app = Flask(__name__, static_folder=FRONT_DIR, template_folder=FRONT_DIR)
 
+# манифест статики фронта (строится один раз, пересобирается при изменении папки)
+front_manifest = StaticManifest(app.static_folder)
+
 app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "fallback_secret_key")
 
+# метрики Prometheus: хуки before/after + GET /metrics (выключить: TT_METRICS=0)
+metrics.init_app(app)
+# медленные SQL в лог + счётчик запросов на HTTP-запрос (TT_SLOW_QUERY_MS)
+query_log.init_app(app)
+# профайлер по запросу: заголовок X-TT-Profile: 1 от админа или выборка TT_PROFILE_SAMPLE
+profiler.init_app(app)
+# напоминания о перерывах/лимитах: колесо таймеров + /api/alerts/stream (выключить: TT_ALERTS=0)
+alerts.init_app(app)
+# индекс «кто ещё может ехать X часов» поверх статуса автопарка: GET /api/fleet/available
+# (подписывается до старта потока fleet, чтобы увидеть прогрев)
+availability.init_app(app, fleet.fleet)
+# признаки классификатора по водителям в массиве NumPy: GET /api/fleet/moving (тоже до старта fleet)
+feature_store.init_app(app, fleet.fleet)
+# статус автопарка в памяти для диспетчера: GET /api/fleet (выключить: TT_FLEET=0)
+fleet.init_app(app)
+# классификатор активности из ai-helper.js по всему автопарку: GET /api/suggestion (TT_CLASSIFIER=0)
+classifier.init_app(app, fleet.fleet, feature_store.store)
+# приём GPS-телеметрии пачками, сжатое колоночное хранение: /api/telemetry
+telemetry.init_app(app, feature_store.store)
+
 @app.post("/api/login")
+@query_budget(3)
 def api_login():
     data = request.get_json(force=True)
     # login_user возвращал токен — теперь вернём пользователя и проверим пароль тут
@@ -32,7 +83,11 @@ def api_login():
     with SessionLocal() as s:
         u = s.scalar(select(User).where(User.username == username, User.is_active == True))
         from passlib.hash import bcrypt
-        if not u or not bcrypt.verify(password, u.password_hash):
+        if not u:
+            return {"ok": False, "error": "bad_credentials"}, 401
+        with metrics.timed("tt_bcrypt_seconds"):
+            ok = bcrypt.verify(password, u.password_hash)
+        if not ok:
             return {"ok": False, "error": "bad_credentials"}, 401
 
         access = make_access(u)
@@ -43,6 +98,7 @@ def api_login():
         return resp
 
 @app.post("/api/refresh")
+@query_budget(5)
 def api_refresh():
     rt_cookie = request.cookies.get("rt")
     if not rt_cookie:
@@ -63,6 +119,7 @@ def api_refresh():
         return resp
 
 @app.post("/api/logout")
+@query_budget(2)
 def api_logout():
     rt_cookie = request.cookies.get("rt")
     with SessionLocal() as s:
@@ -89,7 +146,50 @@ CORS(
 # ассеты Vite 
 @app.route("/assets/<path:filename>")
 def assets(filename):
-    return send_from_directory(app.static_folder + "/assets", filename)
+    entry = front_manifest.lookup("assets/" + filename)
+    if entry is None:
+        return "Not Found", 404
+    return front_manifest.send(entry)
+
+# ===== серверный bootstrap: первая страница истории + текущая активность прямо в index.html =====
+SSR_BOOTSTRAP = os.getenv("TT_SSR_BOOTSTRAP", "1") == "1"
+HISTORY_PAGE = int(os.getenv("TT_HISTORY_PAGE", "50"))
+
+_index_parts = {"etag": None, "head": b"", "tail": b""}
+
+def _index_template():
+    """index.html из манифеста, разрезанный по </head> (кэшируем до смены ETag)."""
+    body, etag = front_manifest.index
+    if _index_parts["etag"] != etag:
+        head, sep, tail = body.partition(b"</head>")
+        _index_parts.update(etag=etag, head=head, tail=sep + tail)
+    return _index_parts["head"], _index_parts["tail"]
+
+def bootstrap_state():
+    """То, что SPA иначе запросила бы сразу после загрузки."""
+    with raw_connect() as conn:
+        history = [
+            {"id": r[0], "start_time": r[1], "end_time": r[2]}
+            for r in conn.execute(
+                "SELECT id, start_time, end_time FROM shifts ORDER BY id DESC LIMIT ?", (HISTORY_PAGE,)
+            )
+        ]
+        active = get_active_shift(conn)
+    return {"history": history, "current": active or {}, "counters": today_summary(None)}
+
+def render_index():
+    head, tail = _index_template()
+    if not head:
+        return "index.html not found", 404
+    try:
+        state = bootstrap_state()
+    except sqlite3.Error:
+        # БД недоступна — отдаём обычный index, SPA сходит в API сама
+        return front_manifest.send_index()
+    script = f"<script>window.__TT_BOOTSTRAP__={htmlsafe_json_dumps(state)};</script>".encode()
+    resp = make_response(head + script + tail)
+    resp.mimetype = "text/html"
+    return resp
 
 # на время разработки выключим кэш
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
@@ -103,19 +203,35 @@ def no_cache(resp):
     resp.headers['Expires'] = '0'
     return resp
 
+# ===== БД занята другим писателем =====
+@app.errorhandler(sqlite3.OperationalError)
+@app.errorhandler(SAOperationalError)
+def db_operational_error(e):
+    """«database is locked» — отдельный код, клиент (и bench/soak.py) отличает его от 500."""
+    orig = getattr(e, "orig", e)
+    if "locked" not in str(orig):
+        raise e
+    metrics.inc("tt_db_locked_total", "")
+    resp = jsonify(error="db_locked")
+    resp.headers["Retry-After"] = "1"
+    return resp, 503
+
 # ===== SPA-фолбэк =====
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
+@query_budget(5)
 def spa(path):
     # не перехватываем API
     if path.startswith('api/'):
         return "Not Found", 404
-    # сначала пытаемся отдать статический файл (css/js/png)
-    try:
-        return send_from_directory(app.static_folder, path)
-    except Exception:
-        # иначе всегда index.html
-        return send_from_directory(app.template_folder, 'index.html')
+    # сначала ищем статический файл (css/js/png) в манифесте — это просто dict
+    entry = front_manifest.lookup(path)
+    if entry is not None:
+        return front_manifest.send(entry)
+    # иначе всегда index.html (из памяти, с ETag; с bootstrap — собираем на лету)
+    if SSR_BOOTSTRAP:
+        return render_index()
+    return front_manifest.send_index()
 
 # service worker из той же папки
 @app.route('/service-worker.js')
@@ -125,9 +241,35 @@ def service_worker():
 
 
 @app.route("/api/ping", methods=["GET"])
+@query_budget(0)
 def api_ping():
     return jsonify(ok=True), 200
 
+# ===== сохранённые профили запросов (только админ) =====
+@app.route("/api/admin/profiles", methods=["GET"])
+@require_auth("admin")
+@query_budget(0)
+def api_admin_profiles():
+    limit = request.args.get("limit", 50, type=int)
+    return jsonify(profiler.list_profiles(limit)), 200
+
+@app.route("/api/admin/profiles/<name>", methods=["GET"])
+@require_auth("admin")
+@query_budget(0)
+def api_admin_profile(name):
+    path = profiler.profile_path(name)
+    if not path:
+        return jsonify(error="Profile not found"), 404
+    return send_file(path, mimetype="text/plain")
+
+# ход пересборки производных таблиц (rebuild.py)
+@app.route("/api/admin/rebuild", methods=["GET"])
+@require_auth("admin")
+@query_budget(1)
+def api_admin_rebuild():
+    with raw_connect() as conn:
+        return jsonify(rebuild.status(conn)), 200
+
 # --- helpers ---
 def _parse_dt(value):
     """Принимает ISO-строку, возвращает datetime или None.
@@ -143,6 +285,7 @@ def _parse_dt(value):
 
 # --- API: создать смену ---
 @app.route("/api/sessions", methods=["POST"])
+@query_budget(2)
 def create_session():
     data = request.get_json(silent=True) or {}
     start_dt = _parse_dt(data.get("start_time"))
@@ -154,15 +297,18 @@ def create_session():
     start_s = start_dt.isoformat(sep=" ")
     end_s   = end_dt.isoformat(sep=" ")
 
-    with sqlite3.connect(DB_PATH) as conn:
+    with raw_connect() as conn:
         c = conn.cursor()
         c.execute("INSERT INTO shifts (start_time, end_time) VALUES (?, ?)", (start_s, end_s))
         new_id = c.lastrowid
+        rollup.apply_shift(conn, None, None, start_s, end_s)
         conn.commit()
+    forget_summary(None)
 
     return jsonify(id=new_id, start_time=start_s, end_time=end_s), 201
 
 @app.route("/api/sessions/<int:session_id>", methods=["PUT"])
+@query_budget(9)
 def update_session(session_id):
     data = request.get_json(silent=True) or {}
 
@@ -189,32 +335,56 @@ def update_session(session_id):
 
     values.append(session_id)
 
-    import sqlite3
-    with sqlite3.connect(DB_PATH) as conn:
+    with raw_connect() as conn:
         c = conn.cursor()
-        c.execute(f"UPDATE shifts SET {', '.join(fields)} WHERE id = ?", values)
-        if c.rowcount == 0:
+        old = c.execute(
+            "SELECT user_id, activity, start_time, end_time FROM shifts WHERE id = ?", (session_id,)
+        ).fetchone()
+        if old is None:
             return jsonify(error="Not found"), 404
-        conn.commit()
-        c.execute("SELECT id, start_time, end_time FROM shifts WHERE id = ?", (session_id,))
+        c.execute(f"UPDATE shifts SET {', '.join(fields)} WHERE id = ?", values)
+        c.execute("SELECT id, start_time, end_time, user_id, activity FROM shifts WHERE id = ?", (session_id,))
         row = c.fetchone()
+        # дневные итоги: убираем старую версию смены, добавляем новую
+        rollup.apply_row(conn, old, -1)
+        rollup.apply_row(conn, (row[3], row[4], row[1], row[2]), +1)
+        # журнал жетонов пользователя — заново по его сменам
+        if old[0] is not None:
+            rebuild.rebuild_user(conn, old[0], targets=("ledger",))
+        conn.commit()
+    if old[0] is not None:
+        ledger._forget(old[0])
+    forget_summary(old[0])
 
     return jsonify({"id": row[0], "start_time": row[1], "end_time": row[2]}), 200
 
 # API: удалить сессию
 @app.route("/api/sessions/<int:session_id>", methods=["DELETE"])
+@query_budget(7)
 def delete_session(session_id):
-    with sqlite3.connect(DB_PATH) as conn:
+    with raw_connect() as conn:
         c = conn.cursor()
+        old = c.execute(
+            "SELECT user_id, activity, start_time, end_time FROM shifts WHERE id = ?", (session_id,)
+        ).fetchone()
         c.execute("DELETE FROM shifts WHERE id = ?", (session_id,))
+        if old is not None:
+            rollup.apply_row(conn, old, -1)
+            if old[0] is not None:
+                rebuild.rebuild_user(conn, old[0], targets=("ledger",))
         conn.commit()
+    if old is not None:
+        if old[0] is not None:
+            ledger._forget(old[0])
+        forget_summary(old[0])
 
     return jsonify(ok=True, deleted_id=session_id), 200
 
 # API: получить одну сессию
 @app.route("/api/sessions/<int:session_id>", methods=["GET"])
+@query_budget(1)
 def get_session(session_id):
-    with sqlite3.connect(DB_PATH) as conn:
+    with raw_connect() as conn:
         c = conn.cursor()
         c.execute("SELECT id, start_time, end_time FROM shifts WHERE id = ?", (session_id,))
         row = c.fetchone()
@@ -236,7 +406,7 @@ if app.debug:
     def seed_one():
         from datetime import datetime, timedelta
         now = datetime.utcnow()
-        with sqlite3.connect(DB_PATH) as conn:
+        with raw_connect() as conn:
             conn.execute(
                 "INSERT INTO shifts(start_time, end_time) VALUES(?, ?)",
                 (now.isoformat(), (now+timedelta(minutes=15)).isoformat()))
@@ -245,7 +415,7 @@ if app.debug:
 def db_rows(limit=None):
 
          """Возвращает список смен (последние сверху)."""
-         with sqlite3.connect(DB_PATH) as conn:
+         with raw_connect() as conn:
             c = conn.cursor()
             sql = "SELECT id, start_time, end_time FROM shifts ORDER BY id DESC"
             if limit:
@@ -262,14 +432,15 @@ def now_iso():
 def get_open_shift(conn):
     """Возвращает открытую смену (end_time IS NULL) или None."""
     r = conn.execute(
-        "SELECT id, start_time FROM shifts WHERE end_time IS NULL ORDER BY id DESC LIMIT 1"
+        "SELECT id, start_time, user_id, activity FROM shifts WHERE end_time IS NULL ORDER BY id DESC LIMIT 1"
     ).fetchone()
-    return {"id": r[0], "start_time": r[1]} if r else None
+    return {"id": r[0], "start_time": r[1], "user_id": r[2], "activity": r[3]} if r else None
 
 @app.route("/api/history", methods=["GET"], endpoint="api_history_get")
+@query_budget(1)
 def api_history_get():
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with raw_connect() as conn:
             rows = conn.execute(
                 "SELECT id, start_time, end_time FROM shifts ORDER BY id DESC"
             ).fetchall()
@@ -280,14 +451,20 @@ def api_history_get():
         return jsonify([]), 200
     
 @app.route("/api/clear_history", methods=["POST"])
+@query_budget(3)
 def clear_history():
 
-    with sqlite3.connect(DB_PATH) as conn:
+    with raw_connect() as conn:
         conn.execute("DELETE FROM shifts")
+        conn.execute("DELETE FROM daily_totals")
+        conn.execute("DELETE FROM token_ledger")
         conn.commit()
+    ledger._forget_all()
+    forget_summary()
     return jsonify(status="cleared"), 200
 
 @app.route("/api/download_history", methods=["GET"])
+@query_budget(1)
 def download_history():
     rows = db_rows()  # [(id, start_time, end_time), ...]
 
@@ -304,31 +481,37 @@ def download_history():
    
 
 @app.route("/api/stop_shift", methods=["POST"])
+@query_budget(3)
 def stop_shift():
 
     """Закрывает текущую открытую смену."""
     ts = now_iso()
-    with sqlite3.connect(DB_PATH) as conn:
+    with raw_connect() as conn:
         c = conn.cursor()
         open_shift = get_open_shift(conn)
         if not open_shift:
             return jsonify(error="no open shift"), 409
         c.execute("UPDATE shifts SET end_time=? WHERE id=?", (ts, open_shift["id"]))
+        rollup.apply_shift(conn, open_shift["user_id"], open_shift["activity"], open_shift["start_time"], ts)
         conn.commit()
+    forget_summary(open_shift["user_id"])
+    transitions.publish(open_shift["user_id"], None, time.time())
     return jsonify(stopped_id=open_shift["id"], end_time=ts), 200
 
 # опционально: /api/status для health-check
 @app.route("/api/status", methods=["GET"])
+@query_budget(0)
 def api_status():
     return jsonify(ok=True), 200
 
 # ---------- РОУТЫ ----------
 
 @app.route("/api/start_shift", methods=["POST"])
+@query_budget(2)
 def start_shift():
     start_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with raw_connect() as conn:
             cur = conn.cursor()
             # проверяем, нет ли незакрытой смены
             open_exists = cur.execute("SELECT 1 FROM shifts WHERE end_time IS NULL LIMIT 1").fetchone()
@@ -340,30 +523,29 @@ def start_shift():
                 (start_time, None)
             )
             conn.commit()
+        forget_summary(None)
+        transitions.publish(None, LEGACY_ACTIVITY, time.time())
         return jsonify(status="started", start_time=start_time), 200
     except Exception as e:
         return jsonify(error=str(e)), 500
 
 @app.route("/api/end_shift", methods=["POST"])
+@query_budget(3)
 def end_shift():
     end_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with raw_connect() as conn:
             cur = conn.cursor()
             # обновляем только последнюю открытую (на случай мусора)
-            cur.execute("""
-                UPDATE shifts
-                   SET end_time = ?
-                 WHERE id = (
-                        SELECT id FROM shifts
-                         WHERE end_time IS NULL
-                         ORDER BY id DESC
-                         LIMIT 1
-                 )
-            """, (end_time,))
-            if cur.rowcount == 0:
+            open_shift = get_open_shift(conn)
+            if not open_shift:
                 return jsonify(error="no open shift"), 409
+            cur.execute("UPDATE shifts SET end_time = ? WHERE id = ?", (end_time, open_shift["id"]))
+            rollup.apply_shift(conn, open_shift["user_id"], open_shift["activity"],
+                               open_shift["start_time"], end_time)
             conn.commit()
+        forget_summary(open_shift["user_id"])
+        transitions.publish(open_shift["user_id"], None, time.time())
         return jsonify(status="ended", end_time=end_time), 200
     except Exception as e:
         return jsonify(error=str(e)), 500
@@ -373,9 +555,11 @@ VALID_ACTIVITIES = {"drive", "rest", "other"}
 def now_iso():
     return datetime.now(timezone.utc).isoformat()
 
-def get_active_shift(conn):
+def get_active_shift(conn, user_id=None):
+    """Открытая активность пользователя (user_id=None — анонимная/общая лента)."""
     row = conn.execute(
-        "SELECT id, start_time, activity FROM shifts WHERE end_time IS NULL ORDER BY id DESC LIMIT 1"
+        "SELECT id, start_time, activity FROM shifts WHERE user_id IS ? AND end_time IS NULL ORDER BY id DESC LIMIT 1",
+        (user_id,)
     ).fetchone()
     if not row:
         return None
@@ -383,48 +567,229 @@ def get_active_shift(conn):
 
 
 @app.route("/api/activity/current", methods=["GET"])
+@query_budget(1)
 def api_activity_current():
-    with sqlite3.connect(DB_PATH) as conn:
-        active = get_active_shift(conn)
+    with raw_connect() as conn:
+        active = get_active_shift(conn, current_user_id())
     return jsonify(active or {}), 200
 
 
-@app.route("/api/activity/start", methods=["POST"])
-def api_activity_start():
-    payload = request.get_json(silent=True) or {}
-    activity = (payload.get("activity") or "").strip().lower()
-    if activity not in VALID_ACTIVITIES:
-        return jsonify(error="invalid activity", allowed=list(VALID_ACTIVITIES)), 400
-
-    ts = now_iso()
-    with sqlite3.connect(DB_PATH) as conn:
+def start_activity(user_id, activity, at=None, keep_same=False):
+    """
+    Закрыть открытую активность и начать новую — общий путь для кнопок и
+    автоопределения (motion.py). at — unix-время начала (не раньше начала
+    открытой; по умолчанию сейчас). keep_same — если уже идёт та же
+    активность, ничего не менять (возвращает None).
+    """
+    with raw_connect() as conn:
         c = conn.cursor()
-        active = get_active_shift(conn)
+        active = get_active_shift(conn, user_id)
+        if active and keep_same and active["activity"] == activity:
+            return None
+        if at is None:
+            ts = now_iso()
+        else:
+            start = parse_ts(active["start_time"]) if active else None
+            ts = datetime.fromtimestamp(max(at, start or at), timezone.utc).isoformat()
         if active:
             c.execute("UPDATE shifts SET end_time=? WHERE id=?", (ts, active["id"]))
+            rollup.apply_shift(conn, user_id, active["activity"], active["start_time"], ts)
+            ledger.on_close(conn, user_id, active["activity"], active["start_time"], ts)
+        ledger.on_start(conn, user_id, activity, ts)
         c.execute(
-            "INSERT INTO shifts(start_time, end_time, activity) VALUES(?, NULL, ?)",
-            (ts, activity)
+            "INSERT INTO shifts(user_id, start_time, end_time, activity) VALUES(?, ?, NULL, ?)",
+            (user_id, ts, activity)
         )
         conn.commit()
         new_id = c.lastrowid
+    forget_summary(user_id)
+    transitions.publish(user_id, activity, time.time())
+    return {"id": new_id, "start_time": ts, "activity": activity}
+
 
-    return jsonify(id=new_id, start_time=ts, activity=activity), 201
+@app.route("/api/activity/start", methods=["POST"])
+@query_budget(8)
+def api_activity_start():
+    payload = request.get_json(silent=True) or {}
+    activity = (payload.get("activity") or "").strip().lower()
+    if activity not in VALID_ACTIVITIES:
+        return jsonify(error="invalid activity", allowed=list(VALID_ACTIVITIES)), 400
+    return jsonify(start_activity(current_user_id(), activity)), 201
 
 
 @app.route("/api/activity/stop", methods=["POST"])
+@query_budget(5)
 def api_activity_stop():
     ts = now_iso()
-    with sqlite3.connect(DB_PATH) as conn:
+    user_id = current_user_id()
+    with raw_connect() as conn:
         c = conn.cursor()
-        active = get_active_shift(conn)
+        active = get_active_shift(conn, user_id)
         if not active:
             return jsonify(error="no active shift"), 409
         c.execute("UPDATE shifts SET end_time=? WHERE id=?", (ts, active["id"]))
+        rollup.apply_shift(conn, user_id, active["activity"], active["start_time"], ts)
+        ledger.on_close(conn, user_id, active["activity"], active["start_time"], ts)
         conn.commit()
+    forget_summary(user_id)
+    transitions.publish(user_id, None, time.time())
     return jsonify(stopped_id=active["id"], end_time=ts), 200
 
 
+# автоопределение езды/стоянки по телеметрии: переключает через start_activity (TT_MOTION=suggest|auto|off)
+motion.init_app(app, fleet.fleet, start_activity)
+# ближайшие досягаемые стоянки из локального набора (TT_REST_AREAS): GET /api/rest-areas/nearest
+restareas.init_app(app, fleet.fleet)
+
+
+# ===== сводки из дневных итогов (daily_totals) =====
+# счётчики «сегодня» на пользователя; запись смены сбрасывает запись кэша,
+# TTL ограничивает расхождение между воркерами gunicorn
+SUMMARY_TTL = float(os.getenv("TT_SUMMARY_TTL_SEC", "5"))
+_summary_cache = TTLCache(maxsize=int(os.getenv("TT_SUMMARY_CACHE_SIZE", "10000")), ttl=SUMMARY_TTL)
+_summary_lock = threading.Lock()
+
+def forget_summary(*user_ids):
+    """Сбросить кэш «сегодня» для пользователей (без аргументов — для всех)."""
+    with _summary_lock:
+        if not user_ids:
+            _summary_cache.clear()
+        for uid in user_ids:
+            _summary_cache.pop(uid, None)
+
+def today_summary(user_id):
+    with _summary_lock:
+        cached = _summary_cache.get(user_id)
+    if cached is not None:
+        return cached
+    now_ts = time.time()
+    with raw_connect() as conn:
+        summary = {**today_counters(conn, now_ts, user_id), "as_of": int(now_ts * 1000)}
+    with _summary_lock:
+        _summary_cache[user_id] = summary
+    return summary
+
+
+@app.route("/api/summary/today", methods=["GET"])
+@query_budget(3)
+def api_summary_today():
+    """
+    Езда сегодня / «молотки» / работа всего / непрерывная езда и время до
+    обязательного перерыва (секунды). as_of — момент расчёта (мс), клиент
+    досчитывает идущую activity сам.
+    """
+    return jsonify(today_summary(current_user_id())), 200
+
+def _day_arg(name, default):
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+@app.route("/api/summary/daily", methods=["GET"])
+@query_budget(2)
+def api_summary_daily():
+    """По дням за [from, to] (по умолчанию — последние 7 дней), с учётом идущей активности."""
+    today = datetime.now(DAY_TZ).date()
+    day_to = _day_arg("to", today)
+    day_from = _day_arg("from", (day_to or today) - timedelta(days=6))
+    if day_from is None or day_to is None:
+        return jsonify(error="Invalid date. Use 'YYYY-MM-DD'."), 422
+    if (day_to - day_from).days > 366:
+        return jsonify(error="Range too large (max 366 days)"), 422
+
+    user_id = current_user_id()
+    with raw_connect() as conn:
+        days = rollup.read_days(conn, user_id, day_from.isoformat(), day_to.isoformat())
+        active = get_active_shift(conn, user_id)
+    rollup.add_open_shift(days, active, time.time(), day_from.isoformat(), day_to.isoformat())
+    return jsonify([{"day": d, **v} for d, v in sorted(days.items())]), 200
+
+
+@app.route("/api/summary/week", methods=["GET"])
+@query_budget(2)
+def api_summary_week():
+    """Итоги недели (пн–вс), в которую попадает ?day= (по умолчанию сегодня)."""
+    day = _day_arg("day", datetime.now(DAY_TZ).date())
+    if day is None:
+        return jsonify(error="Invalid date. Use 'YYYY-MM-DD'."), 422
+    week_from, week_to = rollup.week_bounds(day)
+
+    user_id = current_user_id()
+    with raw_connect() as conn:
+        days = rollup.read_days(conn, user_id, week_from, week_to)
+        active = get_active_shift(conn, user_id)
+    rollup.add_open_shift(days, active, time.time(), week_from, week_to)
+    totals = {"segments": 0}
+    for v in days.values():
+        for k, sec in v.items():
+            totals[k] = totals.get(k, 0) + sec
+    return jsonify(week_from=week_from, week_to=week_to, totals=totals), 200
+
+
+# ===== журнал жетонов продления и сокращённых отдыхов =====
+@app.route("/api/ledger", methods=["GET"])
+@require_auth()
+@query_budget(3)
+def api_ledger():
+    """Остатки drive10/rest9 на текущей неделе и невозвращённые недостачи недельного отдыха."""
+    with raw_connect() as conn:
+        return jsonify(ledger.summary(conn, current_user_id())), 200
+
+
+# импорт выгрузок тахографа (.DDD) в shifts без дублей: POST /api/import/ddd
+tachograph.init_app(app, forget_summary)
+
+
+# ===== планировщик перерывов на маршруте =====
+def _iso_at(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+@app.route("/api/plan/breaks", methods=["POST"])
+@query_budget(7)
+def api_plan_breaks():
+    """
+    {"route": [...]} или {"routes": [[...], ...]} — точки {name, drive_s, dwell_s};
+    depart_at (ISO, по умолчанию сейчас); state — поля DriverState поверх
+    состояния водителя из его смен.
+    """
+    data = request.get_json(silent=True) or {}
+    routes = data.get("routes") if "routes" in data else [data.get("route")]
+    if not isinstance(routes, list) or not 1 <= len(routes) <= planner.MAX_ROUTES:
+        return jsonify(error=f"routes must be a list of 1..{planner.MAX_ROUTES} routes"), 422
+    try:
+        routes = [planner.parse_stops(r) for r in routes]
+        overrides = planner.parse_state(data.get("state"))
+    except ValueError as e:
+        return jsonify(error=str(e)), 422
+    depart = time.time()
+    if data.get("depart_at"):
+        dt = _parse_dt(data["depart_at"])
+        if dt is None:
+            return jsonify(error="Invalid depart_at. Use ISO 8601."), 422
+        depart = (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+    with raw_connect() as conn:
+        state = planner.state_from_db(conn, current_user_id(), time.time(), **overrides)
+
+    results = []
+    for stops in routes:
+        plan = planner.plan_breaks(stops, state)
+        if plan is None:
+            results.append({"feasible": False})
+            continue
+        for s in plan["stops"]:
+            s["at"] = _iso_at(depart + s["start_s"])
+        results.append({"feasible": True, "arrival_at": _iso_at(depart + plan["arrival_s"]), **plan})
+    if "routes" in data:
+        return jsonify(state=asdict(state), results=results), 200
+    return jsonify(state=asdict(state), result=results[0]), 200
+
+
     
 # ---------------------------
 if __name__ == "__main__":
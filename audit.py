@@ -0,0 +1,321 @@
+# audit.py
+# Проверка режима труда и отдыха по всему автопарку за закрытые недели —
+# то, что core.js computeContinuousDrive() делает циклом по событиям одного
+# водителя, здесь считается сразу по массивам NumPy для всех водителей.
+#
+# Смены грузятся колонками (водитель, начало, конец, код активности); времена
+# каждого водителя сдвигаются на rank * SPAN, так что весь набор — одна
+# возрастающая шкала и searchsorted/cumsum/maximum.accumulate работают без
+# цикла по водителям. Езда за любой интервал — разность кумулятивной езды
+# F(t) на его концах; паузы (отдых и промежутки без записей) — разрывы между
+# отрезками работы.
+#
+# Нарушения (правила — упрощённые ЕС 561, константы из compliance.py):
+#   continuous_drive — больше 4ч30м езды без перерыва 45 (или 15+30) мин;
+#   daily_drive      — больше 10ч езды за рабочий период (между отдыхами
+#                      от 9ч, как ledger.py; через полночь — целиком);
+#   extensions       — больше двух периодов с ездой сверх 9ч за неделю
+#                      (по неделе начала периода);
+#   weekly_drive     — больше 56ч за неделю (пн–вс);
+#   biweekly_drive   — больше 90ч за две недели подряд;
+#   daily_rest       — отдых от 9ч не начат через 13ч после начала смены;
+#   reduced_rests    — больше трёх отдыхов 9–11ч между недельными;
+#   weekly_rest      — между отдыхами от 24ч больше шести суток.
+# Разделённый ежедневный отдых (3+9) не учитывается. Чтобы не терять
+# нарушения на стыке, данные грузятся с запасом в неделю до начала проверки.
+#
+#   python audit.py [--db database.db] [--to 2026-10-19] [--weeks 4] [--workers 8] [--out report.json]
+
+from __future__ import annotations
+
+import os, sys, json, time, sqlite3, argparse, multiprocessing
+from datetime import date, datetime, timedelta, timezone, time as dtime
+
+import numpy as np
+
+import rollup
+from compliance import (DAY_TZ, CONT_DRIVE_LIMIT_S, BREAK_FULL_S, BREAK_SPLIT_1_S, BREAK_SPLIT_2_S,
+                        DAILY_DRIVE_S, DAILY_DRIVE_EXT_S, WEEKLY_DRIVE_S, DAILY_REST_MIN_S, DUTY_SPAN_S)
+from ledger import DAILY_REST_S, WEEKLY_REST_MIN_S, DRIVE10_PER_WEEK, REST9_PER_WEEK
+
+ACT_DRIVE, ACT_REST, ACT_OTHER = 0, 1, 2
+BIWEEKLY_DRIVE_S   = 90 * 3600
+WEEKLY_REST_SPAN_S = 6 * 24 * 3600
+DAY_S              = 24 * 3600
+
+# julianday понимает те же ISO-форматы, что parse_ts (пробел или T, смещение,
+# доли секунды); наивное время — UTC. Открытая смена заканчивается в ?.
+_LOAD = """
+    SELECT user_id,
+           CASE activity WHEN 'rest' THEN 1 WHEN 'other' THEN 2 ELSE 0 END,
+           (julianday(start_time) - 2440587.5) * 86400.0,
+           (COALESCE(julianday(end_time), ?) - 2440587.5) * 86400.0
+    FROM shifts
+    WHERE user_id BETWEEN ? AND ? AND start_time >= ? AND start_time < ?
+"""
+
+
+def _midnight(d: date) -> float:
+    return datetime.combine(d, dtime(), DAY_TZ).timestamp()
+
+
+def _cumcount(groups: np.ndarray) -> np.ndarray:
+    """Порядковый номер (с 1) элемента внутри своей группы; groups не убывают."""
+    if not len(groups):
+        return groups
+    starts = np.r_[0, np.flatnonzero(np.diff(groups)) + 1]
+    return np.arange(len(groups)) - np.repeat(starts, np.diff(np.r_[starts, len(groups)])) + 1
+
+
+def _split_resets(lens: np.ndarray, group: np.ndarray) -> np.ndarray:
+    """
+    Какие паузы 30–45 мин завершают разделённый перерыв 15+30. Внутри группы
+    (между полными перерывами) паузы от 15 мин — S (15–30) и L (30–45); L
+    обнуляет счётчик, если до неё в группе была пауза от 15 мин, не обнулившая
+    его сама. В серии L подряд это чередование: после S — 1-я, 3-я, ...; в
+    начале группы — 2-я, 4-я, ...
+    """
+    out = np.zeros(len(lens), dtype=bool)
+    tok = np.flatnonzero(lens >= BREAK_SPLIT_1_S)
+    if not len(tok):
+        return out
+    is_l = lens[tok] >= BREAK_SPLIT_2_S
+    g = group[tok]
+    new_run = np.r_[True, (is_l[1:] != is_l[:-1]) | (g[1:] != g[:-1])]
+    run_id = np.cumsum(new_run)
+    pos = _cumcount(run_id)
+    run_first = np.flatnonzero(new_run)
+    after_s = np.zeros(len(run_first), dtype=bool)
+    after_s[1:] = g[run_first[1:]] == g[run_first[1:] - 1]   # перед серией в группе есть S
+    after_s = after_s[run_id - 1]
+    out[tok] = is_l & ((pos + after_s) % 2 == 0)
+    return out
+
+
+def audit_arrays(uid, act, start, end, lo: float, t0: float, t1: float, day_edges) -> list[tuple]:
+    """
+    Нарушения по колонкам смен (unix-время). Окно загрузки [lo, t1), в отчёт
+    идёт только [t0, t1). day_edges — полуночи DAY_TZ от lo до t1 включительно,
+    lo — полночь понедельника, число суток кратно 7.
+    -> [(user_id, kind, at_ts, value_s, limit_s), ...]
+    """
+    uid = np.asarray(uid, dtype=np.int64)
+    act = np.asarray(act, dtype=np.int8)
+    start = np.asarray(start, dtype=np.float64)
+    end = np.asarray(end, dtype=np.float64)
+    start, end = np.maximum(start, lo), np.minimum(end, t1)
+    ok = np.isfinite(start) & np.isfinite(end) & (end > start)
+    uid, act, start, end = uid[ok], act[ok], start[ok], end[ok]
+    if not len(uid):
+        return []
+    order = np.lexsort((start, uid))
+    uid, act, start, end = uid[order], act[order], start[order], end[order]
+    users, rank = np.unique(uid, return_inverse=True)
+    n = len(users)
+
+    # одна шкала на всех: водитель r живёт в [r * SPAN, r * SPAN + (t1 - lo)]
+    span = (t1 - lo) + 7 * DAY_S
+    base = np.arange(n) * span
+    s = start - lo + base[rank]
+    e = end - lo + base[rank]
+    horizon = t1 - lo
+
+    # кумулятивная езда F(t)
+    drv = act == ACT_DRIVE
+    ds, dd = s[drv], e[drv] - s[drv]
+    cum = np.r_[0.0, np.cumsum(dd)]
+
+    def drive_until(t):
+        k = np.searchsorted(ds, t, side="right")
+        prev = np.maximum(k - 1, 0)
+        part = np.where(k > 0, np.clip(t - ds[prev], 0, dd[prev]) if len(ds) else 0, 0)
+        return cum[prev] + part
+
+    found = []      # (rank, kind, at_rel, value, limit)
+
+    def report(mask, ranks, kind, at, value, limit):
+        idx = np.flatnonzero(mask)
+        found.append((ranks[idx], kind, at[idx], value[idx], limit))
+
+    # --- недельная езда ---
+    edges = np.asarray(day_edges, dtype=np.float64) - lo
+    n_days = len(edges) - 1
+    grid = drive_until(edges[None, :] + base[:, None])
+    daily = np.diff(grid, axis=1)                                   # (n, дни)
+    weekly = daily.reshape(n, n_days // 7, 7).sum(axis=2)           # (n, недели)
+    n_weeks = weekly.shape[1]
+    ranks_w = np.repeat(np.arange(n), n_weeks)
+    at_w = (edges[None, :-1:7] + base[:, None]).ravel()
+    ext = np.zeros((n, n_weeks), dtype=np.int64)                     # продления — по периодам ниже
+    report(weekly.ravel() > WEEKLY_DRIVE_S, ranks_w, "weekly_drive", at_w, weekly.ravel(), WEEKLY_DRIVE_S)
+    pair = np.zeros_like(weekly)
+    pair[:, 1:] = weekly[:, 1:] + weekly[:, :-1]
+    report(pair.ravel() > BIWEEKLY_DRIVE_S, ranks_w, "biweekly_drive", at_w, pair.ravel(), BIWEEKLY_DRIVE_S)
+
+    # --- паузы: разрывы между отрезками работы (езда + «молотки») ---
+    work = act != ACT_REST
+    ws, we, wr = s[work], e[work], rank[work]
+    if len(ws):
+        reach = np.maximum.accumulate(we)                           # конец работы «до сих пор»
+        lead = np.r_[True, wr[1:] != wr[:-1]]
+        last = np.r_[wr[1:] != wr[:-1], True]
+        g_start = np.where(lead, ws, np.r_[0.0, reach[:-1]])
+        g_end = ws.copy()
+        # после последней работы водителя — хвост до конца окна
+        tail_at = np.flatnonzero(last) + 1
+        g_start = np.insert(g_start, tail_at, reach[last])
+        g_end = np.insert(g_end, tail_at, base[wr[last]] + horizon)
+        g_rank = np.insert(wr, tail_at, wr[last])
+        g_lead = np.insert(lead, tail_at, False)
+        g_tail = np.zeros(len(g_start), dtype=bool)
+        g_tail[tail_at + np.arange(len(tail_at))] = True
+        g_len = np.where(g_lead, np.inf, np.maximum(g_end - g_start, 0))
+        edge = g_lead | g_tail
+
+        # непрерывная езда между перерывами
+        full = edge | (g_len >= BREAK_FULL_S)
+        reset = full | _split_resets(np.where(full, 0, g_len), np.cumsum(full))
+        r = np.flatnonzero(reset)
+        same = g_rank[r[1:]] == g_rank[r[:-1]]
+        a, b = r[:-1][same], r[1:][same]
+        cont = drive_until(g_start[b]) - drive_until(g_end[a])
+        report(cont > CONT_DRIVE_LIMIT_S, g_rank[a], "continuous_drive", g_end[a], cont, CONT_DRIVE_LIMIT_S)
+
+        # смена: от конца отдыха 9ч+ до начала следующего
+        r = np.flatnonzero(edge | (g_len >= DAILY_REST_MIN_S))
+        same = g_rank[r[1:]] == g_rank[r[:-1]]
+        a, b = r[:-1][same], r[1:][same]
+        duty = g_start[b] - g_end[a]
+        report(duty > DUTY_SPAN_S, g_rank[a], "daily_rest", g_end[a], duty, DUTY_SPAN_S)
+
+        # езда за период и продления сверх 9ч — по неделе начала периода
+        # секунды целые, как в ledger.py: julianday даёт хвосты в доли мс
+        duty_drive = np.round(drive_until(g_start[b]) - drive_until(g_end[a]))
+        report(duty_drive > DAILY_DRIVE_EXT_S, g_rank[a], "daily_drive", g_end[a], duty_drive, DAILY_DRIVE_EXT_S)
+        extended = duty_drive > DAILY_DRIVE_S
+        week = np.clip(np.searchsorted(edges[::7], g_end[a][extended] - base[g_rank[a][extended]],
+                                       side="right") - 1, 0, n_weeks - 1)
+        np.add.at(ext, (g_rank[a][extended], week), 1)
+
+        # между недельными отдыхами: не больше шести суток и трёх сокращённых отдыхов
+        weekly_rest = edge | (g_len >= WEEKLY_REST_MIN_S)
+        r = np.flatnonzero(weekly_rest)
+        same = g_rank[r[1:]] == g_rank[r[:-1]]
+        a, b = r[:-1][same], r[1:][same]
+        stretch = g_start[b] - g_end[a]
+        report(stretch > WEEKLY_REST_SPAN_S, g_rank[a], "weekly_rest", g_end[a], stretch, WEEKLY_REST_SPAN_S)
+        reduced = np.flatnonzero(~edge & (g_len >= DAILY_REST_MIN_S) & (g_len < DAILY_REST_S))
+        nth = _cumcount(np.cumsum(weekly_rest)[reduced])
+        report(nth > REST9_PER_WEEK, g_rank[reduced], "reduced_rests", g_start[reduced], nth, REST9_PER_WEEK)
+
+    ext = ext.ravel()
+    report(ext > DRIVE10_PER_WEEK, ranks_w, "extensions", at_w, ext, DRIVE10_PER_WEEK)
+
+    out = []
+    for ranks, kind, at, value, limit in found:
+        at_abs = at - base[ranks] + lo
+        keep = (at_abs >= t0) & (at_abs < t1)
+        for u, ts, v in zip(users[ranks[keep]].tolist(), at_abs[keep].tolist(), value[keep].tolist()):
+            out.append((u, kind, ts, int(round(v)), limit))
+    out.sort()
+    return out
+
+
+def period(to_day: date, weeks: int) -> tuple[float, float, float, list[float]]:
+    """(lo, t0, t1, полуночи) для недель, закончившихся к понедельнику to_day, с неделей запаса."""
+    monday = to_day - timedelta(days=to_day.weekday())
+    first = monday - timedelta(weeks=weeks + 1)
+    edges = [_midnight(first + timedelta(days=i)) for i in range((weeks + 1) * 7 + 1)]
+    return edges[0], edges[7], edges[-1], edges
+
+
+# ---------- по процессам ----------
+def _audit_range(job) -> tuple[int, list[tuple]]:
+    db_path, lo_id, hi_id, lo, t0, t1, edges, now_ts = job
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        # строковый префильтр по индексу (user_id, start_time) — с запасом в сутки
+        since = (datetime.fromtimestamp(lo, timezone.utc) - timedelta(days=1)).date().isoformat()
+        until = (datetime.fromtimestamp(t1, timezone.utc) + timedelta(days=1)).date().isoformat()
+        rows = conn.execute(_LOAD, (min(now_ts, t1) / 86400.0 + 2440587.5, lo_id, hi_id, since, until)).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return 0, []
+    cols = np.array(rows, dtype=np.float64)
+    uid = cols[:, 0].astype(np.int64)
+    return len(np.unique(uid)), audit_arrays(uid, cols[:, 1], cols[:, 2], cols[:, 3], lo, t0, t1, edges)
+
+
+def run(db_path: str, to_day: date, weeks: int = 4, workers: int | None = None,
+        now_ts: float | None = None) -> dict:
+    """Отчёт по всем водителям: {"from", "to", "drivers", "counts", "drivers_with_infringements", "report"}."""
+    workers = workers or os.cpu_count() or 1
+    lo, t0, t1, edges = period(to_day, weeks)
+    now_ts = now_ts if now_ts is not None else time.time()
+    conn = sqlite3.connect(db_path)
+    try:
+        jobs = [(db_path, a, b, lo, t0, t1, edges, now_ts) for a, b in rollup.user_ranges(conn, workers * 4)]
+        drivers, found = 0, []
+        with multiprocessing.Pool(workers) as pool:
+            for n, rows in pool.imap_unordered(_audit_range, jobs):
+                drivers += n
+                found += rows
+        ids = sorted({r[0] for r in found})
+        names = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            names.update(conn.execute(
+                f"SELECT id, username FROM users WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+    finally:
+        conn.close()
+
+    report, counts = {}, {}
+    for user_id, kind, at, value, limit in sorted(found):
+        entry = report.setdefault(user_id, {"user_id": user_id, "username": names.get(user_id),
+                                            "counts": {}, "infringements": []})
+        entry["counts"][kind] = entry["counts"].get(kind, 0) + 1
+        counts[kind] = counts.get(kind, 0) + 1
+        entry["infringements"].append({
+            "kind": kind, "at": datetime.fromtimestamp(at, DAY_TZ).isoformat(),
+            "value_s": value, "limit_s": limit,
+        })
+    return {
+        "from": datetime.fromtimestamp(t0, DAY_TZ).date().isoformat(),
+        "to": (datetime.fromtimestamp(t1, DAY_TZ).date() - timedelta(days=1)).isoformat(),
+        "drivers": drivers,
+        "drivers_with_infringements": len(report),
+        "counts": counts,
+        "report": list(report.values()),
+    }
+
+
+def main(argv=None):
+    from db import DB_PATH
+
+    ap = argparse.ArgumentParser(description="Проверка режима труда и отдыха по автопарку")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--to", default=None, help="понедельник после последней проверяемой недели (по умолчанию — текущей)")
+    ap.add_argument("--weeks", type=int, default=4)
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--out", default="-", help="файл JSON-отчёта ('-' — stdout)")
+    args = ap.parse_args(argv)
+
+    to_day = date.fromisoformat(args.to) if args.to else datetime.now(DAY_TZ).date()
+    t = time.perf_counter()
+    result = run(args.db, to_day, args.weeks, args.workers)
+    took = time.perf_counter() - t
+    if args.out == "-":
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=1)
+        print()
+    else:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+    print(f"{args.db}: {result['from']}..{result['to']}, {result['drivers']} drivers, "
+          f"{result['drivers_with_infringements']} with infringements in {took:.1f}s "
+          f"({result['drivers'] / took:,.0f} drivers/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -90,7 +90,11 @@ def verify_refresh(token: str, s: SessionLocal) -> dict | None:
         )
         if not row or row.revoked:
             return None
-        if row.expires_at <= _utcnow():
+        expires_at = row.expires_at
+        if expires_at.tzinfo is None:
+            # SQLite не хранит зону — значения пишутся в UTC
+            expires_at = expires_at.replace(tzinfo=dt.timezone.utc)
+        if expires_at <= _utcnow():
             return None
         return payload
     except jwt.PyJWTError:
@@ -157,6 +161,31 @@ def clear_refresh_cookie(resp) -> None:
     resp.delete_cookie("rt", path="/")
 
 # ---------- декоратор доступа ----------
+def decode_access(token: str) -> dict | None:
+    """Payload access-JWT или None, если токен битый, просрочен или не access."""
+    try:
+        payload = jwt.decode(token, SECRET, algorithms=["HS256"])
+    except jwt.PyJWTError:
+        return None
+    if payload.get("typ") != "access":
+        return None
+    return payload
+
+def access_claims() -> dict | None:
+    """
+    Payload access-JWT из заголовка Authorization или None (без ответов с ошибкой) —
+    для хуков, которым роль нужна «по возможности».
+    """
+    hdr = request.headers.get("Authorization", "")
+    if not hdr.startswith("Bearer "):
+        return None
+    return decode_access(hdr[7:])
+
+def current_user_id() -> int | None:
+    """id пользователя из access-JWT, если он передан; анонимные запросы — None."""
+    claims = access_claims()
+    return int(claims["sub"]) if claims else None
+
 def require_auth(*roles: str):
     """
     Декоратор: проверяет Authorization: Bearer <accessJWT>.
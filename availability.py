@@ -0,0 +1,164 @@
+# availability.py
+# «Кто ещё может легально проехать X часов сегодня (и чей отдых не раньше T)».
+# Индекс поверх записей fleet.py, обновляется из того же потока на каждом
+# переходе активности.
+#
+# Остаток езды = min(дневной, недельный). У стоящих водителей он не меняется
+# со временем — храним его как ключ в отсортированном списке idle. У едущих
+# он тает — но момент, когда он кончится (as_of + остаток), постоянен; его и
+# храним в списке driving. Запрос «остаток ≥ X на момент now» — два bisect:
+# idle с ключа X, driving с ключа now + X. Остальные фильтры (отдых, перерыв)
+# применяются уже к кандидатам.
+
+from __future__ import annotations
+
+import os, time, threading
+from bisect import bisect_left, insort
+from heapq import merge
+from datetime import datetime, time as dtime
+
+from flask import request, jsonify
+
+import rollup
+from auth import require_auth
+from compliance import parse_ts, DAY_TZ, DAILY_DRIVE_S, WEEKLY_DRIVE_S, DUTY_SPAN_S, CONT_DRIVE_LIMIT_S
+from query_log import query_budget
+
+ENABLED   = os.getenv("TT_AVAILABILITY", "1") != "0"
+MAX_LIMIT = 1000
+
+
+def _day_bounds(now_ts: float) -> tuple[str, str, float]:
+    """(сегодня, воскресенье этой недели, полночь сегодня) в DAY_TZ."""
+    today = datetime.fromtimestamp(now_ts, DAY_TZ).date()
+    midnight = datetime.combine(today, dtime(), DAY_TZ).timestamp()
+    return today.isoformat(), rollup.week_bounds(today)[1], midnight
+
+
+class AvailabilityIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle: list[tuple[float, int]] = []      # (остаток, user_id)
+        self._driving: list[tuple[float, int]] = []   # (когда кончится остаток, user_id)
+        self._keys: dict[int, tuple[bool, float]] = {}
+        self._records: dict[int, object] = {}
+        self.day = None
+        self._week_end = self._midnight = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _key(self, rec) -> tuple[bool, float]:
+        """(едет ли, ключ) для записи fleet.DriverStatus относительно self.day."""
+        day = datetime.fromtimestamp(rec.as_of, DAY_TZ).date()
+        same_day = day.isoformat() == self.day
+        same_week = rollup.week_bounds(day)[1] == self._week_end
+        daily_left = DAILY_DRIVE_S - (rec.drive_today if same_day else 0)
+        week_left = WEEKLY_DRIVE_S - (rec.drive_week if same_week else 0)
+        if rec.activity == "drive":
+            # с полуночи дневной счётчик начат заново
+            base = rec.as_of if same_day else max(rec.as_of, self._midnight)
+            return True, min(base + max(0, daily_left), rec.as_of + max(0, week_left))
+        return False, max(0, min(daily_left, week_left))
+
+    def _remove(self, user_id: int) -> None:
+        old = self._keys.pop(user_id, None)
+        if old is None:
+            return
+        driving, key = old
+        lst = self._driving if driving else self._idle
+        i = bisect_left(lst, (key, user_id))
+        if i < len(lst) and lst[i] == (key, user_id):
+            del lst[i]
+
+    def update(self, rec) -> None:
+        with self._lock:
+            if self.day is None:
+                self.day, self._week_end, self._midnight = _day_bounds(rec.as_of)
+            self._remove(rec.user_id)
+            driving, key = self._key(rec)
+            insort(self._driving if driving else self._idle, (key, rec.user_id))
+            self._keys[rec.user_id] = (driving, key)
+            self._records[rec.user_id] = rec
+
+    def _rollover(self, now_ts: float) -> None:
+        """Новые сутки: дневные остатки обнуляются — пересобрать ключи."""
+        self.day, self._week_end, self._midnight = _day_bounds(now_ts)
+        idle, driving = [], []
+        for user_id, rec in self._records.items():
+            is_driving, key = self._key(rec)
+            (driving if is_driving else idle).append((key, user_id))
+            self._keys[user_id] = (is_driving, key)
+        idle.sort()
+        driving.sort()
+        self._idle, self._driving = idle, driving
+
+    def candidates(self, min_left: float, now_ts: float):
+        """
+        Число и ленивый поток (остаток на now_ts, запись) с остатком >= min_left,
+        по убыванию остатка.
+        """
+        with self._lock:
+            if _day_bounds(now_ts)[0] != self.day and self._records:
+                self._rollover(now_ts)
+            recs = self._records
+            idle = self._idle[bisect_left(self._idle, (min_left,)):]
+            driving = self._driving[bisect_left(self._driving, (now_ts + min_left,)):]
+        return len(idle) + len(driving), merge(
+            ((key, recs[uid]) for key, uid in reversed(idle)),
+            ((key - now_ts, recs[uid]) for key, uid in reversed(driving)),
+            key=lambda p: -p[0])
+
+    def query(self, min_left: float = 0, now_ts: float | None = None, rest_after: float | None = None,
+              min_break: float | None = None, limit: int = 100) -> dict:
+        now_ts = now_ts if now_ts is not None else time.time()
+        today = _day_bounds(now_ts)[0]
+        max_cont = CONT_DRIVE_LIMIT_S - min_break if min_break is not None else None
+        matched, stream = self.candidates(min_left, now_ts)
+        items, more = [], False
+        for left, rec in stream:
+            if rest_after is not None:
+                # без начатого рабочего периода отдых понадобится не раньше now + 13ч
+                rest_due = rec.rest_due if rec.rest_due is not None else now_ts + DUTY_SPAN_S
+                if rest_due < rest_after:
+                    continue
+            if max_cont is not None and rec.continuous_at(now_ts) > max_cont:
+                continue
+            if len(items) == limit:
+                more = True
+                break
+            items.append({**rec.view(now_ts, today), "available": int(left)})
+        # matched — сколько водителей проходит по остатку езды (до фильтров отдыха/перерыва)
+        return {"matched": matched, "more": more, "items": items}
+
+
+index = AvailabilityIndex()
+
+
+def init_app(app, fleet_status) -> None:
+    if not ENABLED:
+        return
+    fleet_status.on_update(index.update)
+
+    @app.route("/api/fleet/available", methods=["GET"])
+    @require_auth("admin", "dispatcher")
+    @query_budget(0)
+    def api_fleet_available():
+        """?min_drive=сек &rest_after=ISO &min_break=сек &limit= — по убыванию остатка езды."""
+        try:
+            min_drive = int(request.args.get("min_drive", "0"))
+            min_break = request.args.get("min_break")
+            min_break = int(min_break) if min_break else None
+            limit = int(request.args.get("limit", "100"))
+        except ValueError:
+            return jsonify(error="min_drive, min_break and limit must be integers (seconds)"), 422
+        if min_drive < 0 or not 1 <= limit <= MAX_LIMIT:
+            return jsonify(error=f"min_drive must be >= 0 and limit in 1..{MAX_LIMIT}"), 422
+        rest_after = None
+        if request.args.get("rest_after"):
+            rest_after = parse_ts(request.args["rest_after"])
+            if rest_after is None:
+                return jsonify(error="Invalid rest_after. Use ISO 8601."), 422
+        if not fleet_status.ready.is_set():
+            return jsonify(error="fleet status is warming up"), 503
+        return jsonify(index.query(min_drive, rest_after=rest_after, min_break=min_break, limit=limit)), 200
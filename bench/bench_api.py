@@ -0,0 +1,292 @@
+# bench/bench_api.py
+# Бенчмарки /api на настоящем приложении: через Flask test client (в отдельном
+# процессе на каждый сценарий) и, с --gunicorn, через запущенный gunicorn.
+#
+# Сценарии: чтение истории и CSV-выгрузка на нескольких размерах таблицы,
+# переключение активностей (start/stop), логин и refresh.
+# Для каждого — p50/p95/p99, пропускная способность и пиковый RSS.
+#
+#   python bench/bench_api.py                         # сравнить с bench/baseline.json
+#   python bench/bench_api.py --save-baseline         # записать новую базовую линию
+#   python bench/bench_api.py --sizes 1000,100000 --gunicorn --concurrency 8
+
+import os, sys, json, time, shutil, socket, argparse, tempfile, threading, subprocess
+import http.client
+from http.cookies import SimpleCookie
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchutil import ROOT, percentiles, peak_rss_mb, proc_rss_mb, child_pids, \
+    make_baseline, load_baseline, compare
+
+sys.path.insert(0, ROOT)
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+UNTIL = "2025-10-01"            # фиксированный конец ленты — наборы воспроизводимы
+PASSWORD = "driver123"
+SIZED = ("history_read", "csv_export")
+UNSIZED = ("activity_churn", "auth_cycle")
+
+
+# ---------- наборы данных ----------
+def dataset(data_dir: str, size: int) -> str:
+    """База примерно на size смен (seed_fleet даёт ~230 смен на водителя в месяц)."""
+    path = os.path.join(data_dir, f"fleet_{size}.db")
+    if not os.path.exists(path):
+        subprocess.run([sys.executable, os.path.join(ROOT, "seed_fleet.py"), "--db", path,
+                        "--drivers", str(max(1, size // 230)), "--months", "1",
+                        "--until", UNTIL, "--password", PASSWORD],
+                       check=True, stdout=subprocess.DEVNULL)
+    return path
+
+
+def first_driver(db_path: str) -> str:
+    import sqlite3
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT username FROM users WHERE role = 'driver' ORDER BY id LIMIT 1").fetchone()[0]
+    finally:
+        conn.close()
+
+
+# ---------- транспорты ----------
+class ClientTransport:
+    """Flask test client в этом процессе."""
+
+    def __init__(self):
+        import app as tt
+        self.client = tt.app.test_client()
+
+    def request(self, method, path, body=None):
+        r = self.client.open(path, method=method, json=body)
+        r.get_data()
+        return r.status_code, r
+
+
+class HttpTransport:
+    """HTTP/1.1 keep-alive к запущенному серверу, cookie rt держим сами."""
+
+    def __init__(self, host, port):
+        self.conn = http.client.HTTPConnection(host, port, timeout=60)
+        self.cookie = None
+
+    def request(self, method, path, body=None):
+        headers = {"Content-Type": "application/json"}
+        if self.cookie:
+            headers["Cookie"] = f"rt={self.cookie}"
+        self.conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        resp = self.conn.getresponse()
+        data = resp.read()
+        for hdr in resp.headers.get_all("Set-Cookie") or []:
+            c = SimpleCookie(hdr)
+            if "rt" in c:
+                self.cookie = c["rt"].value or None
+        return resp.status, data
+
+
+# ---------- сценарии ----------
+def run_scenario(t, scenario: str, iters: int, username: str) -> dict:
+    """Возвращает {имя_метрики: [длительности]}."""
+    out = {}
+
+    def timed(name, method, path, body=None, ok=(200, 201)):
+        t0 = time.perf_counter()
+        status, _ = t.request(method, path, body)
+        out.setdefault(name, []).append(time.perf_counter() - t0)
+        if status not in ok:
+            raise RuntimeError(f"{method} {path} -> {status}")
+
+    if scenario == "history_read":
+        for _ in range(iters):
+            timed(scenario, "GET", "/api/history")
+    elif scenario == "csv_export":
+        for _ in range(iters):
+            timed(scenario, "GET", "/api/download_history")
+    elif scenario == "activity_churn":
+        acts = ("drive", "rest", "other")
+        for i in range(iters):
+            timed("activity_start", "POST", "/api/activity/start", {"activity": acts[i % 3]})
+            timed("activity_current", "GET", "/api/activity/current")
+            if i % 5 == 4:
+                # 409 — активность уже закрыл параллельный клиент, это не ошибка
+                timed("activity_stop", "POST", "/api/activity/stop", ok=(200, 409))
+    elif scenario == "auth_cycle":
+        for _ in range(iters):
+            timed("login", "POST", "/api/login", {"username": username, "password": PASSWORD})
+            for _ in range(3):
+                timed("refresh", "POST", "/api/refresh")
+    return out
+
+
+def iters_for(scenario: str, size: int, base: int) -> int:
+    if scenario in SIZED:
+        # большие таблицы читаются долго — держим общее время разумным
+        return max(5, min(base, int(base * 10_000 / max(size, 1))))
+    if scenario == "auth_cycle":
+        return max(5, base // 5)         # bcrypt ~0.2с на логин
+    return base
+
+
+def child_main(args):
+    """Один сценарий через test client; печатает JSON с результатами."""
+    t = ClientTransport()
+    t0 = time.perf_counter()
+    samples = run_scenario(t, args.child, args.iters, args.username)
+    wall = time.perf_counter() - t0
+    print(json.dumps({"samples": samples, "wall": wall, "peak_rss_mb": peak_rss_mb()}))
+
+
+def summarize(mode: str, scenario: str, size: int, samples: dict, wall: float, rss: float) -> dict:
+    """Имя результата: режим:метрика[размер]; rps — запросов этой метрики в секунду прогона."""
+    suffix = f"[{size}]" if scenario in SIZED else ""
+    return {
+        f"{mode}:{metric}{suffix}": {**percentiles(xs), "n": len(xs),
+                                    "rps": round(len(xs) / wall, 1) if wall else 0.0,
+                                    "peak_rss_mb": rss}
+        for metric, xs in samples.items()
+    }
+
+
+def run_client(work_dir, db_path, scenario, size, iters, username):
+    db_copy = os.path.join(work_dir, "run.db")
+    shutil.copy(db_path, db_copy)
+    env = dict(os.environ, TT_DB_PATH=db_copy, TT_METRICS_DIR=os.path.join(work_dir, "metrics"))
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", scenario, "--iters", str(iters),
+         "--username", username],
+        cwd=work_dir, env=env, capture_output=True, text=True,
+    )
+    if out.returncode != 0:
+        raise SystemExit(f"{scenario}[{size}] failed:\n{out.stderr[-2000:]}")
+    data = json.loads(out.stdout.strip().splitlines()[-1])
+    return summarize("client", scenario, size, data["samples"], data["wall"], data["peak_rss_mb"])
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_gunicorn(work_dir, db_path, scenario, size, iters, username, workers, concurrency):
+    db_copy = os.path.join(work_dir, "run.db")
+    shutil.copy(db_path, db_copy)
+    port = _free_port()
+    env = dict(os.environ, TT_DB_PATH=db_copy, TT_METRICS_DIR=os.path.join(work_dir, "metrics"),
+               PYTHONPATH=ROOT)
+    proc = subprocess.Popen(
+        ["gunicorn", "-w", str(workers), "-b", f"127.0.0.1:{port}", "--chdir", work_dir, "app:app"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        peak = [0.0]
+        stop = threading.Event()
+
+        def sample_rss():
+            while not stop.wait(0.2):
+                peak[0] = max(peak[0], sum(proc_rss_mb(p) for p in [proc.pid] + child_pids(proc.pid)))
+
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+
+        results = [None] * concurrency
+        per = max(1, iters // concurrency)
+
+        def worker(i):
+            results[i] = run_scenario(HttpTransport("127.0.0.1", port), scenario, per, username)
+
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        wall = time.perf_counter() - t0
+        stop.set()
+        sampler.join()
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    merged = {}
+    for r in results:
+        for k, v in (r or {}).items():
+            merged.setdefault(k, []).extend(v)
+    return summarize("gunicorn", scenario, size, merged, wall, peak[0])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="HTTP-бенчмарки TrikeTime /api")
+    ap.add_argument("--sizes", default="1000,10000,100000", help="размеры таблицы shifts")
+    ap.add_argument("--iters", type=int, default=50)
+    ap.add_argument("--gunicorn", action="store_true", help="также прогнать через gunicorn")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--data-dir", help="где хранить сгенерированные базы (по умолчанию временная папка)")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="допустимое ухудшение (доля)")
+    ap.add_argument("--out", help="сохранить результаты прогона в JSON")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--username", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        return child_main(args)
+
+    if args.gunicorn and not shutil.which("gunicorn"):
+        raise SystemExit("gunicorn not found in PATH")
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="tt-bench-data-")
+    os.makedirs(data_dir, exist_ok=True)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="tt-bench-") as work_dir:
+        plan = [(s, size) for s in SIZED for size in sizes] + [(s, min(sizes)) for s in UNSIZED]
+        for scenario, size in plan:
+            db_path = dataset(data_dir, size)
+            username = first_driver(db_path)
+            iters = iters_for(scenario, size, args.iters)
+            modes = ["client"] + (["gunicorn"] if args.gunicorn else [])
+            for mode in modes:
+                if mode == "client":
+                    res = run_client(work_dir, db_path, scenario, size, iters, username)
+                else:
+                    res = run_gunicorn(work_dir, db_path, scenario, size, iters, username,
+                                       args.workers, args.concurrency)
+                for name, r in res.items():
+                    print(f"{name:40s} p50 {r['p50_ms']:9.2f}  p95 {r['p95_ms']:9.2f}  "
+                          f"p99 {r['p99_ms']:9.2f} ms  {r['rps']:8.1f} req/s  rss {r['peak_rss_mb']:7.1f} MB")
+                results.update(res)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(make_baseline(results, sizes=sizes), f, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(make_baseline(results, sizes=sizes), f, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"no baseline at {args.baseline}; run with --save-baseline")
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\nREGRESSIONS vs {baseline['git']} (tolerance {args.tolerance:.0%}):")
+        for r in regressions:
+            print("  " + r)
+        return 1
+    print(f"\nno regressions vs baseline {baseline['git']} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+# bench/bench_availability.py
+# Индекс доступности (availability.py) на синтетическом автопарке: обновления
+# на переходах и запросы «остаток езды ≥ X» с фильтрами отдыха и перерыва.
+#
+#   python bench/bench_availability.py --drivers 10000,100000
+
+import os, sys, time, random, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchutil import ROOT, percentiles
+
+sys.path.insert(0, ROOT)
+from fleet import DriverStatus
+from availability import AvailabilityIndex
+
+
+def fake_record(rng, user_id, now):
+    activity = rng.choice(("drive", "rest", "other", None))
+    return DriverStatus(
+        user_id, f"driver{user_id}", activity, shift_id=user_id,
+        since=now - rng.random() * 3600 if activity else None,
+        drive_today=rng.randint(0, 9 * 3600), other_today=rng.randint(0, 2 * 3600),
+        continuous=rng.randint(0, 4 * 3600), drive_week=rng.randint(0, 50 * 3600),
+        rest_due=now + rng.random() * 13 * 3600 if activity in ("drive", "other") else None,
+        as_of=now - rng.random() * 600)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк индекса доступности водителей")
+    ap.add_argument("--drivers", default="10000,100000")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    for n in (int(x) for x in args.drivers.split(",")):
+        rng = random.Random(args.seed)
+        now = time.time()
+        idx = AvailabilityIndex()
+        t0 = time.perf_counter()
+        for uid in range(n):
+            idx.update(fake_record(rng, uid, now))
+        build = time.perf_counter() - t0
+
+        upd = []
+        for _ in range(args.queries):
+            rec = fake_record(rng, rng.randrange(n), now)
+            t0 = time.perf_counter()
+            idx.update(rec)
+            upd.append(time.perf_counter() - t0)
+
+        cases = {
+            "min 3h30": dict(min_left=3.5 * 3600),
+            "min 3h30 rest>+5h": dict(min_left=3.5 * 3600, rest_after=now + 5 * 3600),
+            "min 1h break>=30m": dict(min_left=3600, min_break=1800),
+            "min 8h": dict(min_left=8 * 3600),
+        }
+        print(f"{n:,} drivers: build {build:.2f}s, update p50 {percentiles(upd)['p50_ms']:.3f} ms")
+        for name, kw in cases.items():
+            lat = []
+            for _ in range(args.queries // 10 or 1):
+                t0 = time.perf_counter()
+                r = idx.query(now_ts=now + 1, limit=100, **kw)
+                lat.append(time.perf_counter() - t0)
+            p = percentiles(lat)
+            print(f"  {name:22s} p50 {p['p50_ms']:8.2f}  p95 {p['p95_ms']:8.2f} ms  matched {r['matched']:,}")
+
+
+if __name__ == "__main__":
+    main()
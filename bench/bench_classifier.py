@@ -0,0 +1,81 @@
+# bench/bench_classifier.py
+# Пакетный классификатор активности (classifier.py): сколько водителей в
+# секунду он оценивает — только признаки + умножение, сборка признаков обходом
+# записей fleet.py против матрицы feature_store.py и целиком тик от хранилища
+# до опубликованных подсказок; плюс скорость обновлений хранилища.
+#
+#   python bench/bench_classifier.py --drivers 100000 --ticks 20
+
+import os, sys, time, random, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchutil import ROOT, percentiles, peak_rss_mb
+
+sys.path.insert(0, ROOT)
+import numpy as np
+from fleet import DriverStatus
+from classifier import Suggester, features, predict_proba, fleet_features
+from feature_store import FeatureStore
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк пакетного классификатора активности")
+    ap.add_argument("--drivers", type=int, default=100_000)
+    ap.add_argument("--ticks", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    now = time.time()
+    n = args.drivers
+    records = [DriverStatus(uid, f"driver{uid}", rng.choice(("drive", "rest", "other", None)),
+                            since=now - rng.random() * 4 * 3600, as_of=now) for uid in range(n)]
+    np_rng = np.random.default_rng(args.seed)
+    stop = np_rng.random(n) * 3600
+    cont = np_rng.random(n) * 4 * 3600
+    code = np_rng.integers(0, 4, n)
+
+    lat = []
+    for _ in range(args.ticks):
+        t0 = time.perf_counter()
+        predict_proba(features(stop, cont, 14, 0.0, code)).argmax(axis=1)
+        lat.append(time.perf_counter() - t0)
+    p = percentiles(lat)
+    print(f"matrix only  {n:,} drivers: p50 {p['p50_ms']:8.2f} ms  {n / (p['p50_ms'] / 1000):14,.0f} drivers/s")
+
+    store = FeatureStore()
+    t0 = time.perf_counter()
+    for r in records:
+        store.update_record(r)
+    zero = np.zeros(1)
+    for uid in range(n):
+        store.add_samples(uid, np.array([now]), zero)
+    took = time.perf_counter() - t0
+    print(f"store update {2 * n:,} events: {took * 1000:8.2f} ms  {2 * n / took:14,.0f} events/s")
+
+    _, _, x_rec = fleet_features(records, now)
+    _, _, x_store = store.matrix(now)
+    print(f"store vs records max |dx| {np.abs(x_rec - x_store).max():.2e}")
+
+    for name, build in (("from records", lambda t: fleet_features(records, t)), ("from store", store.matrix)):
+        lat = []
+        for i in range(args.ticks):
+            t0 = time.perf_counter()
+            build(now + i * 30)
+            lat.append(time.perf_counter() - t0)
+        p = percentiles(lat)
+        print(f"{name:12} {n:,} drivers: p50 {p['p50_ms']:8.2f} ms  {n / (p['p50_ms'] / 1000):14,.0f} drivers/s")
+
+    lat, published = [], 0
+    s = Suggester(cooldown_s=0)
+    for i in range(args.ticks):
+        t0 = time.perf_counter()
+        published = s.score(*store.matrix(now + i * 30), now + i * 30)
+        lat.append(time.perf_counter() - t0)
+    p = percentiles(lat)
+    print(f"full tick    {n:,} drivers: p50 {p['p50_ms']:8.2f} ms  {n / (p['p50_ms'] / 1000):14,.0f} drivers/s  "
+          f"suggestions {published:,}  peak RSS {peak_rss_mb()} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# bench/bench_ddd.py
+# Импорт выгрузок тахографа (tachograph.py) на синтетических файлах за
+# несколько месяцев: VU поколения 1 (обзор, сутки активности со вставками
+# карт, подробная скорость за каждую минуту езды, события, техданные) и
+# карта водителя (кольцевой буфер суточных записей, начало буфера сдвинуто —
+# записи переходят через его конец). Печатает скорость разбора (МБ/с,
+# периодов/с), полного импорта в пустую базу (строк/с), повторного импорта
+# того же файла (должно добавиться 0) и пиковую память.
+#
+#   python bench/bench_ddd.py --days 365 --switches 40 [--keep]
+
+import os, sys, time, struct, argparse, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchutil import ROOT, peak_rss_mb
+
+sys.path.insert(0, ROOT)
+
+CARD = "D123456789012345"
+DAY0 = 1_700_000_000 // 86400 * 86400
+
+
+def day_changes(rng, switches: int) -> list[tuple[int, int]]:
+    """(минута, aa) одного дня: отдых до начала, блоки езды с перерывами и работой, отдых после."""
+    start = int(rng.integers(240, 480))
+    end = min(1439, start + int(rng.integers(540, 780)))
+    marks = sorted(set(rng.integers(start + 1, end, switches - 2).tolist()))
+    out, aa = [(0, 0), (start, 2)], 2
+    for m in marks:
+        aa = int(rng.choice([3, 3, 3, 2, 1, 0])) if aa != 3 else int(rng.choice([0, 1, 2]))
+        out.append((m, aa))
+    out.append((end, 0))
+    return out
+
+
+def change_word(s: int, p: int, aa: int, minute: int) -> int:
+    return (s << 15) | (p << 13) | (aa << 11) | minute
+
+
+def write_vu(path: str, days: int, switches: int, rng) -> int:
+    drove = 0
+    with open(path, "wb") as f:
+        f.write(b"\x76\x01" + bytes(491) + b"\x00\x00" + bytes(128))
+        for d in range(days):
+            day = DAY0 + d * 86400
+            ch = day_changes(rng, switches)
+            iw = bytearray(129)
+            iw[74:90] = CARD.encode()
+            iw[94:98] = struct.pack(">I", day + ch[1][0] * 60)
+            iw[102:106] = struct.pack(">I", day + ch[-1][0] * 60)
+            words = [change_word(0, 1, 0, 0)] + [change_word(0, 0, aa, m) for m, aa in ch[1:-1]]
+            words += [change_word(0, 1, 0, ch[-1][0])]
+            words += [change_word(1, 1, 0, 0)]                  # слот второго водителя пуст
+            f.write(b"\x76\x02" + struct.pack(">I", day) + bytes(3) + struct.pack(">H", 1) + bytes(iw)
+                    + struct.pack(">H", len(words)) + struct.pack(f">{len(words)}H", *words)
+                    + b"\x00" + b"\x00\x00" + bytes(128))
+            minutes = sum(b[0] - a[0] for a, b in zip(ch, ch[1:]) if a[1] == 3)
+            drove += minutes
+            f.write(b"\x76\x04" + struct.pack(">H", minutes) + bytes(64 * minutes) + bytes(128))
+        f.write(b"\x76\x03" + b"\x00\x00" + bytes(9) + b"\x00\x00" + bytes(128))
+        f.write(b"\x76\x05" + bytes(136) + b"\x00" + bytes(128))
+    return drove
+
+
+def write_card(path: str, days: int, switches: int, rng) -> None:
+    recs, prev = [], 0
+    for d in range(days):
+        ch = day_changes(rng, switches)
+        body = struct.pack(f">{len(ch)}H", *(change_word(0, 0, aa, m) for m, aa in ch))
+        rec = struct.pack(">HHIHH", prev, 12 + len(body), DAY0 + d * 86400, d % 10000, 300) + body
+        recs.append(rec)
+        prev = len(rec)
+    stream = b"".join(recs)
+    if len(stream) > 65535 - 4 - 16:
+        raise SystemExit(f"card ring holds ~{days * (65535 - 20) // len(stream)} days at --switches {switches}")
+    size = len(stream) + 16
+    shift = size // 3
+    ring = bytearray(size)
+    for i, b in enumerate(stream):
+        ring[(shift + i) % size] = b
+    newest = (shift + len(stream) - len(recs[-1])) % size
+    ident = bytearray(143)
+    ident[1:17] = CARD.encode()
+    with open(path, "wb") as f:
+        f.write(struct.pack(">HBH", 0x0002, 0, 25) + bytes(25))
+        f.write(struct.pack(">HBH", 0x0520, 0, len(ident)) + bytes(ident))
+        f.write(struct.pack(">HBH", 0x0520, 1, 128) + bytes(128))
+        f.write(struct.pack(">HBH", 0x0504, 0, 4 + size) + struct.pack(">HH", shift, newest) + bytes(ring))
+        f.write(struct.pack(">HBH", 0x0504, 1, 128) + bytes(128))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк импорта файлов тахографа")
+    ap.add_argument("--days", type=int, default=365, help="дней в файле VU")
+    ap.add_argument("--card-days", type=int, default=180, help="дней на карте")
+    ap.add_argument("--switches", type=int, default=40, help="смен активности в день")
+    ap.add_argument("--batch", type=int, default=None)
+    ap.add_argument("--keep", action="store_true", help="не удалять файлы и базу")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp(prefix="tt-ddd-")
+    os.environ["TT_DB_PATH"] = os.path.join(work, "ddd.db")
+    import numpy as np
+    import tachograph
+    from db import raw_connect, create_tables
+
+    create_tables()
+    rng = np.random.default_rng(args.seed)
+    vu, card = os.path.join(work, "vu.ddd"), os.path.join(work, "card.ddd")
+    t0 = time.perf_counter()
+    drove = write_vu(vu, args.days, args.switches, rng)
+    write_card(card, args.card_days, args.switches, rng)
+    print(f"generated in {time.perf_counter() - t0:.1f}s: vu {os.path.getsize(vu) / 1e6:.1f} MB "
+          f"({args.days} days, {drove / 60:,.0f} h driving), card {os.path.getsize(card) / 1e3:.0f} kB "
+          f"({args.card_days} days)  [{work}]")
+    batch = args.batch or tachograph.BATCH
+    now_ts = DAY0 + (args.days + 1) * 86400
+
+    for name, path, user, card_no in (("vu", vu, 1, None), ("vu --card", vu, 2, CARD), ("card", card, 3, None)):
+        size = os.path.getsize(path)
+        rss0 = peak_rss_mb()
+        t0 = time.perf_counter()
+        with open(path, "rb") as f:
+            n = sum(1 for _ in tachograph.segments(f, now_ts, card_no))
+        parse = time.perf_counter() - t0
+        print(f"{name:10} parse   {size / 1e6 / parse:7.1f} MB/s  {n / parse:10,.0f} periods/s  "
+              f"({n:,} periods, {parse * 1000:.0f} ms, peak RSS +{peak_rss_mb() - rss0:.1f} MB)")
+        conn = raw_connect()
+        for run in ("import", "again"):
+            t0 = time.perf_counter()
+            with open(path, "rb") as f:
+                res = tachograph.import_file(conn, user, f, now_ts, card_no, batch)
+            took = time.perf_counter() - t0
+            print(f"{'':10} {run:7} {res['inserted']:8,} rows in {took * 1000:6.0f} ms  "
+                  f"({res['periods'] / took:,.0f} periods/s, {res['skipped']:,} already present)")
+        conn.close()
+    print(f"peak RSS {peak_rss_mb()} MB")
+    if not args.keep:
+        for p in (vu, card, os.environ["TT_DB_PATH"]):
+            os.remove(p)
+        os.rmdir(work)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# bench/bench_planner.py
+# Планировщик перерывов (planner.py) на случайных маршрутах: сколько
+# маршрутов-кандидатов в секунду он оценивает при разной длине маршрута
+# и разном стартовом состоянии водителя.
+#
+#   python bench/bench_planner.py --routes 500 --stops 10,40,120
+
+import os, sys, time, random, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchutil import ROOT, percentiles
+
+sys.path.insert(0, ROOT)
+from planner import plan_breaks, DriverState
+
+
+def random_route(rng, n: int) -> list[dict]:
+    stops = [{"name": "depot"}]
+    for i in range(n):
+        stops.append({"name": f"p{i}", "drive_s": rng.randint(10, 90) * 60,
+                      "dwell_s": rng.choice((0, 0, 0, 15 * 60, 45 * 60))})
+    return stops
+
+
+def random_state(rng) -> DriverState:
+    return DriverState(continuous_drive=rng.randint(0, 4 * 3600), drive_today=rng.randint(0, 8 * 3600),
+                       duty=rng.randint(0, 10 * 3600), had_15=rng.random() < 0.2,
+                       ext_tokens=rng.randint(0, 2), reduced_rests=rng.randint(0, 3))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк планировщика перерывов")
+    ap.add_argument("--routes", type=int, default=500)
+    ap.add_argument("--stops", default="10,40,120", help="число точек на маршруте")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    for n in (int(x) for x in args.stops.split(",")):
+        rng = random.Random(args.seed)
+        cases = [(random_route(rng, n), random_state(rng)) for _ in range(args.routes)]
+        lat, infeasible = [], 0
+        t0 = time.perf_counter()
+        for stops, state in cases:
+            t1 = time.perf_counter()
+            if plan_breaks(stops, state) is None:
+                infeasible += 1
+            lat.append(time.perf_counter() - t1)
+        wall = time.perf_counter() - t0
+        p = percentiles(lat)
+        print(f"{n:4d} stops: {args.routes / wall:8.0f} routes/s  p50 {p['p50_ms']:7.2f}  "
+              f"p99 {p['p99_ms']:7.2f} ms  infeasible {infeasible}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# bench/bench_restareas.py
+# Сеточный индекс стоянок (restareas.py) на синтетическом наборе: места по
+# Европе, часть — плотными кластерами у городов. Время построения, задержка
+# k ближайших (без ограничения и в пределах досягаемости) и полного ответа
+# reachable(); выборка запросов сверяется с полным перебором.
+#
+#   python bench/bench_restareas.py --sites 1000000 --queries 10000 --k 5
+
+import os, sys, time, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchutil import ROOT, percentiles, peak_rss_mb
+
+sys.path.insert(0, ROOT)
+import numpy as np
+from restareas import RestAreaIndex, haversine_km, reachable
+
+
+def synthetic(n: int, rng) -> tuple[np.ndarray, np.ndarray]:
+    lat = rng.uniform(36, 70, n)
+    lon = rng.uniform(-10, 40, n)
+    m = n // 2
+    cities = np.c_[rng.uniform(40, 60, 200), rng.uniform(-5, 30, 200)]
+    c = rng.integers(0, len(cities), m)
+    lat[:m] = cities[c, 0] + rng.normal(0, 0.2, m)
+    lon[:m] = cities[c, 1] + rng.normal(0, 0.3, m)
+    return lat, lon
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк поиска ближайших стоянок")
+    ap.add_argument("--sites", type=int, default=1_000_000)
+    ap.add_argument("--queries", type=int, default=10_000)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--check", type=int, default=200, help="сколько запросов сверить с перебором")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    lat, lon = synthetic(args.sites, rng)
+    t0 = time.perf_counter()
+    index = RestAreaIndex(lat, lon)
+    print(f"build {args.sites:,} sites: {(time.perf_counter() - t0) * 1000:.0f} ms, "
+          f"{len(index.keys):,} cells of {index.cell}°")
+
+    qs = np.c_[rng.uniform(42, 62, args.queries), rng.uniform(-5, 30, args.queries)]
+    left = rng.uniform(600, 4.5 * 3600, args.queries)
+    for name, fn in (
+            ("knn", lambda i: index.nearest(qs[i, 0], qs[i, 1], args.k)),
+            ("knn reachable", lambda i: index.nearest(qs[i, 0], qs[i, 1], args.k, left[i] / 3600 * 70 / 1.3)),
+            ("reachable() dicts", lambda i: reachable(index, qs[i, 0], qs[i, 1], args.k, left[i]))):
+        lat_s = []
+        for i in range(args.queries):
+            t0 = time.perf_counter()
+            fn(i)
+            lat_s.append(time.perf_counter() - t0)
+        p = percentiles(lat_s)
+        print(f"{name:18} p50 {p['p50_ms'] * 1000:7.1f} µs  p95 {p['p95_ms'] * 1000:7.1f} µs  "
+              f"p99 {p['p99_ms'] * 1000:7.1f} µs")
+
+    t0 = time.perf_counter()
+    bad = 0
+    for i in range(args.check):
+        _, d = index.nearest(qs[i, 0], qs[i, 1], args.k)
+        full = np.sort(haversine_km(qs[i, 0], qs[i, 1], index.lat, index.lon))[:args.k]
+        bad += not np.allclose(d, full)
+    brute = (time.perf_counter() - t0) / max(1, args.check)
+    print(f"brute force ~{brute * 1000:.1f} ms/query; mismatches {bad}/{args.check}  peak RSS {peak_rss_mb()} MB")
+
+
+if __name__ == "__main__":
+    main()
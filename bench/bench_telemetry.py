@@ -0,0 +1,105 @@
+# bench/bench_telemetry.py
+# Приём телеметрии (telemetry.py): V машин шлют пачки по B отсчётов (1 Гц)
+# R раундов подряд — через POST /api/telemetry (Flask test client) или сразу
+# через telemetry.ingest. Печатает устойчивую скорость приёма (отсчётов/с и
+# сколько машин на 1 Гц она выдержит), задержку пачки, байт на отсчёт и
+# скорость чтения обратно.
+#
+#   python bench/bench_telemetry.py --vehicles 2000 --batch 10 --rounds 30 [--direct]
+
+import os, sys, time, argparse, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchutil import ROOT, percentiles, peak_rss_mb
+
+sys.path.insert(0, ROOT)
+
+
+def tracks(vehicles: int, batch: int, rounds: int, t0_ms: int, rng):
+    """Раунд за раундом: [(user_id, (4, batch) t/lat/lon/speed)] — случайные блуждания по 1 Гц."""
+    import numpy as np
+
+    lat = 48 + rng.random(vehicles) * 6
+    lon = 8 + rng.random(vehicles) * 10
+    speed = rng.random(vehicles) * 90
+    for r in range(rounds):
+        t = t0_ms + (r * batch + np.arange(batch)) * 1000
+        out = []
+        for v in range(vehicles):
+            sp = np.clip(speed[v] + np.cumsum(rng.normal(0, 1.5, batch)), 0, 130)
+            step = sp / 3.6 / 111_000
+            la = lat[v] + np.cumsum(step * 0.7)
+            lo = lon[v] + np.cumsum(step * 0.7)
+            lat[v], lon[v], speed[v] = la[-1], lo[-1], sp[-1]
+            out.append((v + 1, np.array([t, la, lo, sp])))
+        yield out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк приёма телеметрии")
+    ap.add_argument("--vehicles", type=int, default=2000)
+    ap.add_argument("--batch", type=int, default=10, help="отсчётов в пачке (секунд при 1 Гц)")
+    ap.add_argument("--rounds", type=int, default=30)
+    ap.add_argument("--direct", action="store_true", help="telemetry.ingest без HTTP")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    work = tempfile.mkdtemp(prefix="tt-telemetry-")
+    os.environ["TT_DB_PATH"] = os.path.join(work, "telemetry.db")
+    os.environ.setdefault("TT_FLEET", "0")
+    os.environ.setdefault("TT_ALERTS", "0")
+    os.environ.setdefault("TT_CLASSIFIER", "0")
+    import numpy as np
+    import app as tt
+    import auth
+    import telemetry
+    from db import raw_connect
+    from models import User
+    from feature_store import store
+
+    rng = np.random.default_rng(args.seed)
+    now_ms = int(time.time() * 1000)
+    t0_ms = now_ms - args.rounds * args.batch * 1000
+    client = tt.app.test_client()
+    headers = {v: {"Authorization": "Bearer " + auth.make_access(User(id=v, username=f"v{v}", role="driver"))}
+               for v in range(1, args.vehicles + 1)}
+    conn = raw_connect()
+
+    lat, n = [], 0
+    wall0 = time.perf_counter()
+    for batches in tracks(args.vehicles, args.batch, args.rounds, t0_ms, rng):
+        for uid, a in batches:
+            t0 = time.perf_counter()
+            if args.direct:
+                res = telemetry.ingest(conn, uid, a, time.time())
+                conn.commit()
+                store.add_samples(uid, res["t"], res["speed"])
+                accepted = res["accepted"]
+            else:
+                r = client.post("/api/telemetry", headers=headers[uid],
+                                json={"t": a[0].tolist(), "lat": a[1].tolist(), "lon": a[2].tolist(),
+                                      "speed": a[3].tolist()})
+                accepted = r.json["accepted"]
+            lat.append(time.perf_counter() - t0)
+            n += accepted
+    wall = sum(lat)
+    p = percentiles(lat)
+    rate = n / wall
+    mode = "direct" if args.direct else "http"
+    print(f"{mode}: {n:,} samples in {len(lat):,} batches of {args.batch}, {wall:.1f}s busy "
+          f"({time.perf_counter() - wall0:.1f}s wall incl. generation)")
+    print(f"  {rate:,.0f} samples/s sustained = {rate:,.0f} vehicles at 1 Hz on one core")
+    print(f"  batch p50 {p['p50_ms']:.2f} ms  p95 {p['p95_ms']:.2f} ms  p99 {p['p99_ms']:.2f} ms")
+
+    rows, size = conn.execute("SELECT COUNT(*), SUM(LENGTH(data)) FROM telemetry_chunks").fetchone()
+    print(f"  storage {size / n:.2f} bytes/sample in {rows:,} chunks (raw float64: 32)")
+
+    t0 = time.perf_counter()
+    got = sum(telemetry.read(conn, uid, t0_ms, now_ms).shape[1] for uid in range(1, args.vehicles + 1))
+    took = time.perf_counter() - t0
+    print(f"  read back {got:,} samples in {took:.2f}s ({got / took:,.0f} samples/s)  peak RSS {peak_rss_mb()} MB")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# bench/bench_wheel.py
+# Колесо таймеров (timing_wheel.py) на миллионах дедлайнов: вставка,
+# перестановка (как при переходе активности), отмена и прокрутка по тикам.
+#
+#   python bench/bench_wheel.py --timers 2000000
+
+import os, sys, time, random, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchutil import ROOT, peak_rss_mb
+
+sys.path.insert(0, ROOT)
+from timing_wheel import TimingWheel
+
+
+def rate(n, seconds):
+    return f"{n / seconds:12,.0f}/s  ({seconds / n * 1e6:.2f} us/op)"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Бенчмарк колеса таймеров")
+    ap.add_argument("--timers", type=int, default=1_000_000)
+    ap.add_argument("--horizon-h", type=float, default=14, help="дедлайны в пределах N часов")
+    ap.add_argument("--advance-h", type=float, default=1, help="сколько модельного времени прокрутить")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    now = 1_700_000_000.0
+    horizon = args.horizon_h * 3600
+    deadlines = [now + rng.random() * horizon for _ in range(args.timers)]
+    w = TimingWheel(tick=1.0, now=now)
+
+    t0 = time.perf_counter()
+    for i, d in enumerate(deadlines):
+        w.schedule(i, d)
+    print(f"schedule   {rate(args.timers, time.perf_counter() - t0)}")
+
+    n = args.timers // 2
+    t0 = time.perf_counter()
+    for i in range(n):
+        w.schedule(i, deadlines[i] + 600)
+    print(f"reschedule {rate(n, time.perf_counter() - t0)}")
+
+    t0 = time.perf_counter()
+    for i in range(0, args.timers, 4):
+        w.cancel(i)
+    print(f"cancel     {rate(len(range(0, args.timers, 4)), time.perf_counter() - t0)}")
+
+    pending = len(w)
+    ticks = int(args.advance_h * 3600)
+    t0 = time.perf_counter()
+    fired = 0
+    for s in range(1, ticks + 1):
+        fired += len(w.advance(now + s))
+    took = time.perf_counter() - t0
+    print(f"advance    {ticks} ticks, {fired:,} fired of {pending:,} pending in {took:.2f}s "
+          f"({took / ticks * 1e3:.3f} ms/tick)")
+    print(f"peak rss   {peak_rss_mb()} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench/benchutil.py
+# Общие куски для скриптов в bench/: перцентили, память, базовые линии.
+
+import os, json, time, resource, subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_VERSION = 1
+
+
+def percentiles(samples: list[float]) -> dict:
+    """p50/p95/p99/среднее в миллисекундах по списку длительностей в секундах."""
+    if not samples:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    xs = sorted(samples)
+
+    def q(p):
+        return xs[min(len(xs) - 1, int(p * len(xs)))] * 1000
+
+    return {
+        "p50_ms": round(q(0.50), 3),
+        "p95_ms": round(q(0.95), 3),
+        "p99_ms": round(q(0.99), 3),
+        "mean_ms": round(sum(xs) / len(xs) * 1000, 3),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS текущего процесса (Linux: ru_maxrss в КБ)."""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def proc_rss_mb(pid: int) -> float:
+    """Текущий RSS процесса по /proc (0, если процесса уже нет)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return 0.0
+
+
+def child_pids(pid: int) -> list[int]:
+    """Дочерние процессы (воркеры gunicorn у мастера)."""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def make_baseline(results: dict, **meta) -> dict:
+    return {
+        "version": BASELINE_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git": git_rev(),
+        **meta,
+        "results": results,
+    }
+
+
+def load_baseline(path: str) -> dict | None:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("version") != BASELINE_VERSION:
+        raise SystemExit(f"{path}: baseline version {data.get('version')} != {BASELINE_VERSION}, "
+                         f"re-record it with --save-baseline")
+    return data
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Регрессии относительно базовой линии: p95/p99 выросли или пропускная
+    способность упала больше чем на tolerance (доля).
+    """
+    out = []
+    for name, cur in results.items():
+        base = baseline["results"].get(name)
+        if not base:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if base.get(key) and cur[key] > base[key] * (1 + tolerance):
+                out.append(f"{name}: {key} {base[key]} -> {cur[key]}")
+        if base.get("rps") and cur["rps"] < base["rps"] * (1 - tolerance):
+            out.append(f"{name}: rps {base['rps']} -> {cur['rps']}")
+        if base.get("peak_rss_mb") and cur["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            out.append(f"{name}: peak_rss_mb {base['peak_rss_mb']} -> {cur['peak_rss_mb']}")
+    return out
@@ -0,0 +1,54 @@
+# bench/metrics_overhead.py
+# Сколько стоят хуки метрик: гоняем одни и те же запросы через test client
+# с TT_METRICS=0 (базовая линия) и TT_METRICS=1, каждый вариант в своём процессе.
+#
+#   python bench/metrics_overhead.py [--requests 20000]
+
+import os, sys, json, time, argparse, tempfile, subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ["/api/ping", "/api/activity/current"]
+
+
+def run_child(n: int) -> dict:
+    sys.path.insert(0, ROOT)
+    import app as tt
+    client = tt.app.test_client()
+    for p in PATHS:                      # прогрев
+        client.get(p)
+    out = {}
+    for p in PATHS:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            client.get(p)
+        out[p] = (time.perf_counter() - t0) / n * 1e6
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=20000)
+    ap.add_argument("--child", action="store_true")
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.requests)))
+        return
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for flag in ("0", "1"):
+            env = dict(os.environ, TT_METRICS=flag, TT_METRICS_DIR=os.path.join(tmp, "m"))
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", "--requests", str(args.requests)],
+                cwd=tmp, env=env, capture_output=True, text=True, check=True,
+            )
+            results[flag] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    for p in PATHS:
+        base, inst = results["0"][p], results["1"][p]
+        print(f"{p:28s} base {base:8.1f} us/req   metrics {inst:8.1f} us/req   overhead {inst - base:+7.1f} us ({(inst / base - 1) * 100:+.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
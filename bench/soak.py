@@ -0,0 +1,236 @@
+# bench/soak.py
+# Длительный «прогон автопарка» против запущенного инстанса: тысячи виртуальных
+# водителей одновременно логинятся, обновляют access-токен каждые JWT_ACCESS_MIN
+# минут, переключают активности по правдоподобному дневному графику
+# (тот же генератор, что в seed_fleet.py), опрашивают /api/activity/current
+# и время от времени тянут историю.
+#
+# Раз в --report-sec печатает окно: запросы, ошибки блокировок SQLite
+# (503 {"error": "db_locked"} от приложения), p50/p95 и дрейф относительно
+# первого окна, рост файла БД, рост refresh_tokens и RSS каждого воркера
+# gunicorn.
+#
+#   python seed_fleet.py --db /srv/tt.db --drivers 2000
+#   TT_DB_PATH=/srv/tt.db gunicorn -w 4 -p /tmp/tt.pid app:app &
+#   python bench/soak.py --url http://127.0.0.1:8000 --db /srv/tt.db \
+#       --drivers 2000 --duration 4h --speed 60 --server-pid "$(cat /tmp/tt.pid)"
+
+import os, sys, json, time, random, sqlite3, asyncio, argparse
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from benchutil import ROOT, percentiles, proc_rss_mb, child_pids
+
+sys.path.insert(0, ROOT)
+from seed_fleet import driver_timeline
+
+ACCESS_MIN = int(os.getenv("JWT_ACCESS_MIN", "20"))
+
+
+def parse_duration(s: str) -> float:
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    return float(s[:-1]) * units[s[-1]] if s[-1] in units else float(s)
+
+
+def _error_code(body: bytes) -> str | None:
+    """Код ошибки из JSON-ответа приложения ({"error": "db_locked"}), иначе None."""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    return data.get("error") if isinstance(data, dict) else None
+
+
+class Stats:
+    """Счётчики текущего окна отчёта."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lat: list[float] = []
+        self.requests = 0
+        self.errors: dict[str, int] = {}
+
+    def record(self, seconds: float, status: int, body: bytes):
+        self.requests += 1
+        self.lat.append(seconds)
+        if status >= 500:
+            kind = _error_code(body) or f"http_{status}"
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+        elif status in (401, 403):
+            self.errors[f"http_{status}"] = self.errors.get(f"http_{status}", 0) + 1
+
+
+class VirtualDriver:
+    def __init__(self, idx, username, password, transport, base_url, stats, args):
+        self.idx = idx
+        self.username = username
+        self.password = password
+        self.stats = stats
+        self.args = args
+        self.rng = random.Random(f"soak:{args.seed}:{idx}")
+        # у каждого водителя своя cookie rt, соединения общие
+        self.client = httpx.AsyncClient(base_url=base_url, transport=transport, timeout=60)
+        self.access = None
+
+    async def call(self, method, path, **kw):
+        headers = kw.pop("headers", {})
+        if self.access:
+            headers["Authorization"] = f"Bearer {self.access}"
+        t0 = time.perf_counter()
+        try:
+            r = await self.client.request(method, path, headers=headers, **kw)
+            self.stats.record(time.perf_counter() - t0, r.status_code, r.content)
+            return r
+        except httpx.HTTPError as e:
+            self.stats.record(time.perf_counter() - t0, 599, str(e).encode())
+            return None
+
+    async def login(self):
+        r = await self.call("POST", "/api/login", json={"username": self.username, "password": self.password})
+        if r is not None and r.status_code == 200:
+            self.access = r.json().get("access")
+
+    async def refresh(self):
+        r = await self.call("POST", "/api/refresh")
+        if r is not None and r.status_code == 200:
+            self.access = r.json().get("access")
+        else:
+            await self.login()
+
+    async def run(self, deadline: float):
+        speed = self.args.speed
+        await asyncio.sleep(self.rng.uniform(0, self.args.ramp))
+        await self.login()
+
+        sim_now = time.time()
+        timeline = driver_timeline(self.rng, sim_now + self.rng.uniform(0, 3600), float("inf"))
+        next_refresh = time.monotonic() + ACCESS_MIN * 60 / speed
+        next_history = time.monotonic() + self.rng.uniform(0, self.args.history_every) / speed
+
+        for start, end, activity in timeline:
+            # ждём начала следующей активности, по пути опрашивая текущую
+            seg_real = (end - start) / speed
+            await self.call("POST", "/api/activity/start", json={"activity": activity})
+            seg_end = time.monotonic() + seg_real
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    await self.client.aclose()
+                    return
+                if now >= seg_end:
+                    break
+                if now >= next_refresh:
+                    await self.refresh()
+                    next_refresh = now + ACCESS_MIN * 60 / speed
+                if now >= next_history:
+                    await self.call("GET", "/api/history")
+                    next_history = now + self.args.history_every / speed
+                await self.call("GET", "/api/activity/current")
+                await asyncio.sleep(min(self.args.poll / speed + self.rng.uniform(0, 1), seg_end - now))
+
+
+def db_probe(db_path: str) -> dict:
+    size = 0
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            size += os.path.getsize(db_path + suffix)
+        except OSError:
+            pass
+    out = {"db_mb": round(size / 2**20, 2)}
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=5)
+        try:
+            out["refresh_tokens"] = conn.execute("SELECT COUNT(*) FROM refresh_tokens").fetchone()[0]
+            out["shifts"] = conn.execute("SELECT MAX(id) FROM shifts").fetchone()[0] or 0
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        out["probe_error"] = str(e)
+    return out
+
+
+def worker_rss(server_pid: int | None) -> dict:
+    if not server_pid:
+        return {}
+    return {str(pid): proc_rss_mb(pid) for pid in child_pids(server_pid) or [server_pid]}
+
+
+async def reporter(stats: Stats, args, deadline: float, report: list):
+    first = None
+    start_probe = db_probe(args.db) if args.db else {}
+    start_rss = worker_rss(args.server_pid)
+    t_start = time.monotonic()
+    while True:
+        await asyncio.sleep(min(args.report_sec, max(0.0, deadline - time.monotonic())))
+        window = {**percentiles(stats.lat), "requests": stats.requests, "errors": dict(stats.errors),
+                  "elapsed_s": round(time.monotonic() - t_start)}
+        stats.reset()
+        if first is None and window["requests"]:
+            first = window
+        if first:
+            window["p95_drift"] = round(window["p95_ms"] / first["p95_ms"], 2) if first["p95_ms"] else None
+        if args.db:
+            probe = db_probe(args.db)
+            window.update(probe)
+            window["db_growth_mb"] = round(probe["db_mb"] - start_probe.get("db_mb", 0), 2)
+            if "refresh_tokens" in probe and "refresh_tokens" in start_probe:
+                window["refresh_tokens_growth"] = probe["refresh_tokens"] - start_probe["refresh_tokens"]
+        rss = worker_rss(args.server_pid)
+        if rss:
+            window["rss_mb"] = rss
+            window["rss_growth_mb"] = {pid: round(v - start_rss.get(pid, v), 1) for pid, v in rss.items()}
+        report.append(window)
+        print(json.dumps(window), flush=True)
+        if time.monotonic() >= deadline:
+            return
+
+
+def load_usernames(db_path: str, n: int) -> list[str]:
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT username FROM users WHERE role = 'driver' ORDER BY id LIMIT ?", (n,)).fetchall()
+    finally:
+        conn.close()
+    return [r[0] for r in rows]
+
+
+async def main_async(args):
+    users = load_usernames(args.db, args.drivers)
+    if not users:
+        raise SystemExit(f"no drivers in {args.db}; generate them with seed_fleet.py")
+    deadline = time.monotonic() + parse_duration(args.duration)
+    stats = Stats()
+    transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=args.connections))
+    drivers = [VirtualDriver(i, u, args.password, transport, args.url, stats, args) for i, u in enumerate(users)]
+    report: list = []
+    await asyncio.gather(reporter(stats, args, deadline, report), *(d.run(deadline) for d in drivers))
+    await transport.aclose()
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"drivers": len(users), "speed": args.speed, "windows": report}, f, indent=2)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Soak-прогон виртуальных водителей против запущенного TrikeTime")
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--db", required=True, help="та же база, что у сервера (пользователи + замеры роста)")
+    ap.add_argument("--drivers", type=int, default=1000)
+    ap.add_argument("--password", default="driver123")
+    ap.add_argument("--duration", default="1h", help="напр. 90s, 30m, 4h")
+    ap.add_argument("--speed", type=float, default=1.0, help="ускорение модельного времени")
+    ap.add_argument("--poll", type=float, default=60, help="опрос /api/activity/current, модельные секунды")
+    ap.add_argument("--history-every", type=float, default=3600, help="чтение истории, модельные секунды")
+    ap.add_argument("--ramp", type=float, default=30, help="растянуть старт водителей на N секунд")
+    ap.add_argument("--connections", type=int, default=200)
+    ap.add_argument("--report-sec", type=float, default=60)
+    ap.add_argument("--server-pid", type=int, help="pid мастера gunicorn — для RSS воркеров")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="сохранить все окна отчёта в JSON")
+    asyncio.run(main_async(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# classifier.py
+# Классификатор активности из static/ai-helper.js (AI.predict) на сервере:
+# те же 9 признаков и та же softmax-регрессия, но сразу для всех водителей —
+# одна матрица признаков (водители × 9) и одно умножение на веса за тик.
+#
+# Признаки — как в maybeSuggestSwitch(): stopMin — сколько длится текущая
+# не-езда, contDriveMin — сколько длится текущая езда, час суток (в TT_TZ)
+# через sin/cos, средняя скорость по телеметрии и one-hot текущей
+# активности. Подсказка («похоже, сейчас: перерыв») публикуется, если
+# уверенность ≥ TT_SUGGEST_THRESHOLD, метка не совпадает с текущей
+# активностью и водителю ничего не предлагали последние 2 минуты. Водителям
+# без открытой активности подсказок нет (в браузере их видит только тот, у
+# кого открыто приложение).
+#
+# Поток "tt-classifier" раз в TT_CLASSIFIER_TICK_SEC берёт матрицу признаков
+# из feature_store.py (обновляется на каждом переходе и отсчёте телеметрии)
+# и оценивает её; GET /api/suggestion отдаёт водителю его последнюю подсказку.
+# Веса — из TT_ACTIVITY_MODEL (train_classifier.py), перечитываются при смене
+# файла; браузер берёт те же через GET /api/model/activity.
+
+from __future__ import annotations
+
+import os, json, time, logging, threading
+from datetime import datetime
+
+import numpy as np
+from flask import request, jsonify
+
+from auth import require_auth
+from compliance import DAY_TZ
+from query_log import query_budget
+
+log = logging.getLogger("triketime.classifier")
+
+ENABLED     = os.getenv("TT_CLASSIFIER", "1") != "0"
+TICK_SEC    = float(os.getenv("TT_CLASSIFIER_TICK_SEC", "30"))
+THRESHOLD   = float(os.getenv("TT_SUGGEST_THRESHOLD", "0.68"))
+COOLDOWN_S  = 120
+
+CLASSES  = ("DRIVE", "BREAK", "OTHER_WORK")
+FEATURES = ("bias", "stopMin", "contDriveMin", "hourSin", "hourCos", "avgSpeed",
+            "lastIsDrive", "lastIsBreak", "lastIsWork")
+# активность смен -> тип в core.js; код 0 — нет открытой активности
+ACTIVITY_CODES = {"drive": 1, "rest": 2, "other": 3}
+CLASS_OF_CODE = (None, "DRIVE", "BREAK", "OTHER_WORK")
+
+# обученные веса (train_classifier.py); без файла — встроенные из ai-helper.js
+MODEL_PATH = os.getenv("TT_ACTIVITY_MODEL",
+                       os.path.join(os.path.dirname(os.path.abspath(__file__)), "activity_model.json"))
+
+# веса из ai-helper.js, строки — CLASSES
+W = np.array([
+    [ 0.2, -1.2,  0.9, -0.1, -0.1,  2.0,  0.8, -0.6, -0.3],
+    [ 0.1, -0.8,  1.6,  0.2, -0.1, -2.5, -0.4,  1.2,  0.1],
+    [-0.1, -0.4, -0.2,  0.0, -0.0, -0.6, -0.2, -0.3,  0.9],
+], dtype=np.float64)
+
+
+def load_model(path: str = MODEL_PATH) -> dict:
+    """{"version", "W": (3, 9)} из JSON train_classifier.py; нет файла — версия 0 со встроенными весами."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        return {"version": 0, "W": W}
+    if list(raw.get("features", FEATURES)) != list(FEATURES):
+        raise ValueError(f"{path}: features differ from {FEATURES}")
+    weights = np.array([raw["W"][c] for c in CLASSES], dtype=np.float64)
+    if weights.shape != W.shape:
+        raise ValueError(f"{path}: expected W of shape {W.shape}")
+    return {"version": int(raw["version"]), "W": weights}
+
+
+def model_json(model: dict) -> dict:
+    """Веса в формате ai-helper.js: {"version", "classes", "features", "W": {класс: [...]}}."""
+    return {"version": model["version"], "classes": list(CLASSES), "features": list(FEATURES),
+            "W": {c: [round(float(v), 6) for v in row] for c, row in zip(CLASSES, model["W"])}}
+
+
+def features(stop_s, cont_drive_s, hour, speed_kmh, last_code) -> np.ndarray:
+    """Матрица (n, 9); аргументы — массивы длины n или скаляры (час, скорость)."""
+    last_code = np.asarray(last_code, dtype=np.int8)
+    n = len(last_code)
+    x = np.empty((n, len(FEATURES)), dtype=np.float64)
+    hour_rad = 2 * np.pi * np.asarray(hour, dtype=np.float64) / 24
+    x[:, 0] = 1
+    x[:, 1] = np.asarray(stop_s, dtype=np.float64) / 60
+    x[:, 2] = np.asarray(cont_drive_s, dtype=np.float64) / 60
+    x[:, 3] = np.sin(hour_rad)
+    x[:, 4] = np.cos(hour_rad)
+    x[:, 5] = speed_kmh
+    for j, code in enumerate((1, 2, 3)):
+        x[:, 6 + j] = last_code == code
+    return x
+
+
+def predict_proba(x: np.ndarray, weights: np.ndarray = W) -> np.ndarray:
+    """softmax(x @ W.T) построчно, (n, 3)."""
+    logits = x @ weights.T
+    logits -= logits.max(axis=1, keepdims=True)
+    np.exp(logits, out=logits)
+    logits /= logits.sum(axis=1, keepdims=True)
+    return logits
+
+
+def fleet_features(records, now_ts: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(user_ids, коды активности, признаки) по записям fleet.DriverStatus."""
+    n = len(records)
+    uid = np.fromiter((r.user_id for r in records), dtype=np.int64, count=n)
+    code = np.fromiter((ACTIVITY_CODES.get(r.activity, 0) for r in records), dtype=np.int8, count=n)
+    since = np.fromiter((r.since if r.since is not None else now_ts for r in records), dtype=np.float64, count=n)
+    running = np.maximum(0.0, now_ts - since)
+    hour = datetime.fromtimestamp(now_ts, DAY_TZ).hour
+    x = features(np.where((code != 1) & (code != 0), running, 0), np.where(code == 1, running, 0),
+                 hour, 0.0, code)
+    return uid, code, x
+
+
+class Suggester:
+    def __init__(self, tick: float = TICK_SEC, threshold: float = THRESHOLD, cooldown_s: float = COOLDOWN_S):
+        self.tick = tick
+        self.threshold = threshold
+        self.cooldown_s = cooldown_s
+        self.model = {"version": 0, "W": W}
+        self._model_mtime = None
+        self.latest: dict[int, dict] = {}
+        self._last_at: dict[int, float] = {}
+        self._listeners: list = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def on_suggest(self, fn) -> None:
+        """fn(user_id, suggestion) — в потоке классификатора, на каждую новую подсказку."""
+        self._listeners.append(fn)
+
+    def reload(self, path: str = MODEL_PATH) -> bool:
+        """Перечитать веса, если файл модели сменился (проверяется каждый тик)."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._model_mtime:
+            return False
+        try:
+            self.model = load_model(path)
+        except (ValueError, KeyError) as e:
+            log.error("classifier: bad model file %s: %s", path, e)
+        self._model_mtime = mtime
+        return True
+
+    def score(self, uid: np.ndarray, code: np.ndarray, x: np.ndarray, now_ts: float) -> int:
+        """Оценить всех (feature_store.FeatureStore.matrix) и опубликовать подсказки; возвращает число новых."""
+        if not len(uid):
+            return 0
+        probs = predict_proba(x, self.model["W"])
+        best = probs.argmax(axis=1)
+        top = probs[np.arange(len(best)), best]
+        # только с открытой активностью и метка ≠ текущей (у кода c класс c - 1)
+        hit = np.flatnonzero((top >= self.threshold) & (code != 0) & (best != code.astype(np.int64) - 1))
+        fresh = 0
+        for i in hit.tolist():
+            user_id = int(uid[i])
+            if now_ts - self._last_at.get(user_id, 0.0) <= self.cooldown_s:
+                continue
+            self._last_at[user_id] = now_ts
+            s = {"label": CLASSES[best[i]], "confidence": round(float(top[i]), 3),
+                 "probs": dict(zip(CLASSES, (round(float(p), 3) for p in probs[i]))),
+                 "current": CLASS_OF_CODE[code[i]], "model": self.model["version"], "at": int(now_ts * 1000)}
+            self.latest[user_id] = s
+            fresh += 1
+            for fn in self._listeners:
+                fn(user_id, s)
+        return fresh
+
+    def start(self, fleet_status, store) -> None:
+        self._thread = threading.Thread(target=self._run, args=(fleet_status, store), name="tt-classifier", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self, fleet_status, store) -> None:
+        fleet_status.ready.wait()
+        while not self._stop.wait(self.tick):
+            try:
+                if self.reload():
+                    log.info("classifier: model version %s", self.model["version"])
+                now_ts = time.time()
+                self.score(*store.matrix(now_ts), now_ts)
+            except Exception:
+                log.exception("classifier tick failed")
+
+
+suggester = Suggester()
+
+
+def init_app(app, fleet_status, store) -> None:
+    if not ENABLED:
+        return
+    suggester.reload()
+    suggester.start(fleet_status, store)
+
+    @app.route("/api/model/activity", methods=["GET"])
+    @query_budget(0)
+    def api_model_activity():
+        """Текущие веса для ai-helper.js (те же, что у серверного классификатора)."""
+        return jsonify(model_json(suggester.model)), 200
+
+    @app.route("/api/suggestion", methods=["GET"])
+    @require_auth()
+    @query_budget(0)
+    def api_suggestion():
+        """Последняя подсказка классификатора для водителя ({} — подсказок не было)."""
+        return jsonify(suggester.latest.get(request.user_id, {})), 200
@@ -0,0 +1,189 @@
+# compliance.py
+# Счётчики режима труда и отдыха (ЕС 561/2006, упрощённо) по таблице shifts.
+# Считаем то же, что core.js recompute(): езда сегодня, «молотки», работа всего,
+# непрерывная езда без перерыва — но на сервере и одинаково для всех устройств.
+
+from __future__ import annotations
+
+import os
+from datetime import datetime, timezone, timedelta, time as dtime
+from zoneinfo import ZoneInfo
+
+# часовой пояс, в котором считаются «сутки» (полночь)
+DAY_TZ = ZoneInfo(os.getenv("TT_TZ", "UTC"))
+
+CONT_DRIVE_LIMIT_S = int(4.5 * 3600)   # 4ч30м без перерыва
+BREAK_FULL_S       = 45 * 60           # перерыв 45 мин обнуляет счётчик
+BREAK_SPLIT_1_S    = 15 * 60           # ... либо 15 + 30
+BREAK_SPLIT_2_S    = 30 * 60
+DAILY_DRIVE_S      = 9 * 3600          # дневная езда, 10ч — по жетону продления
+DAILY_DRIVE_EXT_S  = 10 * 3600
+WEEKLY_DRIVE_S     = 56 * 3600         # езда за неделю (пн–вс)
+DAILY_REST_MIN_S   = 9 * 3600          # сокращённый ежедневный отдых
+DUTY_SPAN_S        = 13 * 3600         # 24ч минус 11ч отдыха: когда отдых должен начаться
+
+# старые смены (start_shift/end_shift) пишутся без activity — фронт считает их ездой
+LEGACY_ACTIVITY = "drive"
+
+
+def parse_ts(value: str | None) -> float | None:
+    """ISO-строка из shifts -> unix-время. Наивное время считаем UTC."""
+    if not value:
+        return None
+    try:
+        d = datetime.fromisoformat(value.replace("T", " "))
+    except ValueError:
+        return None
+    if d.tzinfo is None:
+        d = d.replace(tzinfo=timezone.utc)
+    return d.timestamp()
+
+
+def day_start(ts: float) -> float:
+    """Начало суток (в DAY_TZ), в которые попадает ts."""
+    d = datetime.fromtimestamp(ts, DAY_TZ)
+    return d.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+def split_by_day(start_ts: float, end_ts: float):
+    """Режет интервал по полуночам DAY_TZ: (день 'YYYY-MM-DD', начало, конец)."""
+    while start_ts < end_ts:
+        d = datetime.fromtimestamp(start_ts, DAY_TZ).date()
+        next_midnight = datetime.combine(d + timedelta(days=1), dtime(), DAY_TZ).timestamp()
+        piece_end = min(end_ts, next_midnight)
+        yield d.isoformat(), start_ts, piece_end
+        start_ts = piece_end
+
+
+def recent_segments(conn, since_ts: float, now_ts: float, user_id: int | None = None) -> list[tuple[float, float, str]]:
+    """
+    Отрезки (start, end, activity) пользователя, пересекающие [since_ts, now_ts],
+    по возрастанию. Открытая смена заканчивается в now_ts.
+
+    Смены пользователя идут по индексу (user_id, start_time) с конца; строки
+    сортируются как строки, поэтому останавливаемся с запасом в сутки.
+    Старые смены без user_id — по id с конца до первой закончившейся раньше since_ts.
+    """
+    out = []
+    if user_id is None:
+        cur = conn.execute(
+            "SELECT start_time, end_time, activity FROM shifts WHERE user_id IS NULL ORDER BY id DESC")
+        stop_before = since_ts
+    else:
+        cur = conn.execute(
+            "SELECT start_time, end_time, activity FROM shifts WHERE user_id = ? ORDER BY start_time DESC",
+            (user_id,))
+        stop_before = since_ts - 24 * 3600
+    for start_s, end_s, activity in cur:
+        start = parse_ts(start_s)
+        if start is None:
+            continue
+        end = parse_ts(end_s) if end_s else now_ts
+        if end is None:
+            continue
+        if end < stop_before:
+            break
+        if end < since_ts or start > now_ts:
+            continue
+        out.append((max(start, since_ts), min(end, now_ts), activity or LEGACY_ACTIVITY))
+    out.sort()
+    return out
+
+
+def continuous_drive(segments, now_ts: float) -> float:
+    """
+    Непрерывная езда (сек) на момент now_ts. Перерывом считается отдых и
+    промежутки без записей; 45 мин или 15+30 обнуляют счётчик.
+    """
+    cont = 0.0
+    had_15 = False
+    prev_end = None
+
+    def take_break(dur):
+        nonlocal cont, had_15
+        if dur >= BREAK_FULL_S or (had_15 and dur >= BREAK_SPLIT_2_S):
+            cont, had_15 = 0.0, False
+        elif dur >= BREAK_SPLIT_1_S:
+            had_15 = True
+
+    for start, end, activity in segments:
+        if prev_end is not None and start > prev_end:
+            take_break(start - prev_end)
+        if activity == "drive":
+            cont += end - start
+        elif activity == "rest":
+            take_break(end - start)
+        prev_end = end if prev_end is None else max(prev_end, end)
+    if prev_end is not None and now_ts > prev_end:
+        take_break(now_ts - prev_end)
+    return cont
+
+
+def duty_start(segments) -> float | None:
+    """
+    Начало текущего рабочего периода: первая не-отдых активность после
+    перерыва (отдых или промежуток без записей) не короче DAILY_REST_MIN_S.
+    """
+    start = prev_end = None
+    for s, e, activity in segments:
+        if activity == "rest":
+            continue
+        if start is None or s - prev_end >= DAILY_REST_MIN_S:
+            start = s
+        prev_end = e if prev_end is None else max(prev_end, e)
+    return start
+
+
+def duty_periods(segments):
+    """
+    Рабочие периоды между ежедневными отдыхами: (начало, конец, езда сек)
+    по возрастанию. Граница — отдых или промежуток без записей не короче
+    DAILY_REST_MIN_S; при разделённом отдыхе 3+9 границу даёт вторая часть
+    (от 9ч), первая период не делит. Периоды через полночь — целиком.
+    """
+    start = prev_end = None
+    drive = 0.0
+    for s, e, activity in segments:
+        if activity == "rest":
+            continue
+        if start is not None and s - prev_end >= DAILY_REST_MIN_S:
+            yield start, prev_end, drive
+            start = None
+        if start is None:
+            start, drive = s, 0.0
+        if (activity or LEGACY_ACTIVITY) == "drive":
+            drive += e - s
+        prev_end = e if prev_end is None else max(prev_end, e)
+    if start is not None:
+        yield start, prev_end, drive
+
+
+def today_counters(conn, now_ts: float | None = None, user_id: int | None = None) -> dict:
+    """
+    Четыре счётчика как в core.js + сколько осталось до обязательного перерыва.
+    Все значения — секунды. Суммы за сутки берём из daily_totals (закрытые смены)
+    плюс идущую активность; для непрерывной езды хватает последних суток смен.
+    """
+    from rollup import read_days, add_open_shift
+
+    now_ts = now_ts if now_ts is not None else datetime.now(timezone.utc).timestamp()
+    today = datetime.fromtimestamp(now_ts, DAY_TZ).date().isoformat()
+    segments = recent_segments(conn, now_ts - 24 * 3600, now_ts, user_id)
+
+    row = conn.execute(
+        "SELECT start_time, activity FROM shifts WHERE user_id IS ? AND end_time IS NULL ORDER BY id DESC LIMIT 1",
+        (user_id,)).fetchone()
+    open_shift = {"start_time": row[0], "activity": row[1]} if row else None
+    totals = add_open_shift(read_days(conn, user_id, today, today), open_shift, now_ts, today, today)
+    day = totals.get(today, {})
+    drive, other = day.get("drive", 0), day.get("other", 0)
+
+    cont = continuous_drive(segments, now_ts)
+    return {
+        "drive_today": int(drive),
+        "other_today": int(other),
+        "work_today": int(drive + other),
+        "continuous_drive": int(cont),
+        "next_break_in": int(max(0, CONT_DRIVE_LIMIT_S - cont)),
+        "activity": (open_shift["activity"] or LEGACY_ACTIVITY) if open_shift else None,
+    }
@@ -1,8 +1,9 @@
 # db.py
-from sqlalchemy import create_engine
+import os, sqlite3, time
+from sqlalchemy import create_engine, inspect, text, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DB_PATH = "database.db"
+DB_PATH = os.getenv("TT_DB_PATH", "database.db")
 
 # движок SQLite (при желании потом заменим на Postgres)
 engine = create_engine(
@@ -13,9 +14,82 @@ engine = create_engine(
 # фабрика сессий
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
-def create_tables() -> None:
-    """Создаёт все таблицы из models.py, если их ещё нет."""
+# ---------- наблюдатели за запросами ----------
+# fn(statement, params, seconds) вызывается после каждого SQL-запроса —
+# и из SQLAlchemy, и из «сырых» sqlite3-соединений (raw_connect)
+_query_listeners = []
+
+def add_query_listener(fn) -> None:
+    if fn not in _query_listeners:
+        _query_listeners.append(fn)
+
+def _notify(statement, params, seconds) -> None:
+    for fn in _query_listeners:
+        fn(statement, params, seconds)
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("tt_query_start", []).append(time.perf_counter())
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["tt_query_start"].pop()
+    if _query_listeners:
+        _notify(statement, parameters, time.perf_counter() - started)
+
+class _TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        if not _query_listeners:
+            return super().execute(sql, params)
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            _notify(sql, params, time.perf_counter() - t0)
+
+    def executemany(self, sql, seq):
+        if not _query_listeners:
+            return super().executemany(sql, seq)
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            _notify(sql, None, time.perf_counter() - t0)
+
+class _TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=_TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+def raw_connect(path: str = None) -> sqlite3.Connection:
+    """sqlite3.connect к той же базе, но с замером времени запросов."""
+    return sqlite3.connect(path or DB_PATH, factory=_TimedConnection)
+
+def create_tables(bind=None) -> None:
+    """Создаёт все таблицы из models.py, если их ещё нет (bind — другой движок, напр. для генератора)."""
     # импорт внутри функции, чтобы избежать циклических импортов
     from models import Base
-    Base.metadata.create_all(bind=engine)
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    _add_missing_columns(Base, bind)
+
+def _add_missing_columns(Base, bind) -> None:
+    """create_all не меняет существующие таблицы — докидываем новые nullable-колонки и индексы."""
+    insp = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            have = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in have and col.nullable:
+                    col_type = col.type.compile(dialect=bind.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}"))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
 
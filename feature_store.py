@@ -0,0 +1,196 @@
+# feature_store.py
+# Признаки классификатора активности по водителям — в одном массиве NumPy
+# (слот водителя × 9 признаков classifier.FEATURES), а не в объектах.
+#
+# Постоянные части вектора (bias, one-hot активности) пишутся на месте при
+# каждом событии: переход активности (записи fleet.py). Отсчёт телеметрии
+# обновляет среднюю скорость (экспоненциальное сглаживание с постоянной
+# TT_SPEED_TAU_SEC) на момент последнего отсчёта. Зависящие от времени
+# (stopMin, contDriveMin, час, avgSpeed) досчитываются при чтении одной
+# векторной операцией по колонкам since и sample_at: без новых отсчётов
+# скорость затухает к нулю с той же постоянной — водитель, чьё приложение
+# замолчало на ходу, не остаётся «едущим».
+# Пакетный скоринг и запросы диспетчера читают срезы массивов, без обхода
+# записей по одной. GET /api/fleet/moving — кто сейчас едет быстрее порога.
+
+from __future__ import annotations
+
+import os, math, time, threading
+from datetime import datetime
+
+import numpy as np
+from flask import request, jsonify
+
+from auth import require_auth
+from compliance import DAY_TZ
+from classifier import FEATURES, ACTIVITY_CODES
+from query_log import query_budget
+
+SPEED_TAU_S = float(os.getenv("TT_SPEED_TAU_SEC", "120"))
+_STOP, _CONT, _SIN, _COS, _SPEED = 1, 2, 3, 4, 5
+_ONE_HOT = 6
+MAX_LIMIT = 1000
+
+
+class FeatureStore:
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.Lock()
+        self.slots: dict[int, int] = {}
+        self.n = 0
+        self.x = np.zeros((capacity, len(FEATURES)), dtype=np.float64)
+        self.x[:, 0] = 1
+        self.uid = np.zeros(capacity, dtype=np.int64)
+        self.code = np.zeros(capacity, dtype=np.int8)       # classifier.ACTIVITY_CODES, 0 — нет активности
+        self.since = np.zeros(capacity, dtype=np.float64)   # начало текущей активности
+        self.speed = np.zeros(capacity, dtype=np.float64)   # средняя скорость на sample_at
+        self.sample_at = np.zeros(capacity, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def _slot(self, user_id: int) -> int:
+        """Слот водителя (новый — в конец, с удвоением массивов)."""
+        slot = self.slots.get(user_id)
+        if slot is not None:
+            return slot
+        if self.n == len(self.uid):
+            cap = 2 * len(self.uid)
+            x = np.zeros((cap, len(FEATURES)), dtype=np.float64)
+            x[:, 0] = 1
+            x[:self.n] = self.x[:self.n]
+            self.x = x
+            for name in ("uid", "code", "since", "speed", "sample_at"):
+                old = getattr(self, name)
+                new = np.zeros(cap, dtype=old.dtype)
+                new[:self.n] = old[:self.n]
+                setattr(self, name, new)
+        slot = self.slots[user_id] = self.n
+        self.uid[slot] = user_id
+        self.n += 1
+        return slot
+
+    # ----- события -----
+    def set_activity(self, user_id: int, activity: str | None, since: float | None) -> None:
+        code = ACTIVITY_CODES.get(activity, 0)
+        with self._lock:
+            slot = self._slot(user_id)
+            self.code[slot] = code
+            self.since[slot] = since if since is not None else 0.0
+            row = self.x[slot]
+            row[_ONE_HOT:_ONE_HOT + 3] = 0
+            if code:
+                row[_ONE_HOT + code - 1] = 1
+
+    def update_record(self, rec) -> None:
+        """Слушатель fleet.on_update: запись DriverStatus после перехода или пересверки."""
+        self.set_activity(rec.user_id, rec.activity, rec.since)
+
+    def add_samples(self, user_id: int, ts: np.ndarray, speed_kmh: np.ndarray) -> None:
+        """
+        Отсчёты телеметрии (ts по возрастанию): средняя скорость сглаживается
+        по времени между отсчётами, s += (1 - exp(-dt / tau)) * (v - s). Вся
+        пачка — одной формулой: вклад отсчёта i в итог затухает как
+        exp(-(t_n - t_i) / tau). Отсчёты не новее уже учтённых пропускаются.
+        """
+        with self._lock:
+            slot = self._slot(user_id)
+            prev = self.sample_at[slot]
+            new = ts > prev
+            ts, v = ts[new], speed_kmh[new]
+            if not len(ts):
+                return
+            dt = np.diff(ts, prepend=prev)
+            a = -np.expm1(-dt / SPEED_TAU_S)
+            if prev == 0:
+                a[0] = 1.0
+            s0 = self.speed[slot] * math.exp(-(ts[-1] - prev) / SPEED_TAU_S) if prev else 0.0
+            self.speed[slot] = s0 + float(np.dot(a * v, np.exp(-(ts[-1] - ts) / SPEED_TAU_S)))
+            self.sample_at[slot] = ts[-1]
+
+    def avg_speed(self, user_id: int) -> float | None:
+        """Средняя скорость на момент последнего отсчёта."""
+        slot = self.slots.get(user_id)
+        return None if slot is None else float(self.speed[slot])
+
+    # ----- чтение -----
+    @staticmethod
+    def _decayed(speed: np.ndarray, sample_at: np.ndarray, now_ts: float) -> np.ndarray:
+        """Средняя скорость на now_ts: без отсчётов после sample_at затухает как exp(-dt / tau)."""
+        age = np.maximum(0.0, now_ts - sample_at)
+        return np.where(sample_at > 0, speed * np.exp(-age / SPEED_TAU_S), 0.0)
+
+    @classmethod
+    def _fill(cls, x: np.ndarray, code: np.ndarray, since: np.ndarray,
+              speed: np.ndarray, sample_at: np.ndarray, now_ts: float) -> None:
+        """Зависящие от времени признаки на now_ts, на месте."""
+        x[:, _SPEED] = cls._decayed(speed, sample_at, now_ts)
+        running = np.where(code != 0, np.maximum(0.0, now_ts - since), 0.0) / 60
+        x[:, _STOP] = np.where(code > 1, running, 0.0)
+        x[:, _CONT] = np.where(code == 1, running, 0.0)
+        hour_rad = 2 * math.pi * datetime.fromtimestamp(now_ts, DAY_TZ).hour / 24
+        x[:, _SIN] = math.sin(hour_rad)
+        x[:, _COS] = math.cos(hour_rad)
+
+    def matrix(self, now_ts: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (user_ids, коды активности, признаки (n, 9)) на now_ts. Признаки
+        досчитываются на месте в общем массиве; возвращаются копии срезов,
+        чтобы писатели не меняли их под читателем.
+        """
+        with self._lock:
+            n = self.n
+            self._fill(self.x[:n], self.code[:n], self.since[:n], self.speed[:n], self.sample_at[:n], now_ts)
+            return self.uid[:n].copy(), self.code[:n].copy(), self.x[:n].copy()
+
+    def vector(self, user_id: int, now_ts: float) -> np.ndarray | None:
+        """Признаки одного водителя на now_ts (или None, если его нет в хранилище)."""
+        with self._lock:
+            slot = self.slots.get(user_id)
+            if slot is None:
+                return None
+            one = slice(slot, slot + 1)
+            x = self.x[one].copy()
+            self._fill(x, self.code[one], self.since[one], self.speed[one], self.sample_at[one], now_ts)
+            return x[0]
+
+    def moving(self, min_speed_kmh: float, activity_code: int | None = None,
+               limit: int = 100, now_ts: float | None = None) -> list[tuple[int, int, float]]:
+        """[(user_id, код активности, скорость на now_ts)] со скоростью ≥ порога, по убыванию скорости."""
+        now_ts = now_ts if now_ts is not None else time.time()
+        with self._lock:
+            n = self.n
+            speed = self._decayed(self.speed[:n], self.sample_at[:n], now_ts)
+            ok = speed >= min_speed_kmh
+            if activity_code is not None:
+                ok &= self.code[:n] == activity_code
+            idx = np.flatnonzero(ok)
+            idx = idx[np.argsort(-speed[idx], kind="stable")[:limit]]
+            return list(zip(self.uid[idx].tolist(), self.code[idx].tolist(), speed[idx].tolist()))
+
+
+store = FeatureStore()
+
+
+def init_app(app, fleet_status) -> None:
+    # подписка до старта потока fleet, чтобы увидеть прогрев
+    fleet_status.on_update(store.update_record)
+
+    @app.route("/api/fleet/moving", methods=["GET"])
+    @require_auth("admin", "dispatcher")
+    @query_budget(0)
+    def api_fleet_moving():
+        """?min_speed=км/ч &activity=drive|rest|other &limit= — по убыванию средней скорости."""
+        activity = request.args.get("activity") or None
+        if activity is not None and activity not in ACTIVITY_CODES:
+            return jsonify(error="invalid activity", allowed=list(ACTIVITY_CODES)), 422
+        try:
+            min_speed = float(request.args.get("min_speed", "5"))
+            limit = int(request.args.get("limit", "100"))
+        except ValueError:
+            return jsonify(error="min_speed must be a number, limit an integer"), 422
+        if not 1 <= limit <= MAX_LIMIT:
+            return jsonify(error=f"limit must be 1..{MAX_LIMIT}"), 422
+        names = ("none",) + tuple(ACTIVITY_CODES)
+        rows = store.moving(min_speed, ACTIVITY_CODES.get(activity), limit)
+        return jsonify(drivers=[{"user_id": uid, "activity": names[code] if code else None,
+                                 "avg_speed_kmh": round(speed, 1)} for uid, code, speed in rows]), 200
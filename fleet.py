@@ -0,0 +1,264 @@
+# fleet.py
+# Живой статус автопарка для диспетчера: кто сейчас едет / отдыхает / работает
+# и сколько езды у каждого осталось. Таблица в памяти, по записи на водителя
+# (__slots__), греется при старте из открытых смен и daily_totals, обновляется
+# на переходах активности (transitions.py) фоновым потоком. GET /api/fleet
+# отвечает из памяти, без SQLite; время идущей активности досчитывается
+# на момент запроса.
+#
+# Переход, обработанный другим воркером gunicorn, подхватывается пересверкой
+# открытых смен раз в TT_FLEET_RESYNC_SEC.
+
+from __future__ import annotations
+
+import os, time, queue, logging, threading
+from datetime import datetime
+from flask import request, jsonify
+
+import transitions
+from auth import require_auth
+import rollup
+from compliance import (today_counters, recent_segments, duty_start, parse_ts, DAY_TZ, LEGACY_ACTIVITY,
+                        CONT_DRIVE_LIMIT_S, BREAK_FULL_S, DAILY_DRIVE_S, WEEKLY_DRIVE_S, DUTY_SPAN_S)
+from db import raw_connect
+from query_log import query_budget
+
+log = logging.getLogger("triketime.fleet")
+
+ENABLED    = os.getenv("TT_FLEET", "1") != "0"
+RESYNC_SEC = float(os.getenv("TT_FLEET_RESYNC_SEC", "30"))
+MAX_PAGE   = 500
+
+ACTIVITIES = ("drive", "rest", "other", "off")
+SORTS = ("username", "drive_left", "break_in", "since")
+
+
+class DriverStatus:
+    """Состояние водителя на момент as_of; записи не меняются, а заменяются целиком."""
+    __slots__ = ("user_id", "username", "activity", "shift_id", "since",
+                 "drive_today", "other_today", "continuous", "drive_week", "rest_due", "as_of")
+
+    def __init__(self, user_id, username, activity=None, shift_id=None, since=None,
+                 drive_today=0, other_today=0, continuous=0, drive_week=0, rest_due=None, as_of=0.0):
+        self.user_id = user_id
+        self.username = username
+        self.activity = activity          # None — нет открытой активности
+        self.shift_id = shift_id
+        self.since = since
+        self.drive_today = drive_today
+        self.other_today = other_today
+        self.continuous = continuous
+        self.drive_week = drive_week      # езда с понедельника, включая сегодня
+        self.rest_due = rest_due          # когда должен начаться ежедневный отдых (unix)
+        self.as_of = as_of
+
+    def continuous_at(self, now_ts: float) -> float:
+        """Непрерывная езда на now_ts (без пересчёта дня — для частых фильтров)."""
+        if self.activity == "drive":
+            return self.continuous + max(0.0, now_ts - self.as_of)
+        if self.activity != "other" and now_ts - (self.since if self.activity else self.as_of) >= BREAK_FULL_S:
+            return 0                       # отдых/простой 45 мин — счётчик обнулён
+        return self.continuous
+
+    def view(self, now_ts: float, today: str) -> dict:
+        """Счётчики на now_ts: идущую активность досчитываем от as_of."""
+        dt = max(0.0, now_ts - self.as_of)
+        day = datetime.fromtimestamp(self.as_of, DAY_TZ).date()
+        same_day = day.isoformat() == today
+        drive = self.drive_today if same_day else 0
+        other = self.other_today if same_day else 0
+        week = self.drive_week if rollup.week_bounds(day)[1] >= today else 0
+        if self.activity == "drive":
+            drive += dt
+            week += dt
+        elif self.activity == "other":
+            other += dt
+        cont = self.continuous_at(now_ts)
+        return {
+            "user_id": self.user_id,
+            "username": self.username,
+            "activity": self.activity or "off",
+            "since": self.since,
+            "drive_today": int(drive),
+            "other_today": int(other),
+            "continuous_drive": int(cont),
+            "drive_left": int(max(0, DAILY_DRIVE_S - drive)),
+            "week_drive_left": int(max(0, WEEKLY_DRIVE_S - week)),
+            "break_in": int(max(0, CONT_DRIVE_LIMIT_S - cont)),
+            "rest_due": self.rest_due,
+        }
+
+
+class FleetStatus:
+    def __init__(self, resync_sec: float = RESYNC_SEC):
+        self.drivers: dict[int, DriverStatus] = {}
+        self.resync_sec = resync_sec
+        self.ready = threading.Event()
+        self._listeners: list = []
+        self._inbox: queue.Queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tt-fleet", daemon=True)
+
+    def on_transition(self, user_id, activity, ts) -> None:
+        if user_id is not None:
+            self._inbox.put(user_id)
+
+    def on_update(self, fn) -> None:
+        """fn(record) вызывается в потоке fleet после каждой замены записи."""
+        self._listeners.append(fn)
+
+    def _put(self, rec: DriverStatus) -> None:
+        self.drivers[rec.user_id] = rec
+        for fn in self._listeners:
+            fn(rec)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    # ----- загрузка из БД (только в потоке fleet) -----
+    def refresh(self, conn, user_id: int, now_ts: float | None = None, username: str | None = None) -> None:
+        now_ts = now_ts if now_ts is not None else time.time()
+        if username is None:
+            old = self.drivers.get(user_id)
+            username = old.username if old else None
+            if username is None:
+                row = conn.execute("SELECT username FROM users WHERE id = ?", (user_id,)).fetchone()
+                username = row[0] if row else str(user_id)
+        row = conn.execute(
+            "SELECT id, start_time, activity FROM shifts WHERE user_id = ? AND end_time IS NULL "
+            "ORDER BY id DESC LIMIT 1", (user_id,)).fetchone()
+        c = today_counters(conn, now_ts, user_id)
+        today = datetime.fromtimestamp(now_ts, DAY_TZ).date()
+        week_from, _ = rollup.week_bounds(today)
+        open_shift = {"start_time": row[1], "activity": row[2]} if row else None
+        week = rollup.add_open_shift(rollup.read_days(conn, user_id, week_from, today.isoformat()),
+                                     open_shift, now_ts, week_from, today.isoformat())
+        rest_due = None
+        if c["activity"] in ("drive", "other"):
+            start = duty_start(recent_segments(conn, now_ts - 24 * 3600, now_ts, user_id))
+            rest_due = start + DUTY_SPAN_S if start is not None else None
+        self._put(DriverStatus(
+            user_id, username,
+            activity=(row[2] or LEGACY_ACTIVITY) if row else None,
+            shift_id=row[0] if row else None,
+            since=parse_ts(row[1]) if row else None,
+            drive_today=c["drive_today"], other_today=c["other_today"],
+            continuous=c["continuous_drive"],
+            drive_week=sum(d.get("drive", 0) for d in week.values()),
+            rest_due=rest_due, as_of=now_ts))
+
+    def warm(self, conn) -> int:
+        """Все водители; счётчики — тем, у кого на этой неделе что-то было или есть открытая смена."""
+        now_ts = time.time()
+        today = datetime.fromtimestamp(now_ts, DAY_TZ).date().isoformat()
+        week_from, _ = rollup.week_bounds(datetime.fromtimestamp(now_ts, DAY_TZ).date())
+        busy = {r[0] for r in conn.execute(
+            "SELECT DISTINCT user_id FROM daily_totals WHERE day BETWEEN ? AND ?", (week_from, today))}
+        busy |= {r[0] for r in conn.execute(
+            "SELECT user_id FROM shifts WHERE end_time IS NULL AND user_id IS NOT NULL")}
+        for user_id, username in conn.execute("SELECT id, username FROM users WHERE role = 'driver'").fetchall():
+            if user_id in busy:
+                self.refresh(conn, user_id, now_ts, username)
+            else:
+                self._put(DriverStatus(user_id, username, as_of=now_ts))
+        return len(self.drivers)
+
+    def resync(self, conn) -> int:
+        """Переходы из других процессов: у кого открытая смена не та, что у нас, — перечитать."""
+        open_now = dict(conn.execute(
+            "SELECT user_id, MAX(id) FROM shifts WHERE end_time IS NULL AND user_id IS NOT NULL GROUP BY user_id"))
+        stale = [uid for uid, rec in self.drivers.items() if open_now.get(uid) != rec.shift_id]
+        stale += [uid for uid in open_now if uid not in self.drivers]
+        for user_id in stale:
+            self.refresh(conn, user_id)
+        return len(stale)
+
+    def _run(self) -> None:
+        conn = raw_connect()
+        try:
+            log.info("fleet: %d drivers loaded", self.warm(conn))
+            self.ready.set()
+            next_resync = time.monotonic() + self.resync_sec
+            while not self._stop.is_set():
+                users = set()
+                try:
+                    users.add(self._inbox.get(timeout=max(0.0, next_resync - time.monotonic())))
+                    while not self._inbox.empty():
+                        users.add(self._inbox.get_nowait())
+                except queue.Empty:
+                    pass
+                try:
+                    for uid in users:
+                        self.refresh(conn, uid)
+                    if time.monotonic() >= next_resync:
+                        self.resync(conn)
+                        next_resync = time.monotonic() + self.resync_sec
+                except Exception:
+                    log.exception("fleet update failed")
+        finally:
+            conn.close()
+
+    # ----- чтение (потоки запросов) -----
+    def query(self, activity: str | None = None, q: str | None = None, min_drive_left: int | None = None,
+              sort: str = "username", page: int = 1, per_page: int = 50, now_ts: float | None = None) -> dict:
+        now_ts = now_ts if now_ts is not None else time.time()
+        today = datetime.fromtimestamp(now_ts, DAY_TZ).date().isoformat()
+        q = q.lower() if q else None
+        rows = []
+        for rec in list(self.drivers.values()):
+            if activity and (rec.activity or "off") != activity:
+                continue
+            if q and q not in rec.username.lower():
+                continue
+            v = rec.view(now_ts, today)
+            if min_drive_left is not None and v["drive_left"] < min_drive_left:
+                continue
+            rows.append(v)
+        rows.sort(key=lambda v: (v[sort] is None, v[sort] or 0) if sort != "username" else v["username"])
+        start = (page - 1) * per_page
+        return {"total": len(rows), "page": page, "per_page": per_page, "items": rows[start:start + per_page]}
+
+
+fleet = FleetStatus()
+
+
+def _int_arg(name: str, default: int | None, lo: int, hi: int | None = None) -> int | None:
+    raw = request.args.get(name)
+    if raw is None or raw == "":
+        return default
+    value = int(raw)                       # ValueError -> 422 в вызывающем
+    if value < lo or (hi is not None and value > hi):
+        raise ValueError(name)
+    return value
+
+
+def init_app(app) -> None:
+    if not ENABLED:
+        return
+    transitions.subscribe(fleet.on_transition)
+    fleet.start()
+
+    @app.route("/api/fleet", methods=["GET"])
+    @require_auth("admin", "dispatcher")
+    @query_budget(0)
+    def api_fleet():
+        """?activity=drive|rest|other|off &q=имя &min_drive_left=сек &sort= &page= &per_page="""
+        activity = request.args.get("activity") or None
+        sort = request.args.get("sort", "username")
+        if activity is not None and activity not in ACTIVITIES:
+            return jsonify(error="invalid activity", allowed=list(ACTIVITIES)), 422
+        if sort not in SORTS:
+            return jsonify(error="invalid sort", allowed=list(SORTS)), 422
+        try:
+            page = _int_arg("page", 1, 1)
+            per_page = _int_arg("per_page", 50, 1, MAX_PAGE)
+            min_left = _int_arg("min_drive_left", None, 0)
+        except ValueError:
+            return jsonify(error="page, per_page and min_drive_left must be non-negative integers"), 422
+        if not fleet.ready.is_set():
+            return jsonify(error="fleet status is warming up"), 503
+        return jsonify(fleet.query(activity, request.args.get("q"), min_left, sort, page, per_page)), 200
@@ -0,0 +1,286 @@
+# ledger.py
+# Журнал жетонов и сокращённых отдыхов (token_ledger):
+#   drive10        — рабочий период (между ежедневными отдыхами от 9ч, см.
+#                    compliance.duty_periods) с ездой больше 9ч — жетон
+#                    продления до 10ч, 2 в неделю; день — начало периода;
+#   rest9          — ежедневный отдых 9–11ч (сокращённый, 3 между недельными;
+#                    упрощённо — 3 на неделю);
+#   weekly_reduced — недельный отдых 24–45ч; недостачу до 45ч нужно вернуть,
+#                    приложив к отдыху от 9ч, до конца третьей недели после.
+# Отдыхом считается и отдых, и промежуток без записей — как в compliance.py.
+#
+# Записи ведутся в той же транзакции, что и смены (on_close / on_start), а
+# compute_entries() выводит тот же журнал из истории целиком — им пользуется
+# пересборка:
+#
+#   python ledger.py rebuild [--db database.db] [--workers 4]
+
+from __future__ import annotations
+
+import os, sys, time, sqlite3, argparse, threading, multiprocessing
+from datetime import date, datetime, timedelta
+from cachetools import TTLCache
+
+import rollup
+from compliance import (parse_ts, recent_segments, duty_periods, DAY_TZ, LEGACY_ACTIVITY,
+                        DAILY_DRIVE_S, DAILY_REST_MIN_S)
+
+DAILY_REST_S        = 11 * 3600
+WEEKLY_REST_S       = 45 * 3600
+WEEKLY_REST_MIN_S   = 24 * 3600
+DRIVE10_PER_WEEK    = 2
+REST9_PER_WEEK      = 3
+COMP_WEEKS          = 3
+DUTY_LOOKBACK_S     = 48 * 3600   # on_close: начало периода ищем не дальше (без отдыха 9ч дольше — нарушение и так)
+
+_INSERT = """
+    INSERT INTO token_ledger (user_id, kind, day, week, seconds, comp_seconds, comp_due, compensated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, kind, day) DO UPDATE SET seconds = excluded.seconds
+"""
+
+# «сколько использовано на неделе»: user_id -> (week, {"drive10": n, "rest9": n});
+# запись в журнал сбрасывает запись, TTL ограничивает расхождение между воркерами
+_used = TTLCache(maxsize=int(os.getenv("TT_LEDGER_CACHE_SIZE", "50000")),
+                 ttl=float(os.getenv("TT_LEDGER_CACHE_TTL_SEC", "60")))
+_used_lock = threading.Lock()
+
+
+def _day(ts: float) -> date:
+    return datetime.fromtimestamp(ts, DAY_TZ).date()
+
+
+def _week(d: date) -> str:
+    return rollup.week_bounds(d)[0]
+
+
+def _comp_due(d: date) -> str:
+    """Последний день третьей недели после недели d."""
+    return rollup.week_bounds(d + timedelta(weeks=COMP_WEEKS))[1]
+
+
+def _rest_entries(rest_start: float, rest_end: float, pending: list) -> list[tuple]:
+    """
+    Записи для одного отдыха [rest_start, rest_end). pending — недостачи
+    [day, comp_seconds, comp_due, compensated_at] (список меняется на месте:
+    отдых от 9ч закрывает самую старую недостачу, которая в него помещается).
+    """
+    gap = rest_end - rest_start
+    day = _day(rest_start)
+    out = []
+    if gap >= DAILY_REST_MIN_S:
+        for p in pending:
+            if p[3] is None and p[2] >= day.isoformat() and gap - DAILY_REST_MIN_S >= p[1]:
+                p[3] = datetime.fromtimestamp(rest_end, DAY_TZ).isoformat()
+                break
+    if DAILY_REST_MIN_S <= gap < DAILY_REST_S:
+        out.append(["rest9", day.isoformat(), _week(day), int(gap), None, None, None])
+    elif WEEKLY_REST_MIN_S <= gap < WEEKLY_REST_S:
+        entry = ["weekly_reduced", day.isoformat(), _week(day), int(gap),
+                 int(WEEKLY_REST_S - gap), _comp_due(day), None]
+        out.append(entry)
+        pending.append([entry[1], entry[4], entry[5], None])
+    return out
+
+
+def compute_entries(segments) -> list[tuple]:
+    """
+    segments: закрытые (start, end, activity) одного водителя в unix-времени.
+    -> [(kind, day, week, seconds, comp_seconds, comp_due, compensated_at), ...]
+    """
+    segments = sorted(segments)
+    out = []
+    # езда за рабочий период больше 9ч
+    for start, _, sec in duty_periods(segments):
+        if int(round(sec)) > DAILY_DRIVE_S:
+            day = _day(start)
+            out.append(["drive10", day.isoformat(), _week(day), int(round(sec)), None, None, None])
+    # отдыхи — промежутки между не-отдыхом
+    pending: list = []
+    rests = []
+    prev_end = None
+    for s, e, activity in segments:
+        if activity == "rest":
+            continue
+        if prev_end is not None and s > prev_end:
+            rests.extend(_rest_entries(prev_end, s, pending))
+        prev_end = e if prev_end is None else max(prev_end, e)
+    # отметки о возврате недостачи — в записи weekly_reduced
+    done = {p[0]: p[3] for p in pending}
+    for r in rests:
+        if r[0] == "weekly_reduced":
+            r[6] = done.get(r[1])
+    return [tuple(r) for r in out + rests]
+
+
+# ---------- в транзакции записи смен ----------
+def _forget(user_id: int) -> None:
+    with _used_lock:
+        _used.pop(user_id, None)
+
+
+def _forget_all() -> None:
+    with _used_lock:
+        _used.clear()
+
+
+def on_close(conn, user_id: int | None, activity: str | None, start_s: str, end_s: str) -> None:
+    """
+    Закрыта смена: если это езда и в текущем рабочем периоде (с конца
+    последнего отдыха от 9ч) её больше 9ч — drive10 на день начала периода.
+    Вызывать после UPDATE end_time этой смены.
+    """
+    if user_id is None or (activity or LEGACY_ACTIVITY) != "drive":
+        return
+    start, end = parse_ts(start_s), parse_ts(end_s)
+    if start is None or end is None or end <= start:
+        return
+    duties = list(duty_periods(recent_segments(conn, end - DUTY_LOOKBACK_S, end, user_id)))
+    if not duties:
+        return
+    duty_start, _, sec = duties[-1]
+    if int(round(sec)) > DAILY_DRIVE_S:
+        day = _day(duty_start)
+        conn.execute(_INSERT, (user_id, "drive10", day.isoformat(), _week(day), int(round(sec)),
+                               None, None, None))
+        _forget(user_id)
+
+
+def on_start(conn, user_id: int | None, activity: str, ts: str) -> None:
+    """Начинается не-отдых: промежуток с конца прошлой работы — отдых, учитываем его."""
+    if user_id is None or activity == "rest":
+        return
+    start = parse_ts(ts)
+    row = conn.execute(
+        "SELECT end_time FROM shifts WHERE user_id = ? AND end_time IS NOT NULL "
+        "AND (activity IS NULL OR activity != 'rest') ORDER BY start_time DESC LIMIT 1",
+        (user_id,)).fetchone()
+    prev_end = parse_ts(row[0]) if row else None
+    if start is None or prev_end is None or start - prev_end < DAILY_REST_MIN_S:
+        return
+    pending = [list(r) for r in conn.execute(
+        "SELECT day, comp_seconds, comp_due, compensated_at FROM token_ledger "
+        "WHERE user_id = ? AND kind = 'weekly_reduced' AND compensated_at IS NULL ORDER BY day",
+        (user_id,))]
+    known = len(pending)
+    for entry in _rest_entries(prev_end, start, pending):
+        conn.execute(_INSERT, (user_id, *entry))
+    for p in pending[:known]:
+        if p[3] is not None:
+            conn.execute("UPDATE token_ledger SET compensated_at = ? "
+                         "WHERE user_id = ? AND kind = 'weekly_reduced' AND day = ?", (p[3], user_id, p[0]))
+    _forget(user_id)
+
+
+# ---------- чтение ----------
+def used_this_week(conn, user_id: int, week: str) -> dict:
+    """{"drive10": n, "rest9": n} за неделю; из памяти, если уже считали."""
+    with _used_lock:
+        hit = _used.get(user_id)
+    if hit is not None and hit[0] == week:
+        return hit[1]
+    used = {"drive10": 0, "rest9": 0}
+    for kind, n in conn.execute(
+            "SELECT kind, COUNT(*) FROM token_ledger WHERE user_id = ? AND week = ? GROUP BY kind",
+            (user_id, week)):
+        used[kind] = n
+    with _used_lock:
+        _used[user_id] = (week, used)
+    return used
+
+
+def summary(conn, user_id: int, now_ts: float | None = None) -> dict:
+    """Остатки на текущей неделе + незакрытые недостачи недельного отдыха."""
+    today = _day(now_ts if now_ts is not None else time.time())
+    week = _week(today)
+    used = used_this_week(conn, user_id, week)
+    drive10_today = conn.execute(
+        "SELECT 1 FROM token_ledger WHERE user_id = ? AND kind = 'drive10' AND day = ?",
+        (user_id, today.isoformat())).fetchone() is not None
+    pending = [
+        {"day": d, "comp_seconds": c, "comp_due": due, "overdue": due < today.isoformat()}
+        for d, c, due in conn.execute(
+            "SELECT day, comp_seconds, comp_due FROM token_ledger "
+            "WHERE user_id = ? AND kind = 'weekly_reduced' AND compensated_at IS NULL ORDER BY day",
+            (user_id,))
+    ]
+    return {
+        "week": week,
+        "drive10": {"used": used["drive10"], "left": max(0, DRIVE10_PER_WEEK - used["drive10"]),
+                    "today": drive10_today},
+        "rest9": {"used": used["rest9"], "left": max(0, REST9_PER_WEEK - used["rest9"])},
+        "pending_compensation": pending,
+    }
+
+
+# ---------- полная пересборка ----------
+def replace_range(conn, lo: int, hi: int, rows) -> None:
+    """Журнал пользователей lo..hi заменить на rows (user_id, *запись); commit делает вызывающий."""
+    conn.execute("DELETE FROM token_ledger WHERE user_id BETWEEN ? AND ?", (lo, hi))
+    conn.executemany(_INSERT, rows)
+    _forget_all()
+
+
+def _rebuild_range(job) -> list[tuple]:
+    db_path, lo, hi = job
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    out = []
+    try:
+        cur = conn.execute(
+            "SELECT user_id, start_time, end_time, activity FROM shifts "
+            "WHERE user_id BETWEEN ? AND ? AND end_time IS NOT NULL ORDER BY user_id", (lo, hi))
+        user, segs = None, []
+        for uid, s, e, activity in cur:
+            if uid != user:
+                if segs:
+                    out += [(user, *entry) for entry in compute_entries(segs)]
+                user, segs = uid, []
+            s, e = parse_ts(s), parse_ts(e)
+            if s is not None and e is not None and e > s:
+                segs.append((s, e, activity))
+        if segs:
+            out += [(user, *entry) for entry in compute_entries(segs)]
+    finally:
+        conn.close()
+    return out
+
+
+def rebuild(db_path: str, workers: int | None = None) -> int:
+    """Пересобирает token_ledger из shifts; пользователи делятся между процессами."""
+    workers = workers or os.cpu_count() or 1
+    conn = sqlite3.connect(db_path)
+    try:
+        jobs = [(db_path, lo, hi) for lo, hi in rollup.user_ranges(conn, workers * 4)]
+        total = 0
+        conn.execute("BEGIN")
+        conn.execute("DELETE FROM token_ledger")
+        with multiprocessing.Pool(workers) as pool:
+            for rows in pool.imap_unordered(_rebuild_range, jobs):
+                conn.executemany(_INSERT, rows)
+                total += len(rows)
+        conn.commit()
+    finally:
+        conn.close()
+    _forget_all()
+    return total
+
+
+def main(argv=None):
+    from db import DB_PATH, create_tables
+    from sqlalchemy import create_engine
+
+    ap = argparse.ArgumentParser(description="Журнал жетонов token_ledger")
+    ap.add_argument("command", choices=["rebuild"])
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    args = ap.parse_args(argv)
+
+    create_tables(create_engine(f"sqlite:///{args.db}"))
+    t0 = time.perf_counter()
+    n = rebuild(args.db, args.workers)
+    print(f"{args.db}: token_ledger rebuilt, {n} rows in {time.perf_counter() - t0:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
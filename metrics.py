@@ -0,0 +1,232 @@
+# metrics.py
+# Метрики запросов в формате Prometheus: гистограммы задержек по роутам,
+# запросы «в полёте», коды ответов, время в БД и в bcrypt.
+#
+# Под gunicorn у каждого воркера свой процесс, поэтому каждый воркер
+# периодически сбрасывает свой снимок в METRICS_DIR/<pid>.json, а /metrics
+# складывает снимки всех воркеров (счётчики и гистограммы — суммой,
+# in-flight — только по живым процессам).
+
+from __future__ import annotations
+
+import os, json, time, tempfile, threading
+from contextlib import contextmanager
+from flask import g, request, has_request_context, Response
+
+from db import add_query_listener
+
+ENABLED     = os.getenv("TT_METRICS", "1") == "1"
+METRICS_DIR = os.getenv("TT_METRICS_DIR") or os.path.join(
+    tempfile.gettempdir(), f"triketime-metrics-{os.getppid()}"
+)
+FLUSH_SEC   = float(os.getenv("TT_METRICS_FLUSH_SEC", "1"))
+
+# границы корзин (сек), как у prometheus_client по умолчанию
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "tt_http_request_seconds":   ("histogram", "Request latency by route"),
+    "tt_http_db_seconds":        ("histogram", "Time spent in SQL per request"),
+    "tt_bcrypt_seconds":         ("histogram", "Time spent in bcrypt"),
+    "tt_http_requests_total":    ("counter",   "Requests by route, method and status"),
+    "tt_http_requests_in_flight":("gauge",     "Requests currently being served"),
+    "tt_db_locked_total":        ("counter",   "Requests failed with SQLite 'database is locked'"),
+}
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()     # запись снимка в файл (flush)
+_counters: dict[str, dict[str, float]] = {}
+_hists: dict[str, dict[str, list]] = {}      # labels -> [bucket counts..., sum, count]
+_gauges: dict[str, dict[str, float]] = {}
+_flushed_at = 0.0
+
+
+def _labels(**kw) -> str:
+    return ",".join(f'{k}="{v}"' for k, v in kw.items())
+
+
+# ---------- примитивы ----------
+def inc(name: str, labels: str, value: float = 1) -> None:
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + value
+
+
+def gauge_add(name: str, labels: str, value: float) -> None:
+    with _lock:
+        series = _gauges.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + value
+
+
+def observe(name: str, labels: str, seconds: float) -> None:
+    with _lock:
+        h = _hists.setdefault(name, {}).get(labels)
+        if h is None:
+            h = _hists[name][labels] = [0] * (len(BUCKETS) + 2)
+        for i, le in enumerate(BUCKETS):
+            if seconds <= le:
+                h[i] += 1
+                break
+        h[-2] += seconds
+        h[-1] += 1
+
+
+@contextmanager
+def timed(name: str, labels: str = ""):
+    """with metrics.timed("tt_bcrypt_seconds"): ... — замер куска кода."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if ENABLED:
+            observe(name, labels, time.perf_counter() - t0)
+
+
+# ---------- обмен между воркерами ----------
+def _snapshot() -> dict:
+    with _lock:
+        return {
+            "counters": {k: dict(v) for k, v in _counters.items()},
+            "hists": {k: {l: list(h) for l, h in v.items()} for k, v in _hists.items()},
+            "gauges": {k: dict(v) for k, v in _gauges.items()},
+        }
+
+
+def flush(force: bool = False) -> None:
+    global _flushed_at
+    now = time.monotonic()
+    if not force and now - _flushed_at < FLUSH_SEC:
+        return
+    # один <pid>.json.tmp на воркер: пишет только один поток, остальные
+    # (кроме force) не ждут — снимок и так свежий
+    if not _flush_lock.acquire(blocking=force):
+        return
+    try:
+        _flushed_at = now
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(_snapshot(), f)
+        os.replace(tmp, path)
+    finally:
+        _flush_lock.release()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+
+def collect() -> dict:
+    """Сумма снимков всех воркеров."""
+    flush(force=True)
+    total = {"counters": {}, "hists": {}, "gauges": {}}
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric, series in snap["counters"].items():
+            dst = total["counters"].setdefault(metric, {})
+            for l, v in series.items():
+                dst[l] = dst.get(l, 0) + v
+        for metric, series in snap["hists"].items():
+            dst = total["hists"].setdefault(metric, {})
+            for l, h in series.items():
+                acc = dst.setdefault(l, [0] * len(h))
+                for i, v in enumerate(h):
+                    acc[i] += v
+        if _pid_alive(int(name[:-5])):
+            for metric, series in snap["gauges"].items():
+                dst = total["gauges"].setdefault(metric, {})
+                for l, v in series.items():
+                    dst[l] = dst.get(l, 0) + v
+    return total
+
+
+def render(total: dict) -> str:
+    """Текстовый формат Prometheus 0.0.4."""
+    out = []
+
+    def header(metric):
+        kind, text = HELP.get(metric, ("untyped", metric))
+        out.append(f"# HELP {metric} {text}")
+        out.append(f"# TYPE {metric} {kind}")
+
+    for metric, series in sorted(total["counters"].items()):
+        header(metric)
+        for l, v in sorted(series.items()):
+            out.append(f"{metric}{{{l}}} {v}")
+    for metric, series in sorted(total["gauges"].items()):
+        header(metric)
+        for l, v in sorted(series.items()):
+            out.append(f"{metric}{{{l}}} {v}")
+    for metric, series in sorted(total["hists"].items()):
+        header(metric)
+        for l, h in sorted(series.items()):
+            sep = "," if l else ""
+            cum = 0
+            for le, n in zip(BUCKETS, h):
+                cum += n
+                out.append(f'{metric}_bucket{{{l}{sep}le="{le}"}} {cum}')
+            out.append(f'{metric}_bucket{{{l}{sep}le="+Inf"}} {h[-1]}')
+            out.append(f"{metric}_sum{{{l}}} {h[-2]}")
+            out.append(f"{metric}_count{{{l}}} {h[-1]}")
+    return "\n".join(out) + "\n"
+
+
+# ---------- хуки Flask ----------
+def _on_query(statement, params, seconds) -> None:
+    if has_request_context() and "tt_t0" in g:
+        g.tt_db += seconds
+
+
+def _route() -> str:
+    rule = request.url_rule
+    return rule.rule if rule is not None else "<unmatched>"
+
+
+def _before():
+    g.tt_t0 = time.perf_counter()
+    g.tt_db = 0.0
+    g.tt_route = _route()
+    gauge_add("tt_http_requests_in_flight", _labels(route=g.tt_route), 1)
+
+
+def _after(resp):
+    g.tt_status = resp.status_code
+    return resp
+
+
+def _teardown(exc):
+    t0 = g.pop("tt_t0", None)
+    if t0 is None:
+        return
+    route = g.tt_route
+    status = g.get("tt_status", 500 if exc else 200)
+    rl = _labels(route=route)
+    observe("tt_http_request_seconds", rl, time.perf_counter() - t0)
+    observe("tt_http_db_seconds", rl, g.tt_db)
+    inc("tt_http_requests_total", _labels(route=route, method=request.method, status=status))
+    gauge_add("tt_http_requests_in_flight", rl, -1)
+    flush()
+
+
+def init_app(app) -> None:
+    if not ENABLED:
+        return
+    add_query_listener(_on_query)
+    app.before_request(_before)
+    app.after_request(_after)
+    app.teardown_request(_teardown)
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics_endpoint():
+        return Response(render(collect()), mimetype="text/plain; version=0.0.4")
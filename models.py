@@ -3,7 +3,7 @@
 
 from datetime import datetime
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, Integer, DateTime, ForeignKey, Boolean, func
+from sqlalchemy import String, Integer, DateTime, ForeignKey, Boolean, Index, UniqueConstraint, LargeBinary, func, text
 
 
 class Base(DeclarativeBase):
@@ -32,7 +32,101 @@ class RefreshToken(Base):
 
 class Shift(Base):
     __tablename__ = "shifts"
+    __table_args__ = (
+        # история водителя по времени — основной путь чтения
+        Index("ix_shifts_user_start", "user_id", "start_time"),
+        # открытые смены (end_time IS NULL) — текущая активность водителя
+        Index("ix_shifts_open", "user_id", sqlite_where=text("end_time IS NULL")),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int | None] = mapped_column(ForeignKey("users.id"), nullable=True)
     start_time: Mapped[str] = mapped_column(String, nullable=False)
     end_time: Mapped[str | None] = mapped_column(String, nullable=True)
+    activity: Mapped[str | None] = mapped_column(String(16), nullable=True)
+
+
+class DailyTotal(Base):
+    """Итоги за день по активности (см. rollup.py); user_id = 0 — смены без пользователя."""
+    __tablename__ = "daily_totals"
+    __table_args__ = (
+        # срез «сегодня» по всему автопарку (fleet.py)
+        Index("ix_daily_totals_day", "day"),
+    )
+
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    day: Mapped[str] = mapped_column(String(10), primary_key=True)        # YYYY-MM-DD в TT_TZ
+    activity: Mapped[str] = mapped_column(String(16), primary_key=True)
+    seconds: Mapped[int] = mapped_column(Integer, default=0)
+    segments: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class TokenLedger(Base):
+    """Жетоны продления и сокращённые отдыхи (см. ledger.py); одна запись на вид и день."""
+    __tablename__ = "token_ledger"
+    __table_args__ = (
+        UniqueConstraint("user_id", "kind", "day", name="uq_token_ledger_day"),
+        Index("ix_token_ledger_user_week", "user_id", "week"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer)
+    kind: Mapped[str] = mapped_column(String(16))             # drive10 | rest9 | weekly_reduced
+    day: Mapped[str] = mapped_column(String(10))              # YYYY-MM-DD в TT_TZ
+    week: Mapped[str] = mapped_column(String(10))             # понедельник недели
+    seconds: Mapped[int] = mapped_column(Integer)             # езда за день или длина отдыха
+    comp_seconds: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    comp_due: Mapped[str | None] = mapped_column(String(10), nullable=True)
+    compensated_at: Mapped[str | None] = mapped_column(String, nullable=True)
+
+
+class RebuildPart(Base):
+    """План пересборки производных таблиц (см. rebuild.py): диапазон пользователей и отметка о готовности."""
+    __tablename__ = "rebuild_parts"
+    __table_args__ = (
+        Index("ix_rebuild_parts_run", "run"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    run: Mapped[str] = mapped_column(String)                    # время старта пересборки, ISO
+    targets: Mapped[str] = mapped_column(String)                # rollup,ledger,alerts
+    lo: Mapped[int] = mapped_column(Integer)                    # user_id от/до; 0..0 — смены без пользователя
+    hi: Mapped[int] = mapped_column(Integer)
+    users: Mapped[int] = mapped_column(Integer)
+    shifts: Mapped[int] = mapped_column(Integer)
+    rows: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    took_ms: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    done_at: Mapped[str | None] = mapped_column(String, nullable=True)
+    session: Mapped[str | None] = mapped_column(String, nullable=True)  # старт запуска, который взял часть, ISO
+
+
+class Alert(Base):
+    """Сработавшие серверные напоминания (см. alerts.py); одно на вид и открытую смену."""
+    __tablename__ = "alerts"
+    __table_args__ = (
+        UniqueConstraint("user_id", "shift_id", "kind", name="uq_alerts_shift_kind"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    shift_id: Mapped[int] = mapped_column(Integer)
+    kind: Mapped[str] = mapped_column(String(32))          # break_due / drive_9h / drive_10h / rest_due
+    due_at: Mapped[str] = mapped_column(String)            # ISO UTC
+    created_at: Mapped[str] = mapped_column(String)        # ISO UTC
+    message: Mapped[str] = mapped_column(String(255))
+
+
+class TelemetryChunk(Base):
+    """Пачка отсчётов GPS одного водителя в сжатом колоночном виде (см. telemetry.py)."""
+    __tablename__ = "telemetry_chunks"
+    __table_args__ = (
+        Index("ix_telemetry_chunks_user_res_t0", "user_id", "res", "t0"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer)
+    res: Mapped[int] = mapped_column(Integer, default=0)   # шаг уровня, с: 0 — как пришло (~1 Гц), 10, 60
+    t0: Mapped[int] = mapped_column(Integer)               # первый отсчёт, unix ms
+    t1: Mapped[int] = mapped_column(Integer)               # последний отсчёт, unix ms
+    n: Mapped[int] = mapped_column(Integer)
+    data: Mapped[bytes] = mapped_column(LargeBinary)       # telemetry.encode
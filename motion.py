@@ -0,0 +1,274 @@
+# motion.py
+# Автоопределение езды и стоянки по телеметрии (telemetry.py): водители
+# забывают нажать «Езда»/«Отдых».
+#
+# На водителя — автомат с гистерезисом по скорости и времени (четыре числа
+# состояния): «едет» — скорость ≥ TT_MOTION_MOVE_KMH дольше
+# TT_MOTION_MOVE_SEC, «стоит» — ≤ TT_MOTION_STOP_KMH дольше
+# TT_MOTION_STOP_SEC. Скорость между порогами (пробка, ходьба с телефоном)
+# сбрасывает отсчёт, так что медленная езда не рвёт «езду». Отсчёты
+# обрабатываются по мере прихода, каждый за O(1).
+#
+# Срабатывают только смены состояния автомата, а не уровни: если водитель сам
+# поставил «Прочее» на ходу (второй водитель, паром), его не переключают, пока
+# автомат снова не увидит остановку и движение. Езда предлагается, если
+# сейчас не «drive»; стоянка — только если сейчас «drive» (предлагается
+# TT_MOTION_STOP_ACTIVITY). TT_MOTION=suggest (по умолчанию) — только
+# подсказка в GET /api/motion, auto — сразу start_activity() из app.py с
+# началом в момент, когда движение/стоянка началась; off — выключено.
+#
+# Состояние в памяти процесса, как у fleet.py: при нескольких воркерах
+# пачки одного водителя должны приходить в один (sticky-маршрутизация).
+#
+#   python motion.py replay [--db database.db] [--users 1,2] [--from ISO] [--to ISO]
+#   — прогнать автомат по записанной телеметрии и сравнить с записанными сменами
+
+from __future__ import annotations
+
+import os, sys, time, argparse, threading
+
+import numpy as np
+from flask import request, jsonify
+
+import telemetry
+from auth import require_auth
+from compliance import parse_ts
+from query_log import query_budget
+
+MODE          = os.getenv("TT_MOTION", "suggest")           # suggest | auto | off
+MOVE_KMH      = float(os.getenv("TT_MOTION_MOVE_KMH", "10"))
+STOP_KMH      = float(os.getenv("TT_MOTION_STOP_KMH", "3"))
+MOVE_S        = float(os.getenv("TT_MOTION_MOVE_SEC", "60"))
+STOP_S        = float(os.getenv("TT_MOTION_STOP_SEC", "180"))
+STOP_ACTIVITY = os.getenv("TT_MOTION_STOP_ACTIVITY", "rest")
+
+UNKNOWN, MOVING, STOPPED = 0, 1, 2
+STATE_NAMES = ("unknown", "moving", "stopped")
+
+
+class Detector:
+    __slots__ = ("state", "cand", "cand_since", "last_t")
+
+    def __init__(self):
+        self.state = UNKNOWN
+        self.cand = UNKNOWN
+        self.cand_since = 0.0
+        self.last_t = 0.0
+
+    def step(self, t: float, speed_kmh: float) -> tuple[int, float] | None:
+        """Отсчёт (t, км/ч); при смене состояния — (новое, когда оно началось)."""
+        if t <= self.last_t:
+            return None
+        self.last_t = t
+        if speed_kmh >= MOVE_KMH:
+            want, hold = MOVING, MOVE_S
+        elif speed_kmh <= STOP_KMH:
+            want, hold = STOPPED, STOP_S
+        else:
+            self.cand = UNKNOWN
+            return None
+        if want == self.state:
+            self.cand = UNKNOWN
+            return None
+        if want != self.cand:
+            self.cand, self.cand_since = want, t
+        if t - self.cand_since < hold:
+            return None
+        self.state, self.cand = want, UNKNOWN
+        return want, self.cand_since
+
+
+def detect(t: np.ndarray, speed: np.ndarray, det: Detector | None = None) -> list[tuple[int, float, float]]:
+    """Все смены состояния на треке: [(состояние, начало, когда замечено)]."""
+    det = det or Detector()
+    out = []
+    for ti, vi in zip(t.tolist(), speed.tolist()):
+        ev = det.step(ti, vi)
+        if ev:
+            out.append((ev[0], ev[1], ti))
+    return out
+
+
+class MotionTracker:
+    def __init__(self, mode: str = MODE):
+        self.mode = mode
+        self.detectors: dict[int, Detector] = {}
+        self.proposals: dict[int, dict] = {}
+        self._lock = threading.Lock()
+        self._current = lambda user_id: None
+        self._start = None
+
+    def bind(self, current, start) -> None:
+        """current(user_id) -> открытая активность или None; start — app.start_activity."""
+        self._current, self._start = current, start
+
+    def feed(self, user_id: int, t: np.ndarray, speed: np.ndarray) -> int:
+        """Принятые отсчёты водителя (t — секунды, по возрастанию); возвращает число срабатываний."""
+        with self._lock:
+            det = self.detectors.get(user_id)
+            if det is None:
+                det = self.detectors[user_id] = Detector()
+            events = detect(t, speed, det)
+        for state, since, seen in events:
+            self._act(user_id, state, since, seen)
+        return len(events)
+
+    def _act(self, user_id: int, state: int, since: float, seen: float) -> None:
+        current = self._current(user_id)
+        if state == MOVING and current != "drive":
+            activity = "drive"
+        elif state == STOPPED and current == "drive":
+            activity = STOP_ACTIVITY
+        else:
+            return
+        proposal = {"activity": activity, "reason": STATE_NAMES[state], "current": current,
+                    "since": int(since * 1000), "at": int(seen * 1000), "applied": False}
+        if self.mode == "auto" and self._start is not None:
+            proposal["applied"] = self._start(user_id, activity, at=since, keep_same=True) is not None
+        self.proposals[user_id] = proposal
+
+    def view(self, user_id: int) -> dict:
+        det = self.detectors.get(user_id)
+        return {"mode": self.mode,
+                "state": STATE_NAMES[det.state] if det else "unknown",
+                "proposal": self.proposals.get(user_id)}
+
+
+tracker = MotionTracker()
+
+
+def init_app(app, fleet_status, start_activity) -> None:
+    if tracker.mode == "off":
+        return
+
+    def current(user_id):
+        rec = fleet_status.drivers.get(user_id)
+        return rec.activity if rec else None
+
+    tracker.bind(current, start_activity)
+    telemetry.on_samples(tracker.feed)
+
+    @app.route("/api/motion", methods=["GET"])
+    @require_auth()
+    @query_budget(0)
+    def api_motion():
+        """Состояние автомата водителя и последнее предложение (или применённое переключение)."""
+        return jsonify(tracker.view(request.user_id)), 200
+
+
+# ---------- replay ----------
+def recorded(conn, user_id: int, t_from: float, t_to: float) -> tuple[np.ndarray, np.ndarray]:
+    """Отрезки езды по сменам: (starts, ends) unix-секунд, обрезанные по периоду."""
+    rows = conn.execute(
+        "SELECT (julianday(start_time) - 2440587.5) * 86400.0, "
+        "       COALESCE((julianday(end_time) - 2440587.5) * 86400.0, ?) "
+        "FROM shifts WHERE user_id = ? AND (activity = 'drive' OR activity IS NULL) ORDER BY start_time",
+        (t_to, user_id)).fetchall()
+    a = np.array(rows, dtype=np.float64).reshape(-1, 2)
+    a = a[(a[:, 0] < t_to) & (a[:, 1] > t_from)]
+    return np.clip(a[:, 0], t_from, t_to), np.clip(a[:, 1], t_from, t_to)
+
+
+def _in_intervals(t: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    if not len(starts):
+        return np.zeros(len(t), dtype=bool)
+    i = np.searchsorted(starts, t, side="right") - 1
+    return (i >= 0) & (t < ends[np.maximum(i, 0)])
+
+
+def replay_user(conn, user_id: int, t_from: float, t_to: float, tolerance_s: float = 300) -> dict | None:
+    """
+    Автомат по записанному треку против записанных смен: доля отсчётов, где
+    «едет» совпало с «drive», и начала/концы езды, найденные в пределах
+    tolerance_s (с задержкой обнаружения).
+    """
+    cols = telemetry.read(conn, user_id, int(t_from * 1000), int(t_to * 1000))
+    if not cols.shape[1]:
+        return None
+    t, speed = cols[0] / 1000, cols[3]
+    events = detect(t, speed)
+    d_start, d_end = recorded(conn, user_id, t_from, t_to)
+
+    # «едет» по автомату на каждом отсчёте: состояние после последнего события
+    moving = np.zeros(len(t), dtype=bool)
+    if events:
+        ev_t = np.array([seen for _, _, seen in events])
+        ev_moving = np.array([state == MOVING for state, _, _ in events], dtype=bool)
+        k = np.searchsorted(ev_t, t, side="right") - 1
+        moving = (k >= 0) & ev_moving[np.maximum(k, 0)]
+    truth = _in_intervals(t, d_start, d_end)
+
+    def matched(true_at: np.ndarray, found: list[tuple[float, float]]) -> tuple[int, list[float]]:
+        hits, delays = 0, []
+        since = np.array([s for s, _ in found])
+        for x in true_at.tolist():
+            j = np.flatnonzero(np.abs(since - x) <= tolerance_s)
+            if len(j):
+                hits += 1
+                delays.append(found[j[0]][1] - x)
+        return hits, delays
+
+    starts_found = [(since, seen) for state, since, seen in events if state == MOVING]
+    stops_found = [(since, seen) for state, since, seen in events if state == STOPPED]
+    hit_s, delay_s = matched(d_start[(d_start > t[0]) & (d_start < t[-1])], starts_found)
+    hit_e, delay_e = matched(d_end[(d_end > t[0]) & (d_end < t[-1])], stops_found)
+    n_s = int(((d_start > t[0]) & (d_start < t[-1])).sum())
+    n_e = int(((d_end > t[0]) & (d_end < t[-1])).sum())
+    return {
+        "user_id": user_id, "samples": int(len(t)),
+        "agreement": round(float((moving == truth).mean()), 4),
+        "drive_starts": n_s, "starts_found": hit_s, "false_starts": len(starts_found) - hit_s,
+        "drive_ends": n_e, "ends_found": hit_e, "false_ends": len(stops_found) - hit_e,
+        "median_delay_s": round(float(np.median(delay_s + delay_e)), 1) if delay_s or delay_e else None,
+    }
+
+
+def main(argv=None):
+    from db import DB_PATH, raw_connect
+
+    ap = argparse.ArgumentParser(description="Автоопределение езды по телеметрии")
+    ap.add_argument("command", choices=["replay"])
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--users", help="через запятую; по умолчанию все с телеметрией")
+    ap.add_argument("--from", dest="t_from", help="ISO, по умолчанию 30 дней назад")
+    ap.add_argument("--to", dest="t_to", help="ISO, по умолчанию сейчас")
+    ap.add_argument("--tolerance", type=float, default=300, help="секунд на совпадение начала/конца езды")
+    args = ap.parse_args(argv)
+
+    t_to = parse_ts(args.t_to) if args.t_to else time.time()
+    t_from = parse_ts(args.t_from) if args.t_from else t_to - 30 * 86400
+    if t_from is None or t_to is None:
+        ap.error("--from and --to must be ISO times")
+    conn = raw_connect(args.db)
+    try:
+        if args.users:
+            users = [int(u) for u in args.users.split(",") if u]
+        else:
+            users = [r[0] for r in conn.execute("SELECT DISTINCT user_id FROM telemetry_chunks ORDER BY user_id")]
+        total = {"samples": 0, "agree": 0.0, "drive_starts": 0, "starts_found": 0, "false_starts": 0,
+                 "drive_ends": 0, "ends_found": 0, "false_ends": 0}
+        t0 = time.perf_counter()
+        for user_id in users:
+            r = replay_user(conn, user_id, t_from, t_to, args.tolerance)
+            if r is None:
+                continue
+            print(f"user {user_id}: {r['samples']:,} samples, agreement {r['agreement']:.1%}, "
+                  f"starts {r['starts_found']}/{r['drive_starts']} (+{r['false_starts']} false), "
+                  f"ends {r['ends_found']}/{r['drive_ends']} (+{r['false_ends']} false), "
+                  f"median delay {r['median_delay_s']}s")
+            total["samples"] += r["samples"]
+            total["agree"] += r["agreement"] * r["samples"]
+            for key in ("drive_starts", "starts_found", "false_starts", "drive_ends", "ends_found", "false_ends"):
+                total[key] += r[key]
+        took = time.perf_counter() - t0
+    finally:
+        conn.close()
+    n = max(1, total["samples"])
+    print(f"total: {total['samples']:,} samples in {took:.1f}s, agreement {total['agree'] / n:.1%}, "
+          f"starts {total['starts_found']}/{total['drive_starts']} (+{total['false_starts']} false), "
+          f"ends {total['ends_found']}/{total['drive_ends']} (+{total['false_ends']} false)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+# planner.py
+# Где и когда останавливаться на запланированном маршруте, чтобы приехать
+# легально и как можно раньше.
+#
+# Маршрут — точки, где можно встать (стоянки, заправки, адреса доставки):
+# для каждой drive_s — езда от предыдущей точки и dwell_s — работа на месте
+# (погрузка и т.п.). Перерывы и отдых берутся только в точках. Правила — те же
+# упрощённые ЕС 561, что в compliance.py: 4ч30м непрерывной езды, перерыв 45
+# или 15+30, 9ч езды в день (10ч по жетону продления, drive10-1/drive10-2 в
+# core.js), отдых 11ч (или сокращённый 9ч) не позже 13ч от начала смены.
+#
+# Поиск — динамическое программирование: оставшееся время до прибытия
+# зависит только от (точка, непрерывная езда, езда за день, время с начала
+# смены, половинка перерыва, жетоны, сокращённые отдыхи). Проход вперёд
+# собирает достижимые в каждой точке состояния (недопустимые ветки
+# отсекаются сразу), проход назад — лучшее время от каждого; циклы без
+# рекурсии, так что длина маршрута не упирается в предел стека.
+# Жетоны и сокращённые отдыхи водителя берутся из журнала (ledger.py).
+
+from __future__ import annotations
+
+from dataclasses import dataclass, fields
+
+import ledger
+from compliance import (today_counters, recent_segments, duty_start,
+                        CONT_DRIVE_LIMIT_S, BREAK_FULL_S, BREAK_SPLIT_2_S,
+                        DAILY_DRIVE_S, DAILY_DRIVE_EXT_S, DAILY_REST_MIN_S, DUTY_SPAN_S)
+
+DAILY_REST_S = 11 * 3600
+MAX_STOPS = 2000
+MAX_ROUTES = 500
+INF = float("inf")
+
+
+@dataclass(frozen=True)
+class DriverState:
+    """Состояние водителя на момент выезда (секунды)."""
+    continuous_drive: int = 0
+    drive_today: int = 0
+    duty: int = 0                  # с начала текущего рабочего периода
+    had_15: bool = False           # первая часть разделённого перерыва уже была
+    ext_tokens: int = 2            # жетоны 10ч на неделю
+    ext_today: bool = False        # жетон на сегодня уже списан
+    reduced_rests: int = 3         # сокращённые отдыхи 9ч между недельными
+
+
+# Перерыв или отдых выгоднее брать как можно позже: длительность та же, а
+# обнуляет он больше накопленного. Поэтому в точке что-то делаем, только если
+# следующий участок без этого не проехать (или только по жетону). По той же
+# причине 15+30 не быстрее 45 и отдельно не перебирается — кроме случая, когда
+# первые 15 мин водитель уже отстоял до выезда.
+def _options(cont, daily, duty, had15, tokens, ext_today, reduced):
+    """Действия в точке: (название, длительность, состояние после действия)."""
+    if cont > 0:
+        dur = BREAK_SPLIT_2_S if had15 else BREAK_FULL_S
+        yield ("break30" if had15 else "break45"), dur, (0, daily, duty + dur, False, tokens, ext_today, reduced)
+    if duty > 0:
+        yield "rest11", DAILY_REST_S, (0, 0, 0, False, tokens, False, reduced)
+        if reduced > 0:
+            yield "rest9", DAILY_REST_MIN_S, (0, 0, 0, False, tokens, False, reduced - 1)
+
+
+def _drive(d, w, cont, daily, duty, had15, tokens, ext_today, reduced, use_token: bool):
+    """Состояние после участка d и работы w в точке или None, если так не проехать."""
+    cont, daily, duty = cont + d, daily + d, duty + d + w
+    if cont > CONT_DRIVE_LIMIT_S or duty > DUTY_SPAN_S:
+        return None
+    if daily > DAILY_DRIVE_S and not ext_today:
+        if not use_token or tokens == 0:
+            return None
+        tokens, ext_today = tokens - 1, True
+    if daily > (DAILY_DRIVE_EXT_S if ext_today else DAILY_DRIVE_S):
+        return None
+    return cont, daily, duty, had15, tokens, ext_today, reduced
+
+
+def plan_breaks(stops: list[dict], state: DriverState = DriverState()) -> dict | None:
+    """
+    stops: [{"drive_s": езда от предыдущей точки, "dwell_s": работа в точке, "name": ...}, ...],
+    первая точка — место выезда (drive_s игнорируется).
+    Возвращает {"arrival_s", "drive_s", "stops": [...]} или None, если доехать легально нельзя.
+    """
+    n = len(stops)
+    drive = [int(s.get("drive_s", 0)) for s in stops]
+    dwell = [int(s.get("dwell_s", 0)) for s in stops]
+
+    def options(i, state):
+        """Варианты на отъезде из точки i: (действие, длительность, состояние в i + 1)."""
+        d, w = drive[i + 1], dwell[i + 1]
+        nxt = _drive(d, w, *state, use_token=False)
+        if nxt is not None:
+            opts = [("none", 0, nxt)]
+        else:
+            opts = [("none", 0, _drive(d, w, *state, use_token=True))]
+            opts += [(name, dur, _drive(d, w, *after, use_token=True))
+                     for name, dur, after in _options(*state)]
+        return [o for o in opts if o[2] is not None]
+
+    start = (state.continuous_drive, state.drive_today, state.duty, state.had_15,
+             state.ext_tokens, state.ext_today, state.reduced_rests)
+    # вперёд: достижимые состояния в каждой точке (без рекурсии — глубина = длина маршрута)
+    layers = [{start: None}]
+    for i in range(n - 1):
+        nxt_layer = {}
+        for st in layers[i]:
+            opts = options(i, st)
+            layers[i][st] = opts
+            for _, _, nxt in opts:
+                nxt_layer[nxt] = None
+        layers.append(nxt_layer)
+    # назад: best[i][состояние] = (минимальное время до прибытия в последнюю, первое действие)
+    best = [None] * n
+    best[n - 1] = {st: (0, None) for st in layers[n - 1]}
+    for i in range(n - 2, -1, -1):
+        d, w, later = drive[i + 1], dwell[i + 1], best[i + 1]
+        cur = best[i] = {}
+        for st, opts in layers[i].items():
+            best_cost, best_choice = INF, None
+            for name, dur, nxt in opts:
+                cost = dur + d + w + later[nxt][0]
+                if cost < best_cost:
+                    best_cost, best_choice = cost, (name, dur, nxt)
+            cur[st] = (best_cost, best_choice)
+    total, _ = best[0][start]
+    if total == INF:
+        return None
+
+    # восстановление плана по запомненным решениям
+    plan, t, s = [], 0, start
+    for i in range(n - 1):
+        _, (name, dur, nxt) = best[i][s]
+        if name != "none":
+            plan.append({"stop": i, "name": stops[i].get("name"), "action": name,
+                         "start_s": t, "duration_s": dur})
+        t += dur + drive[i + 1] + dwell[i + 1]
+        s = nxt
+    return {
+        "arrival_s": int(total),
+        "drive_s": sum(drive[1:]),
+        "ext_tokens_used": state.ext_tokens - s[4],
+        "reduced_rests_used": state.reduced_rests - s[6],
+        "stops": plan,
+    }
+
+
+def parse_stops(raw) -> list[dict]:
+    """Проверка входа API; ValueError с понятным текстом."""
+    if not isinstance(raw, list) or len(raw) < 2:
+        raise ValueError("route must be a list of at least 2 stops")
+    if len(raw) > MAX_STOPS:
+        raise ValueError(f"route too long (max {MAX_STOPS} stops)")
+    out = []
+    for i, s in enumerate(raw):
+        if not isinstance(s, dict):
+            raise ValueError(f"stop {i}: expected an object")
+        try:
+            drive_s = int(s.get("drive_s", 0))
+            dwell_s = int(s.get("dwell_s", 0))
+        except (TypeError, ValueError):
+            raise ValueError(f"stop {i}: drive_s and dwell_s must be integers (seconds)")
+        if drive_s < 0 or dwell_s < 0:
+            raise ValueError(f"stop {i}: drive_s and dwell_s must be >= 0")
+        out.append({"name": s.get("name"), "drive_s": drive_s, "dwell_s": dwell_s})
+    return out
+
+
+def state_from_db(conn, user_id: int | None, now_ts: float, **overrides) -> DriverState:
+    """Состояние водителя сейчас по сменам (+ явные поля из запроса поверх)."""
+    c = today_counters(conn, now_ts, user_id)
+    start = duty_start(recent_segments(conn, now_ts - 24 * 3600, now_ts, user_id))
+    base = {
+        "continuous_drive": c["continuous_drive"],
+        "drive_today": c["drive_today"],
+        "duty": int(now_ts - start) if start is not None and c["activity"] != "rest" else 0,
+    }
+    if user_id is not None:
+        # жетоны и сокращённые отдыхи — из журнала; текущая езда сверх 9ч в него
+        # попадёт только при закрытии смены, но жетон уже занят
+        led = ledger.summary(conn, user_id, now_ts)
+        ext_today = led["drive10"]["today"] or c["drive_today"] > DAILY_DRIVE_S
+        tokens = led["drive10"]["left"]
+        if ext_today and not led["drive10"]["today"]:
+            tokens = max(0, tokens - 1)
+        base.update(ext_tokens=tokens, ext_today=ext_today, reduced_rests=led["rest9"]["left"])
+    base.update(overrides)
+    return DriverState(**base)
+
+
+def parse_state(raw) -> dict:
+    """Поля DriverState из запроса (только известные, с приведением типов)."""
+    if raw is None:
+        return {}
+    if not isinstance(raw, dict):
+        raise ValueError("state must be an object")
+    out = {}
+    for f in fields(DriverState):
+        if f.name in raw:
+            try:
+                value = raw[f.name]
+                out[f.name] = bool(value) if f.type == "bool" else int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"state.{f.name}: expected {f.type}")
+            if f.type == "int" and out[f.name] < 0:
+                raise ValueError(f"state.{f.name} must be >= 0")
+    return out
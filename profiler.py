@@ -0,0 +1,130 @@
+# profiler.py
+# Статистический профайлер запросов по требованию. Пока идёт запрос, отдельный
+# поток раз в INTERVAL_MS снимает стек потока-обработчика; в конце стеки
+# сохраняются в PROFILE_DIR в формате collapsed stacks (flamegraph.pl,
+# speedscope и inferno открывают его как есть).
+#
+# Включается заголовком «X-TT-Profile: 1» от админа или случайной выборкой
+# TT_PROFILE_SAMPLE (доля запросов, 0 — выключено).
+
+from __future__ import annotations
+
+import os, re, sys, time, random, threading
+from collections import Counter
+from flask import g, request
+
+from auth import access_claims
+
+PROFILE_DIR  = os.getenv("TT_PROFILE_DIR", "profiles")
+INTERVAL_MS  = float(os.getenv("TT_PROFILE_INTERVAL_MS", "5"))
+SAMPLE_RATE  = float(os.getenv("TT_PROFILE_SAMPLE", "0"))
+KEEP         = int(os.getenv("TT_PROFILE_KEEP", "200"))
+HEADER       = "X-TT-Profile"
+
+_NAME_RE = re.compile(r"^(\d+)_([A-Z]+)_([\w.-]+)_(\d+)ms\.folded$")
+
+
+class Sampler:
+    """Снимает стек одного потока с заданным интервалом."""
+
+    def __init__(self, thread_id: int, interval_s: float):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tt-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+def _wanted() -> bool:
+    if request.headers.get(HEADER) == "1":
+        claims = access_claims()
+        return bool(claims and claims.get("role") == "admin")
+    return SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+
+
+def _before():
+    if not _wanted():
+        return
+    sampler = Sampler(threading.get_ident(), INTERVAL_MS / 1000)
+    g.tt_profile = (sampler, time.perf_counter())
+    sampler.start()
+
+
+def _teardown(exc):
+    item = g.pop("tt_profile", None)
+    if item is None:
+        return
+    sampler, t0 = item
+    sampler.stop()
+    ms = int((time.perf_counter() - t0) * 1000)
+    endpoint = re.sub(r"[^\w.-]", "-", request.endpoint or "unmatched")
+    name = f"{time.time_ns() // 1000}_{request.method}_{endpoint}_{ms}ms.folded"
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, name), "w", encoding="utf-8") as f:
+        f.write(sampler.collapsed())
+    _prune()
+
+
+def _prune() -> None:
+    names = sorted(n for n in os.listdir(PROFILE_DIR) if _NAME_RE.match(n))
+    for n in names[:-KEEP] if len(names) > KEEP else []:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, n))
+        except OSError:
+            pass
+
+
+def list_profiles(limit: int = 50) -> list[dict]:
+    """Последние профили (новые сверху)."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    out = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        m = _NAME_RE.match(name)
+        if not m:
+            continue
+        out.append({
+            "name": name,
+            "created_at": int(m.group(1)) / 1e6,
+            "method": m.group(2),
+            "endpoint": m.group(3),
+            "duration_ms": int(m.group(4)),
+            "bytes": os.path.getsize(os.path.join(PROFILE_DIR, name)),
+        })
+        if len(out) >= limit:
+            break
+    return out
+
+
+def profile_path(name: str) -> str | None:
+    """Путь к профилю по имени (только файлы из PROFILE_DIR)."""
+    if not _NAME_RE.match(name):
+        return None
+    path = os.path.abspath(os.path.join(PROFILE_DIR, name))
+    return path if os.path.isfile(path) else None
+
+
+def init_app(app) -> None:
+    app.before_request(_before)
+    app.teardown_request(_teardown)
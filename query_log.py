@@ -0,0 +1,121 @@
+# query_log.py
+# Профилирование SQL: медленные запросы в лог (с EXPLAIN QUERY PLAN),
+# счётчик запросов на HTTP-запрос и «бюджет» запросов для эндпоинтов.
+#
+# Оба пути доступа к БД уже проходят через наблюдателей из db.py:
+# SQLAlchemy (before/after_cursor_execute) и raw_connect() для sqlite3.
+
+from __future__ import annotations
+
+import os, logging, sqlite3, threading
+from contextlib import contextmanager
+from flask import g, request, current_app, has_request_context
+
+from db import DB_PATH, add_query_listener
+
+log = logging.getLogger("triketime.sql")
+
+SLOW_MS = float(os.getenv("TT_SLOW_QUERY_MS", "50"))
+# статистика последнего завершённого запроса в этом потоке (для тестов)
+_last = threading.local()
+# счётчики для кода вне HTTP-запроса (см. count_queries)
+_scopes = threading.local()
+
+
+def explain(statement: str, params=None) -> list[str]:
+    """EXPLAIN QUERY PLAN на отдельном соединении (чтобы не трогать курсор вызывающего)."""
+    head = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    if head not in ("SELECT", "UPDATE", "DELETE", "INSERT", "WITH", "REPLACE"):
+        return []
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        rows = conn.execute("EXPLAIN QUERY PLAN " + statement, params or ()).fetchall()
+        return [r[-1] for r in rows]
+    except sqlite3.Error as e:
+        return [f"<explain failed: {e}>"]
+    finally:
+        conn.close()
+
+
+def _on_query(statement, params, seconds) -> None:
+    if has_request_context() and "tt_queries" in g:
+        g.tt_queries.append(statement)
+    for scope in getattr(_scopes, "stack", ()):
+        scope.append(statement)
+
+    ms = seconds * 1000
+    if ms >= SLOW_MS:
+        plan = explain(statement, params if isinstance(params, (tuple, list, dict)) else None)
+        where = f"{request.method} {request.path}" if has_request_context() else "-"
+        log.warning("slow query %.1f ms [%s]: %s | params=%r | plan: %s",
+                    ms, where, " ".join(statement.split()), params, "; ".join(plan))
+
+
+# ---------- бюджет запросов ----------
+def query_budget(n: int):
+    """
+    Декоратор для view: объявляет, сколько SQL-запросов эндпоинт может сделать.
+    Превышение пишется в лог, а в тестах ловится assert_query_budget().
+    """
+    def decorator(fn):
+        fn._tt_query_budget = n
+        return fn
+    return decorator
+
+
+def _before():
+    g.tt_queries = []
+
+
+def _teardown(exc):
+    queries = g.pop("tt_queries", None)
+    if queries is None:
+        return
+    _last.queries = queries
+    _last.endpoint = request.endpoint
+    view = current_app.view_functions.get(request.endpoint) if request.endpoint else None
+    budget = getattr(view, "_tt_query_budget", None)
+    if budget is not None and len(queries) > budget:
+        log.warning("query budget exceeded: %s made %d queries (budget %d)",
+                    request.endpoint, len(queries), budget)
+
+
+def init_app(app) -> None:
+    add_query_listener(_on_query)
+    app.before_request(_before)
+    app.teardown_request(_teardown)
+
+
+# ---------- помощники для тестов ----------
+@contextmanager
+def count_queries():
+    """with count_queries() as q: ... ; len(q) — запросы вне HTTP-контекста."""
+    stack = getattr(_scopes, "stack", None)
+    if stack is None:
+        stack = _scopes.stack = []
+    q: list[str] = []
+    stack.append(q)
+    try:
+        yield q
+    finally:
+        stack.remove(q)
+
+
+def assert_query_budget(client, method: str, url: str, **kwargs):
+    """
+    Делает запрос через test client и падает (AssertionError), если эндпоинт
+    сделал больше запросов, чем объявил в @query_budget. Возвращает ответ.
+    """
+    resp = client.open(url, method=method, **kwargs)
+    app = client.application
+    endpoint = getattr(_last, "endpoint", None)
+    queries = getattr(_last, "queries", [])
+    budget = getattr(app.view_functions.get(endpoint), "_tt_query_budget", None)
+    if budget is None:
+        raise AssertionError(f"{method} {url}: endpoint {endpoint!r} has no @query_budget")
+    if len(queries) > budget:
+        listing = "\n  ".join(" ".join(q.split()) for q in queries)
+        raise AssertionError(
+            f"{method} {url}: {len(queries)} queries, budget {budget}:\n  {listing}"
+        )
+    return resp
@@ -0,0 +1,277 @@
+# rebuild.py
+# Пересборка всех производных данных из shifts — после правки импортированных
+# смен или смены параметров правил:
+#   rollup — дневные итоги daily_totals (rollup.py);
+#   ledger — журнал жетонов token_ledger (ledger.py);
+#   alerts — алерты открытых смен по текущим правилам (alerts.refire).
+#
+# Пользователи делятся на части примерно равного числа смен; план частей
+# пишется в rebuild_parts. Процессы пула читают смены своей части по индексу
+# (user_id, start_time) подряд и считают всё за один проход, а главный процесс
+# пишет каждую часть одной транзакцией вместе с отметкой done_at. Прерванную
+# пересборку можно продолжить: повторный запуск берёт незаконченный план и
+# пропускает готовые части.
+#
+# Состояние в памяти работающих процессов (fleet.py, колесо alerts.py)
+# собирается при их старте — после пересборки приложение перезапускают.
+# Пересборку запускают при остановленной записи смен: закрытие смены между
+# чтением части и её записью затрётся.
+#
+#   python rebuild.py [--db database.db] [--workers 4] [--only rollup,ledger] [--restart]
+#   GET /api/admin/rebuild — ход последней пересборки (status())
+
+from __future__ import annotations
+
+import os, sys, time, sqlite3, argparse, multiprocessing
+from datetime import datetime, timezone
+
+import rollup
+import ledger
+from compliance import parse_ts
+
+TARGETS = ("rollup", "ledger", "alerts")
+PART_SHIFTS = int(os.getenv("TT_REBUILD_PART_SHIFTS", "50000"))
+MAX_USER_ID = 2 ** 63 - 1
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+# ---------- план ----------
+def plan(conn, targets: tuple[str, ...], part_shifts: int = PART_SHIFTS) -> str:
+    """
+    Новый план: прежние записи rebuild_parts удаляются. Части покрывают все
+    user_id без пропусков (и пользователей, у которых смен больше нет), плюс
+    часть 0..0 для смен без пользователя.
+    """
+    run = _now_iso()
+    parts = [(0, 0, 0, conn.execute("SELECT COUNT(*) FROM shifts WHERE user_id IS NULL").fetchone()[0])]
+    lo, users, shifts = 1, 0, 0
+    for user_id, n in conn.execute(
+            "SELECT user_id, COUNT(*) FROM shifts WHERE user_id IS NOT NULL GROUP BY user_id ORDER BY user_id"):
+        users, shifts = users + 1, shifts + n
+        if shifts >= part_shifts:
+            parts.append((lo, user_id, users, shifts))
+            lo, users, shifts = user_id + 1, 0, 0
+    parts.append((lo, MAX_USER_ID, users, shifts))
+    conn.execute("BEGIN")
+    conn.execute("DELETE FROM rebuild_parts")
+    conn.executemany(
+        "INSERT INTO rebuild_parts (run, targets, lo, hi, users, shifts) VALUES (?, ?, ?, ?, ?, ?)",
+        [(run, ",".join(targets), *p) for p in parts])
+    conn.commit()
+    return run
+
+
+def pending(conn) -> tuple[str, tuple[str, ...], list[tuple]] | None:
+    """(run, targets, [(id, lo, hi, shifts), ...]) незаконченной пересборки или None."""
+    row = conn.execute("SELECT run, targets FROM rebuild_parts WHERE done_at IS NULL ORDER BY id LIMIT 1").fetchone()
+    if row is None:
+        return None
+    parts = conn.execute(
+        "SELECT id, lo, hi, shifts FROM rebuild_parts WHERE run = ? AND done_at IS NULL ORDER BY id",
+        (row[0],)).fetchall()
+    return row[0], tuple(row[1].split(",")), parts
+
+
+def status(conn, now_ts: float | None = None) -> dict:
+    """
+    Ход последней пересборки: части, смены, скорость и оценка до конца.
+    Скорость — по частям текущего запуска (session): после продолжения
+    прерванной пересборки простой между запусками в неё не входит.
+    """
+    now_ts = now_ts if now_ts is not None else time.time()
+    row = conn.execute(
+        "SELECT run, targets, COUNT(*), SUM(done_at IS NOT NULL), SUM(shifts), "
+        "SUM(CASE WHEN done_at IS NOT NULL THEN shifts ELSE 0 END), SUM(users), MAX(done_at), "
+        "cur, SUM(CASE WHEN done_at IS NOT NULL AND session IS cur THEN shifts ELSE 0 END), "
+        "MAX(CASE WHEN session IS cur THEN done_at END) "
+        "FROM (SELECT *, MAX(session) OVER (PARTITION BY run) AS cur FROM rebuild_parts) "
+        "GROUP BY run ORDER BY run DESC LIMIT 1").fetchone()
+    if row is None:
+        return {"run": None}
+    run, targets, parts, parts_done, shifts, shifts_done, users, last_done, session, session_done, session_last = row
+    started = parse_ts(session or run)
+    elapsed = max(1e-3, (parse_ts(session_last) if parts_done == parts and session_last else now_ts) - started)
+    rate = session_done / elapsed
+    left = shifts - shifts_done
+    return {
+        "run": run,
+        "targets": targets.split(","),
+        "parts": parts, "parts_done": parts_done,
+        "users": users,
+        "shifts": shifts, "shifts_done": shifts_done,
+        "shifts_per_sec": round(rate),
+        "eta_sec": round(left / rate) if rate > 0 and left else (0 if not left else None),
+        "finished_at": last_done if parts_done == parts else None,
+    }
+
+
+# ---------- часть: один проход по сменам ----------
+def _derive(user, rows, targets, totals: dict, entries: list, open_users: list) -> None:
+    """Смены одного пользователя (по start_time) -> итоги, жетоны, есть ли открытая."""
+    if "rollup" in targets:
+        totals.update(rollup.compute_totals(rows))
+    if user is None:
+        return
+    if "ledger" in targets:
+        segs = []
+        for _, activity, s, e in rows:
+            s, e = parse_ts(s), parse_ts(e)
+            if s is not None and e is not None and e > s:
+                segs.append((s, e, activity))
+        entries.extend((user, *entry) for entry in ledger.compute_entries(segs))
+    if any(r[3] is None for r in rows):
+        open_users.append(user)
+
+
+def _compute(job) -> dict:
+    db_path, part_id, lo, hi, targets = job
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    totals: dict = {}
+    entries, open_users, n = [], [], 0
+    try:
+        if lo == 0:
+            cur = conn.execute("SELECT user_id, activity, start_time, end_time FROM shifts WHERE user_id IS NULL")
+        else:
+            cur = conn.execute(
+                "SELECT user_id, activity, start_time, end_time FROM shifts "
+                "WHERE user_id BETWEEN ? AND ? ORDER BY user_id, start_time", (lo, hi))
+        user, rows = None, []
+        for row in cur:
+            n += 1
+            if row[0] != user and rows:
+                _derive(user, rows, targets, totals, entries, open_users)
+                rows = []
+            user = row[0]
+            rows.append(row)
+        if rows:
+            _derive(user, rows, targets, totals, entries, open_users)
+    finally:
+        conn.close()
+    return {
+        "part_id": part_id, "lo": lo, "hi": hi, "shifts": n, "open_users": open_users,
+        "totals": [(uid, day, act, sec, cnt) for (uid, day, act), (sec, cnt) in totals.items()],
+        "entries": entries, "took": time.perf_counter() - t0,
+    }
+
+
+def _apply(conn, part: dict, targets, now_ts: float) -> int:
+    """Записать посчитанное для part["lo"]..part["hi"]; commit делает вызывающий."""
+    import alerts
+
+    written = 0
+    if "rollup" in targets:
+        rollup.replace_range(conn, part["lo"], part["hi"], part["totals"])
+        written += len(part["totals"])
+    if "ledger" in targets:
+        ledger.replace_range(conn, part["lo"], part["hi"], part["entries"])
+        written += len(part["entries"])
+    if "alerts" in targets:
+        for user_id in part["open_users"]:
+            written += alerts.refire(conn, user_id, now_ts)
+    return written
+
+
+def rebuild_user(conn, user_id: int, now_ts: float | None = None, targets: tuple[str, ...] = TARGETS) -> int:
+    """
+    Производные данные одного пользователя заново (после массовой вставки
+    смен, напр. tachograph.py); commit делает вызывающий. Кэш ledger
+    сбрасывает вызывающий — ledger._forget(user_id).
+    """
+    rows = conn.execute(
+        "SELECT user_id, activity, start_time, end_time FROM shifts WHERE user_id = ? ORDER BY start_time",
+        (user_id,)).fetchall()
+    totals: dict = {}
+    entries, open_users = [], []
+    _derive(user_id, rows, targets, totals, entries, open_users)
+    part = {"lo": user_id, "hi": user_id, "open_users": open_users, "entries": entries,
+            "totals": [(uid, day, act, sec, cnt) for (uid, day, act), (sec, cnt) in totals.items()]}
+    return _apply(conn, part, targets, now_ts if now_ts is not None else time.time())
+
+
+def _write(conn, part: dict, targets, now_ts: float) -> int:
+    """Часть целиком — одна транзакция вместе с отметкой в плане."""
+    conn.execute("BEGIN")
+    try:
+        written = _apply(conn, part, targets, now_ts)
+        conn.execute("UPDATE rebuild_parts SET done_at = ?, rows = ?, took_ms = ? WHERE id = ?",
+                     (_now_iso(), written, int(part["took"] * 1000), part["part_id"]))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return written
+
+
+def run(db_path: str, workers: int | None = None, targets: tuple[str, ...] = TARGETS,
+        restart: bool = False, part_shifts: int = PART_SHIFTS, progress=None) -> dict:
+    """
+    Пересобрать (или доделать прерванную пересборку). progress(status) —
+    после каждой записанной части. Возвращает status() в конце.
+    """
+    workers = workers or os.cpu_count() or 1
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        todo = None if restart else pending(conn)
+        if todo is None:
+            plan(conn, targets, part_shifts)
+            todo = pending(conn)
+        run_id, targets, parts = todo
+        now_ts = time.time()
+        # начало этого запуска — от него status() считает скорость и ETA
+        conn.execute("UPDATE rebuild_parts SET session = ? WHERE run = ? AND done_at IS NULL",
+                     (_now_iso(), run_id))
+        # крупные части вперёд — меньше хвост в конце
+        jobs = [(db_path, part_id, lo, hi, targets)
+                for part_id, lo, hi, _ in sorted(parts, key=lambda p: -p[3])]
+        with multiprocessing.Pool(workers) as pool:
+            for part in pool.imap_unordered(_compute, jobs):
+                _write(conn, part, targets, now_ts)
+                if progress:
+                    progress(status(conn))
+        return status(conn)
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    from db import DB_PATH, create_tables
+    from sqlalchemy import create_engine
+
+    ap = argparse.ArgumentParser(description="Пересборка производных таблиц из shifts")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    ap.add_argument("--only", default=",".join(TARGETS), help="что пересобрать: " + ",".join(TARGETS))
+    ap.add_argument("--restart", action="store_true", help="начать заново, а не продолжать прерванную")
+    ap.add_argument("--part-shifts", type=int, default=PART_SHIFTS, help="смен в одной части (транзакции)")
+    ap.add_argument("--progress-sec", type=float, default=2.0)
+    args = ap.parse_args(argv)
+
+    targets = tuple(t for t in args.only.split(",") if t)
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        ap.error(f"unknown targets: {', '.join(sorted(unknown))}")
+    create_tables(create_engine(f"sqlite:///{args.db}"))
+
+    last = [0.0]
+
+    def show(st):
+        if time.monotonic() - last[0] < args.progress_sec and st["parts_done"] < st["parts"]:
+            return
+        last[0] = time.monotonic()
+        eta = f"{st['eta_sec']}s" if st["eta_sec"] is not None else "?"
+        print(f"parts {st['parts_done']}/{st['parts']}  shifts {st['shifts_done']:,}/{st['shifts']:,}  "
+              f"{st['shifts_per_sec']:,}/s  ETA {eta}", file=sys.stderr)
+
+    t0 = time.perf_counter()
+    st = run(args.db, args.workers, targets, args.restart, args.part_shifts, show)
+    print(f"{args.db}: rebuilt {','.join(st['targets'])} for {st['users']} users, "
+          f"{st['shifts']:,} shifts in {time.perf_counter() - t0:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+# restareas.py
+# Ближайшие стоянки для перерыва/отдыха: набор мест из локального файла
+# (TT_REST_AREAS, CSV с заголовком id,name,lat,lon[,kind][,spaces]; без сети)
+# и сеточный индекс по широте/долготе с шагом TT_REST_GRID_DEG.
+#
+# Места отсортированы по номеру ячейки; для ячейки хранится начало её куска
+# (как CSR), поиск ячеек — один searchsorted на квадрат. k ближайших:
+# квадрат из ячеек вокруг точки растёт вдвое, пока k-е расстояние не станет
+# меньше гарантированного (до края квадрата ближе точек вне его быть не
+# может) или квадрат не покроет весь набор / предел досягаемости.
+#
+# Досягаемо — то, до чего водитель успеет доехать до дедлайна: меньшее из
+# «до перерыва», «остаток дневной/недельной езды» и «до начала ежедневного
+# отдыха» (fleet.py) при скорости speed_kmh и дорожном коэффициенте
+# TT_REST_ROAD_FACTOR к расстоянию по прямой.
+#
+#   GET /api/rest-areas/nearest?lat=&lon=&k=5[&speed_kmh=][&drive_left=сек]
+#   (без lat/lon — последняя точка телеметрии водителя)
+
+from __future__ import annotations
+
+import os, csv, math, time, logging
+from datetime import datetime, timezone
+
+import numpy as np
+from flask import request, jsonify
+
+from auth import require_auth
+from compliance import DAY_TZ, CONT_DRIVE_LIMIT_S
+from db import raw_connect
+from query_log import query_budget
+
+log = logging.getLogger("triketime.restareas")
+
+PATH        = os.getenv("TT_REST_AREAS",
+                        os.path.join(os.path.dirname(os.path.abspath(__file__)), "rest_areas.csv"))
+GRID_DEG    = float(os.getenv("TT_REST_GRID_DEG", "0.25"))
+SPEED_KMH   = float(os.getenv("TT_REST_SPEED_KMH", "70"))
+ROAD_FACTOR = float(os.getenv("TT_REST_ROAD_FACTOR", "1.3"))
+MAX_K       = 50
+MAX_SPEED   = 250.0          # км/ч, как telemetry.MAX_SPEED_KMH
+EARTH_KM    = 6371.0088
+KM_PER_DEG  = math.pi * EARTH_KM / 180
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    p1, p2 = math.radians(lat), np.radians(lats)
+    a = (np.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * np.cos(p2) * np.sin(np.radians(lons - lon) / 2) ** 2)
+    return 2 * EARTH_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class RestAreaIndex:
+    def __init__(self, lat, lon, ids=None, names=None, kinds=None, spaces=None, cell_deg: float = GRID_DEG):
+        self.cell = cell_deg
+        self.n_lon = int(math.ceil(360 / cell_deg))
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        key = self._key(self._ilat(lat), self._ilon(lon))
+        order = np.argsort(key, kind="stable")
+        self.lat, self.lon, key = lat[order], lon[order], key[order]
+        take = lambda col: [col[i] for i in order.tolist()] if col is not None else None
+        self.ids = take(ids) or order.tolist()
+        self.names, self.kinds, self.spaces = take(names), take(kinds), take(spaces)
+        self.keys, self.starts = np.unique(key, return_index=True)
+        self.ends = np.r_[self.starts[1:], len(key)].astype(np.int64)
+        if len(lat):
+            il, io = self._ilat(lat), self._ilon(lon)
+            self.bounds = (int(il.min()), int(il.max()), int(io.min()), int(io.max()))
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def _ilat(self, lat):
+        return np.floor((np.asarray(lat) + 90) / self.cell).astype(np.int64)
+
+    def _ilon(self, lon):
+        return np.floor((np.asarray(lon) + 180) / self.cell).astype(np.int64) % self.n_lon
+
+    def _key(self, ilat, ilon):
+        return ilat * self.n_lon + ilon
+
+    @classmethod
+    def load(cls, path: str = PATH, cell_deg: float = GRID_DEG) -> "RestAreaIndex":
+        """CSV id,name,lat,lon[,kind][,spaces]; строки без координат пропускаются."""
+        ids, names, lats, lons, kinds, spaces = [], [], [], [], [], []
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                try:
+                    lat, lon = float(row["lat"]), float(row["lon"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                    continue
+                ids.append(row.get("id") or str(len(ids)))
+                names.append(row.get("name") or "")
+                lats.append(lat)
+                lons.append(lon)
+                kinds.append(row.get("kind") or None)
+                sp = row.get("spaces")
+                spaces.append(int(sp) if sp and sp.isdigit() else None)
+        return cls(lats, lons, ids, names, kinds, spaces, cell_deg)
+
+    def _square(self, lat: float, lon: float, r: int) -> np.ndarray:
+        """Номера мест в квадрате (2r+1)² ячеек вокруг точки."""
+        il, io = int(self._ilat(lat)), int(self._ilon(lon))
+        rows = np.arange(max(0, il - r), min(int(180 / self.cell), il + r) + 1)
+        cols = np.arange(io - r, io + r + 1) % self.n_lon
+        keys = np.unique(self._key(rows[:, None], cols[None, :]).ravel())
+        pos = np.searchsorted(self.keys, keys)
+        inside = pos < len(self.keys)
+        pos, keys = pos[inside], keys[inside]
+        pos = pos[self.keys[pos] == keys]
+        lo, hi = self.starts[pos], self.ends[pos]
+        if not len(lo):
+            return np.empty(0, dtype=np.int64)
+        # конкатенация диапазонов [lo, hi) без цикла по ячейкам
+        lens = hi - lo
+        return np.repeat(lo - np.r_[0, np.cumsum(lens)[:-1]], lens) + np.arange(lens.sum())
+
+    def _covers_all(self, lat: float, lon: float, r: int) -> bool:
+        il, io = int(self._ilat(lat)), int(self._ilon(lon))
+        lat_lo, lat_hi, lon_lo, lon_hi = self.bounds
+        return (il - r <= lat_lo and il + r >= lat_hi
+                and (2 * r + 1 >= self.n_lon or (io - r <= lon_lo and io + r >= lon_hi)))
+
+    def _guaranteed_km(self, lat: float, r: int, max_km: float = math.inf) -> float:
+        """
+        Ближе этого мест вне квадрата r нет: до параллели в r ячейках — r
+        ячеек по меридиану, до меридиана — asin(cos φ · sin Δλ) на худшей
+        широте квадрата (дуга большого круга короче пути по параллели).
+        Места дальше max_km не нужны, поэтому худшая широта — не дальше
+        max_km от точки: у полюса квадрат не растёт до всего шара.
+        """
+        worst_lat = min(90.0, abs(lat) + (r + 1) * self.cell, abs(lat) + max_km / KM_PER_DEG)
+        dlon = math.radians(min(90.0, r * self.cell))
+        by_lon = EARTH_KM * math.asin(math.cos(math.radians(worst_lat)) * math.sin(dlon))
+        return min(r * self.cell * KM_PER_DEG, by_lon)
+
+    def nearest(self, lat: float, lon: float, k: int, max_km: float = math.inf) -> tuple[np.ndarray, np.ndarray]:
+        """(номера, км по прямой) k ближайших в пределах max_km, по возрастанию."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        r = 1
+        while True:
+            idx = self._square(lat, lon, r)
+            d = haversine_km(lat, lon, self.lat[idx], self.lon[idx])
+            ok = d <= max_km
+            idx, d = idx[ok], d[ok]
+            guaranteed = self._guaranteed_km(lat, r, max_km)
+            if len(d) > k:
+                top = np.argpartition(d, k - 1)[:k]
+                idx, d = idx[top], d[top]
+            if ((len(d) == k and d.max() <= guaranteed) or guaranteed >= max_km
+                    or self._covers_all(lat, lon, r)):
+                order = np.argsort(d, kind="stable")
+                return idx[order], d[order]
+            r *= 2
+
+    def site(self, i: int) -> dict:
+        return {"id": self.ids[i], "name": self.names[i] if self.names else "",
+                "lat": float(self.lat[i]), "lon": float(self.lon[i]),
+                "kind": self.kinds[i] if self.kinds else None,
+                "spaces": self.spaces[i] if self.spaces else None}
+
+
+def reachable(index: RestAreaIndex, lat: float, lon: float, k: int, drive_left_s: float,
+              speed_kmh: float = SPEED_KMH, now_ts: float | None = None) -> list[dict]:
+    """k ближайших мест, куда можно доехать за drive_left_s; с расстоянием по дороге и прибытием."""
+    now_ts = now_ts if now_ts is not None else time.time()
+    reach_km = max(0.0, drive_left_s) / 3600 * speed_kmh
+    idx, d = index.nearest(lat, lon, k, reach_km / ROAD_FACTOR)
+    out = []
+    for i, km in zip(idx.tolist(), d.tolist()):
+        road_km = km * ROAD_FACTOR
+        eta = road_km / speed_kmh * 3600
+        out.append({**index.site(i), "distance_km": round(km, 2), "road_km": round(road_km, 1),
+                    "eta_s": int(eta),
+                    "arrive_at": datetime.fromtimestamp(now_ts + eta, timezone.utc).isoformat()})
+    return out
+
+
+def drive_left(rec, now_ts: float) -> float:
+    """Сколько ещё можно ехать по записи fleet.py: до перерыва, дневной/недельный остаток, начало отдыха."""
+    v = rec.view(now_ts, datetime.fromtimestamp(now_ts, DAY_TZ).date().isoformat())
+    left = min(v["break_in"], v["drive_left"], v["week_drive_left"])
+    if v["rest_due"]:
+        left = min(left, max(0, v["rest_due"] - now_ts))
+    return left
+
+
+index = RestAreaIndex([], [])
+
+
+def init_app(app, fleet_status) -> None:
+    global index
+    try:
+        t0 = time.perf_counter()
+        index = RestAreaIndex.load(PATH)
+        log.info("rest areas: %d sites from %s in %.1fs", len(index), PATH, time.perf_counter() - t0)
+    except FileNotFoundError:
+        log.warning("rest areas: %s not found, /api/rest-areas/nearest disabled", PATH)
+
+    @app.route("/api/rest-areas/nearest", methods=["GET"])
+    @require_auth()
+    @query_budget(1)
+    def api_rest_areas_nearest():
+        """k ближайших досягаемых стоянок до дедлайна по правилам вождения."""
+        if not len(index):
+            return jsonify(error="no rest-area dataset loaded"), 503
+        now_ts = time.time()
+        try:
+            k = int(request.args.get("k", "5"))
+            speed = float(request.args.get("speed_kmh", SPEED_KMH))
+            lat = request.args.get("lat")
+            lon = request.args.get("lon")
+            lat, lon = (float(lat), float(lon)) if lat is not None and lon is not None else (None, None)
+            left = request.args.get("drive_left")
+            left = float(left) if left is not None else None
+        except ValueError:
+            return jsonify(error="k, speed_kmh, lat, lon and drive_left must be numbers"), 422
+        if not 1 <= k <= MAX_K or not 0 < speed <= MAX_SPEED:
+            return jsonify(error=f"k must be 1..{MAX_K}, speed_kmh in (0, {MAX_SPEED:g}]"), 422
+        # дедлайн не дальше обязательного перерыва (drive_left() ниже); nan/inf
+        # и огромные значения ломали дедлайн и раздували поиск на весь шар
+        if left is not None and not 0 <= left <= CONT_DRIVE_LIMIT_S:
+            return jsonify(error=f"drive_left must be 0..{CONT_DRIVE_LIMIT_S} seconds"), 422
+        if lat is None:
+            import telemetry
+            with raw_connect() as conn:
+                last = telemetry.last_sample(conn, request.user_id)
+            if last is None:
+                return jsonify(error="lat and lon are required (no telemetry yet)"), 422
+            _, lat, lon, _ = last
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return jsonify(error="lat/lon out of range"), 422
+        if left is None:
+            rec = fleet_status.drivers.get(request.user_id)
+            if rec is None:
+                return jsonify(error="driving state unknown, pass drive_left"), 503
+            left = drive_left(rec, now_ts)
+        return jsonify(deadline=datetime.fromtimestamp(now_ts + left, timezone.utc).isoformat(),
+                       drive_left=int(left), speed_kmh=speed,
+                       sites=reachable(index, lat, lon, k, left, speed, now_ts)), 200
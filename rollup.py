@@ -0,0 +1,190 @@
+# rollup.py
+# Дневные итоги daily_totals: на пользователя, день и активность — секунды и
+# число отрезков. Обновляются в той же транзакции, что и запись в shifts
+# (закрытие, правка, удаление), так что «сегодня/неделя» не требуют скана смен.
+# Интервалы через полночь режутся по дням (compliance.split_by_day).
+#
+#   python rollup.py rebuild [--db database.db] [--workers 4]
+
+from __future__ import annotations
+
+import os, sys, time, sqlite3, argparse, multiprocessing
+from datetime import date, timedelta
+
+from compliance import parse_ts, split_by_day, LEGACY_ACTIVITY
+
+# смены без пользователя (старые глобальные эндпоинты) копятся под user_id = 0
+ANON_USER = 0
+
+_UPSERT = """
+    INSERT INTO daily_totals (user_id, day, activity, seconds, segments)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, day, activity) DO UPDATE SET
+        seconds  = seconds  + excluded.seconds,
+        segments = segments + excluded.segments
+"""
+
+
+def pieces(user_id, activity, start_s, end_s):
+    """Строки (user_id, day, activity, seconds, 1) для закрытой смены."""
+    start, end = parse_ts(start_s), parse_ts(end_s)
+    if start is None or end is None or end <= start:
+        return []
+    uid = user_id if user_id is not None else ANON_USER
+    act = activity or LEGACY_ACTIVITY
+    return [(uid, day, act, int(round(e - s)), 1) for day, s, e in split_by_day(start, end)]
+
+
+def apply_shift(conn, user_id, activity, start_s, end_s, sign: int = 1) -> None:
+    """
+    Добавить (sign=1) или вычесть (sign=-1) закрытую смену из итогов.
+    Вызывать внутри транзакции, которая меняет shifts; commit делает вызывающий.
+    """
+    rows = pieces(user_id, activity, start_s, end_s)
+    if not rows:
+        return
+    if sign < 0:
+        rows = [(u, d, a, -sec, -n) for u, d, a, sec, n in rows]
+    conn.executemany(_UPSERT, rows)
+    if sign < 0:
+        conn.executemany(
+            "DELETE FROM daily_totals WHERE user_id = ? AND day = ? AND activity = ? AND segments <= 0",
+            [(u, d, a) for u, d, a, _, _ in rows],
+        )
+
+
+def apply_row(conn, row, sign: int = 1) -> None:
+    """row = (user_id, activity, start_time, end_time) как в shifts; открытые смены пропускаем."""
+    user_id, activity, start_s, end_s = row
+    if end_s:
+        apply_shift(conn, user_id, activity, start_s, end_s, sign)
+
+
+def read_days(conn, user_id: int | None, day_from: str, day_to: str) -> dict[str, dict]:
+    """{день: {activity: секунды, ..., "segments": n}} за [day_from, day_to]."""
+    uid = user_id if user_id is not None else ANON_USER
+    out: dict[str, dict] = {}
+    for day, activity, seconds, segments in conn.execute(
+        "SELECT day, activity, seconds, segments FROM daily_totals "
+        "WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+        (uid, day_from, day_to),
+    ):
+        d = out.setdefault(day, {"segments": 0})
+        d[activity] = d.get(activity, 0) + seconds
+        d["segments"] += segments
+    return out
+
+
+def add_open_shift(days: dict, open_shift: dict | None, now_ts: float, day_from: str, day_to: str) -> dict:
+    """Доливает в итоги ещё не закрытую смену (до now_ts)."""
+    if not open_shift:
+        return days
+    start = parse_ts(open_shift["start_time"])
+    if start is None or now_ts <= start:
+        return days
+    act = open_shift.get("activity") or LEGACY_ACTIVITY
+    for day, s, e in split_by_day(start, now_ts):
+        if day_from <= day <= day_to:
+            d = days.setdefault(day, {"segments": 0})
+            d[act] = d.get(act, 0) + int(round(e - s))
+            d["segments"] += 1
+    return days
+
+
+# ---------- полная пересборка ----------
+def compute_totals(rows) -> dict[tuple, list]:
+    """rows: (user_id, activity, start_time, end_time) -> {(uid, day, act): [seconds, segments]}."""
+    acc: dict[tuple, list] = {}
+    for user_id, activity, start_s, end_s in rows:
+        if not end_s:
+            continue
+        for uid, day, act, sec, n in pieces(user_id, activity, start_s, end_s):
+            cell = acc.get((uid, day, act))
+            if cell is None:
+                acc[(uid, day, act)] = [sec, n]
+            else:
+                cell[0] += sec
+                cell[1] += n
+    return acc
+
+
+def _rebuild_range(job) -> list[tuple]:
+    db_path, lo, hi, with_null = job
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cur = conn.execute(
+            "SELECT user_id, activity, start_time, end_time FROM shifts "
+            "WHERE user_id BETWEEN ? AND ? AND end_time IS NOT NULL", (lo, hi))
+        acc = compute_totals(cur)
+        if with_null:
+            acc.update(compute_totals(conn.execute(
+                "SELECT user_id, activity, start_time, end_time FROM shifts "
+                "WHERE user_id IS NULL AND end_time IS NOT NULL")))
+    finally:
+        conn.close()
+    return [(uid, day, act, sec, n) for (uid, day, act), (sec, n) in acc.items()]
+
+
+def replace_range(conn, lo: int, hi: int, rows) -> None:
+    """Итоги пользователей lo..hi (0 — ANON_USER) заменить на rows; commit делает вызывающий."""
+    conn.execute("DELETE FROM daily_totals WHERE user_id BETWEEN ? AND ?", (lo, hi))
+    conn.executemany(
+        "INSERT INTO daily_totals (user_id, day, activity, seconds, segments) VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def user_ranges(conn, parts: int) -> list[tuple[int, int]]:
+    """Непрерывные диапазоны user_id примерно равного размера (по числу пользователей)."""
+    ids = [r[0] for r in conn.execute("SELECT DISTINCT user_id FROM shifts WHERE user_id IS NOT NULL ORDER BY 1")]
+    if not ids:
+        return [(1, 0)]
+    step = max(1, -(-len(ids) // max(1, parts)))
+    return [(ids[i], ids[min(i + step, len(ids)) - 1]) for i in range(0, len(ids), step)]
+
+
+def rebuild(db_path: str, workers: int | None = None) -> int:
+    """Пересобирает daily_totals из shifts; пользователи делятся между процессами."""
+    workers = workers or os.cpu_count() or 1
+    conn = sqlite3.connect(db_path)
+    try:
+        ranges = user_ranges(conn, workers * 4)
+        jobs = [(db_path, lo, hi, i == 0) for i, (lo, hi) in enumerate(ranges)]
+        total = 0
+        conn.execute("BEGIN")
+        conn.execute("DELETE FROM daily_totals")
+        with multiprocessing.Pool(workers) as pool:
+            for rows in pool.imap_unordered(_rebuild_range, jobs):
+                conn.executemany(
+                    "INSERT INTO daily_totals (user_id, day, activity, seconds, segments) VALUES (?, ?, ?, ?, ?)",
+                    rows)
+                total += len(rows)
+        conn.commit()
+    finally:
+        conn.close()
+    return total
+
+
+def week_bounds(day: date) -> tuple[str, str]:
+    """Понедельник–воскресенье недели, в которую попадает day."""
+    monday = day - timedelta(days=day.weekday())
+    return monday.isoformat(), (monday + timedelta(days=6)).isoformat()
+
+
+def main(argv=None):
+    from db import DB_PATH, create_tables
+    from sqlalchemy import create_engine
+
+    ap = argparse.ArgumentParser(description="Дневные итоги daily_totals")
+    ap.add_argument("command", choices=["rebuild"])
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--workers", type=int, default=os.cpu_count())
+    args = ap.parse_args(argv)
+
+    create_tables(create_engine(f"sqlite:///{args.db}"))
+    t0 = time.perf_counter()
+    n = rebuild(args.db, args.workers)
+    print(f"{args.db}: daily_totals rebuilt, {n} rows in {time.perf_counter() - t0:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
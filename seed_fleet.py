@@ -0,0 +1,233 @@
+# seed_fleet.py
+# Генератор синтетического автопарка для нагрузочных тестов и бенчмарков.
+# N водителей × M месяцев: пользователи, refresh-токены и непрерывная лента
+# активностей (езда / отдых / другие работы) с правдоподобными длительностями,
+# ночными сменами, переходами через полночь и недельным отдыхом.
+#
+#   python seed_fleet.py --drivers 100 --months 1
+#   python seed_fleet.py --preset 10m --db /tmp/fleet.db --reset
+#
+# Один и тот же --seed всегда даёт один и тот же набор данных.
+
+from __future__ import annotations
+
+import os, sys, time, random, sqlite3, argparse, multiprocessing
+from datetime import datetime, timezone, timedelta
+
+from faker import Faker
+from sqlalchemy import create_engine
+
+from db import DB_PATH, create_tables
+
+PRESETS = {
+    "small": dict(drivers=100, months=1),
+    "10k":   dict(drivers=10_000, months=1),     # ~3.3M смен
+    "10m":   dict(drivers=10_000, months=3),     # ~10M смен
+}
+BATCH = 100_000
+MIN = 60
+HOUR = 3600
+
+
+_iso_cache: dict[int, str] = {}
+
+def _iso(ts: float) -> str:
+    # тот же вид, что now_iso() в app.py (UTC, без микросекунд).
+    # Все отметки кратны минуте, так что различных строк мало — кэшируем.
+    ts = int(ts)
+    s = _iso_cache.get(ts)
+    if s is None:
+        s = _iso_cache[ts] = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(ts))
+    return s
+
+
+def _randint(rng: random.Random, a: int, b: int) -> int:
+    # заметно быстрее random.randint, распределение то же (равномерное на [a, b])
+    return a + int(rng.random() * (b - a + 1))
+
+
+def driver_timeline(rng: random.Random, t: float, end: float):
+    """
+    Лента (start, end, activity) одного водителя от t до end.
+    Рабочий день: приёмка машины, блоки езды до 4.5ч с перерывами 45 мин
+    (иногда погрузка), сдача, ежедневный отдых 11ч (изредка сокращённый 9ч).
+    После 5–6 дней — недельный отдых 45ч (иногда сокращённый 24ч).
+    """
+    days_in_week = 0
+    week_limit = rng.choice((5, 5, 6))
+    ext_left = 2
+    reduced_left = 3
+    while t < end:
+        # --- рабочий день ---
+        dur = _randint(rng, 10, 30) * MIN
+        yield t, t + dur, "other"
+        t += dur
+
+        if ext_left and rng.random() < 0.15:
+            drive_target = 10 * HOUR
+            ext_left -= 1
+        else:
+            drive_target = _randint(rng, 12, 18) * 30 * MIN   # 6..9ч
+        driven = 0
+        while driven < drive_target and t < end:
+            block = min(drive_target - driven, _randint(rng, 90, 270) * MIN)
+            yield t, t + block, "drive"
+            t += block
+            driven += block
+            if driven >= drive_target:
+                break
+            if rng.random() < 0.2:
+                dur = _randint(rng, 20, 60) * MIN               # погрузка/разгрузка
+                yield t, t + dur, "other"
+                t += dur
+            dur = rng.choice((45, 45, 45, 50, 60)) * MIN
+            yield t, t + dur, "rest"
+            t += dur
+
+        dur = _randint(rng, 10, 20) * MIN
+        yield t, t + dur, "other"
+        t += dur
+
+        # --- отдых ---
+        days_in_week += 1
+        if days_in_week >= week_limit:
+            dur = (24 if rng.random() < 0.2 else 45) * HOUR + _randint(rng, 0, 120) * MIN
+            days_in_week, week_limit, ext_left, reduced_left = 0, rng.choice((5, 5, 6)), 2, 3
+        elif reduced_left and rng.random() < 0.2:
+            dur = 9 * HOUR + _randint(rng, 0, 30) * MIN
+            reduced_left -= 1
+        else:
+            dur = 11 * HOUR + _randint(rng, 0, 90) * MIN
+        yield t, t + dur, "rest"
+        t += dur
+
+
+def _shift_rows(job) -> list[tuple]:
+    """Строки shifts для водителей [lo, hi) — выполняется в процессе пула."""
+    seed, first_id, lo, hi, start, now, open_share = job
+    rows = []
+    for i in range(lo, hi):
+        rng = random.Random(seed * 1_000_003 + i)
+        uid = first_id + i
+        # у ~20% водителей ночные смены (старт 19–23ч), остальные с 4 до 8 утра
+        hour = _randint(rng, 19, 23) if rng.random() < 0.2 else _randint(rng, 4, 8)
+        t0 = start + hour * HOUR + _randint(rng, 0, 59) * MIN
+        last = None
+        for s, e, activity in driver_timeline(rng, t0, now):
+            if last is not None:
+                rows.append(last)
+            last = (uid, _iso(s), _iso(e), activity)
+        if last is not None:
+            # последняя активность у части водителей «идёт прямо сейчас»
+            if rng.random() < open_share:
+                last = (uid, last[1], None, last[3])
+            rows.append(last)
+    return rows
+
+
+def generate(conn, drivers: int, months: int, seed: int, password: str, open_share: float,
+             until: float | None = None, workers: int | None = None) -> dict:
+    from passlib.hash import bcrypt
+
+    fake = Faker()
+    fake.seed_instance(seed)
+    pw_hash = bcrypt.hash(password)          # один хэш на всех — bcrypt дорогой
+    now = float(int(until if until is not None else time.time()) // MIN * MIN)
+    start = (datetime.fromtimestamp(now, timezone.utc) - timedelta(days=30 * months)).replace(
+        hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+    cur = conn.cursor()
+    first_id = (cur.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]) + 1
+
+    # --- пользователи ---
+    users = []
+    for i in range(drivers):
+        users.append((first_id + i, f"{fake.user_name()}{first_id + i}", pw_hash, "driver", 1))
+    for role in ("admin", "dispatcher"):
+        if not cur.execute("SELECT 1 FROM users WHERE username = ?", (role,)).fetchone():
+            users.append((first_id + len(users), role, pw_hash, role, 1))
+    cur.executemany(
+        "INSERT INTO users (id, username, password_hash, role, is_active) VALUES (?, ?, ?, ?, ?)", users)
+
+    # --- refresh-токены: пара отозванных и один живой на водителя ---
+    tokens = []
+    for i in range(drivers):
+        rng = random.Random(f"{seed}:{i}:rt")
+        uid = first_id + i
+        for k in range(rng.randint(1, 3)):
+            created = now - rng.randint(0, 14 * 24) * HOUR
+            tokens.append((
+                "%032x" % rng.getrandbits(128), uid, k > 0,
+                datetime.fromtimestamp(created, timezone.utc).isoformat(sep=" "),
+                datetime.fromtimestamp(created + 14 * 24 * HOUR, timezone.utc).isoformat(sep=" "),
+            ))
+    cur.executemany(
+        "INSERT INTO refresh_tokens (jti, user_id, revoked, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+        tokens)
+    conn.commit()
+
+    # --- смены: ленты водителей строятся параллельно, пишет один процесс ---
+    # индекс дешевле построить один раз в конце, чем поддерживать на каждой вставке
+    conn.execute("DROP INDEX IF EXISTS ix_shifts_user_start")
+    chunk = 200
+    jobs = [(seed, first_id, lo, min(lo + chunk, drivers), start, now, open_share)
+            for lo in range(0, drivers, chunk)]
+    total = 0
+    with multiprocessing.Pool(workers) as pool:
+        for rows in pool.imap(_shift_rows, jobs):
+            cur.executemany(
+                "INSERT INTO shifts (user_id, start_time, end_time, activity) VALUES (?, ?, ?, ?)", rows)
+            total += len(rows)
+            if total % BATCH < len(rows):
+                conn.commit()
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_shifts_user_start ON shifts (user_id, start_time)")
+    conn.commit()
+
+    return {"users": len(users), "refresh_tokens": len(tokens), "shifts": total}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Синтетический автопарк для нагрузочных тестов")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--preset", choices=sorted(PRESETS))
+    ap.add_argument("--drivers", type=int, default=100)
+    ap.add_argument("--months", type=int, default=1)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--password", default="driver123", help="пароль всех сгенерированных пользователей")
+    ap.add_argument("--open-share", type=float, default=0.3,
+                    help="доля водителей с открытой (текущей) активностью")
+    ap.add_argument("--until", help="конец ленты, ISO-дата (по умолчанию — сейчас); "
+                                     "для полностью воспроизводимых наборов задайте явно")
+    ap.add_argument("--workers", type=int, default=os.cpu_count(), help="процессы для генерации лент")
+    ap.add_argument("--reset", action="store_true", help="очистить users/refresh_tokens/shifts перед загрузкой")
+    args = ap.parse_args(argv)
+    if args.preset:
+        args.drivers, args.months = PRESETS[args.preset]["drivers"], PRESETS[args.preset]["months"]
+
+    create_tables(create_engine(f"sqlite:///{args.db}"))
+    conn = sqlite3.connect(args.db)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")      # только на время загрузки
+    if args.reset:
+        for table in ("shifts", "refresh_tokens", "users"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.commit()
+
+    t0 = time.perf_counter()
+    until = datetime.fromisoformat(args.until).replace(tzinfo=timezone.utc).timestamp() if args.until else None
+    stats = generate(conn, args.drivers, args.months, args.seed, args.password, args.open_share, until, args.workers)
+    took = time.perf_counter() - t0
+    conn.close()
+
+    # производные таблицы строим из смен одним проходом
+    import rebuild
+    t1 = time.perf_counter()
+    rebuild.run(args.db, args.workers, restart=True)
+    print(f"{args.db}: derived tables rebuilt in {time.perf_counter() - t1:.1f}s")
+    print(f"{args.db}: {stats['users']} users, {stats['refresh_tokens']} refresh tokens, "
+          f"{stats['shifts']} shifts in {took:.1f}s ({stats['shifts'] / took:,.0f} shifts/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
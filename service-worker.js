@@ -1,8 +1,8 @@
 // service-worker.js
-const CACHE_NAME = 'triketime-v10'; // новая версия кэша
+const CACHE_NAME = 'triketime-v11'; // новая версия кэша
 
 const ASSETS = [
-  '/',                       // корень
+  '/',                       // корень (только офлайн-запасной, см. fetch)
   '/static/style.css',
   '/static/manifest.json',
   '/static/icon-192.png',
@@ -25,7 +25,23 @@ self.addEventListener('activate', (event) => {
   );
 });
 
+// страница несёт window.__TT_BOOTSTRAP__ (история на момент ответа) —
+// её берём из сети и обновляем копию; из кэша — только без сети
+function networkFirst(request){
+  return fetch(request).then((resp) => {
+    if (resp.ok){
+      const copy = resp.clone();
+      caches.open(CACHE_NAME).then((cache) => cache.put('/', copy));
+    }
+    return resp;
+  }).catch(() => caches.match('/'));
+}
+
 self.addEventListener('fetch', (event) => {
+  if (event.request.mode === 'navigate' || new URL(event.request.url).pathname === '/'){
+    event.respondWith(networkFirst(event.request));
+    return;
+  }
   event.respondWith(
     caches.match(event.request).then((resp) => resp || fetch(event.request))
   );
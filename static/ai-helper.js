@@ -8,9 +8,11 @@
 //
 
 const AI = (() => {
-  // Веса обучены офлайн (фиктивные, но правдоподобные для демо).
+  // Веса по умолчанию (фиктивные, но правдоподобные для демо); обученные
+  // (train_classifier.py) приходят с сервера — см. load() ниже.
   // Признаки: [bias, stopMin, contDriveMin, hourSin, hourCos, avgSpeed, lastIsDrive, lastIsBreak, lastIsWork]
-  const W = {
+  let version = 0;
+  let W = {
     DRIVE:     [ 0.2, -1.2, 0.9, -0.1, -0.1,  2.0,  0.8, -0.6, -0.3 ],
     BREAK:     [ 0.1, -0.8, 1.6,  0.2, -0.1, -2.5, -0.4,  1.2,  0.1 ],
     OTHER_WORK:[-0.1, -0.4, -0.2,  0.0, -0.0, -0.6, -0.2, -0.3,  0.9 ]
@@ -79,9 +81,21 @@ const AI = (() => {
     };
   }
 
-  return { predict };
+  // те же веса, что у серверного классификатора (classifier.py)
+  function load() {
+    return fetch('/api/model/activity')
+      .then(r => r.ok ? r.json() : null)
+      .then(m => {
+        if (m && m.W && m.W.DRIVE && m.W.DRIVE.length === 9) { W = m.W; version = m.version; }
+      })
+      .catch(() => null);
+  }
+
+  return { predict, load, version: () => version };
 })();
 
+AI.load();
+
 
 // ==========================================
 // Подсказки для водителя
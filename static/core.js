@@ -3,19 +3,28 @@ window.current = { type: null, startedAt: null };
 window.events = JSON.parse(localStorage.getItem('tt_events') || '[]');
 
 function start(type){
-  stop(); // закроем прошлую активность, если есть
+  closeCurrent(); // закроем прошлую активность, если есть (сервер закроет свою сам)
   window.current = { type, startedAt: Date.now() };
   persist();
+  postActivity('/api/activity/start', { activity: SERVER_ACTIVITY[type] || 'other' })
+    .then(() => Promise.all([fetchSummary(), fetchLedger()]));
   renderStatus();
 }
 
 function stop(){
-  if (!window.current.type) return;
+  if (!closeCurrent()) return;
+  postActivity('/api/activity/stop').then(() => Promise.all([fetchSummary(), fetchLedger()]));
+  renderStatus();
+}
+
+function closeCurrent(){
+  if (!window.current.type) return false;
   window.events.push({ type: window.current.type, start: window.current.startedAt, end: Date.now() });
   window.current = { type: null, startedAt: null };
   persist();
+  window.serverSummary = null;  // до ответа сервера — локальный пересчёт
   recompute();  // пересчёт лимитов/подсказок/жетонов
-  renderStatus();
+  return true;
 }
 
 function persist(){
@@ -44,13 +53,99 @@ function durationMs(type, sinceMidnight=true){
   return sum;
 }
 
-function recompute(){
+// ===== сводка с сервера (/api/summary/today) =====
+// Сервер считает из дневных итогов одинаково для всех устройств, но только
+// то, что ему прислали: без входа (window.ttAccessToken) активности живут
+// лишь в tt_events, а /api/summary/today отдал бы общие анонимные счётчики.
+// Поэтому сводка сервера — только при входе, когда start/stop уходят на
+// /api/activity/*; иначе (и офлайн) — локальный скан tt_events.
+// Access-токен берём из refresh-cookie rt (её ставит /api/login): вошедший
+// водитель получает серверную сводку при каждой загрузке, без нового входа.
+window.serverSummary = null;
+window.ttAccessToken = window.ttAccessToken || null;
+const SUMMARY_REFRESH_MS = 60 * 1000;
+const ACCESS_REFRESH_MS = 15 * 60 * 1000;  // access живёт JWT_ACCESS_MIN (20 мин)
+const SERVER_ACTIVITY = { DRIVE: 'drive', BREAK: 'rest', OTHER_WORK: 'other', AVAILABILITY: 'other' };
+
+function serverBacked(){
+  return !!window.ttAccessToken;
+}
+
+function authHeaders(){
+  return { 'Authorization': `Bearer ${window.ttAccessToken}`, 'Content-Type': 'application/json' };
+}
+
+// новый access по cookie rt; 401 — не вошёл (или вышел): локальный режим,
+// сеть недоступна — оставляем прежний токен
+function fetchAccess(){
+  return fetch('/api/refresh', { method: 'POST', credentials: 'same-origin' })
+    .then(r => r.ok ? r.json() : (r.status === 401 ? {} : null))
+    .then(j => {
+      if (!j) return;
+      window.ttAccessToken = j.access || null;
+      if (!window.ttAccessToken) window.serverSummary = null;
+    })
+    .catch(() => null);
+}
+
+function postActivity(url, body){
+  if (!serverBacked()) return Promise.resolve(null);
+  return fetch(url, { method: 'POST', headers: authHeaders(), body: JSON.stringify(body || {}) })
+    .catch(() => null);
+}
+
+function fetchSummary(){
+  if (!serverBacked()) { window.serverSummary = null; return Promise.resolve(null); }
+  return fetch('/api/summary/today', { headers: authHeaders() })
+    .then(r => r.ok ? r.json() : null)
+    .then(s => { window.serverSummary = s; recompute(); })
+    .catch(() => { window.serverSummary = null; });
+}
+
+// жетоны 10ч ведёт сервер (/api/ledger, нужен вход): кружки drive10-N
+// отмечаем по числу использованных на этой неделе
+function fetchLedger(){
+  if (!serverBacked()) return Promise.resolve(null);
+  return fetch('/api/ledger', { headers: authHeaders() })
+    .then(r => r.ok ? r.json() : null)
+    .then(l => {
+      if (!l) return;
+      for (let i = 1; i <= 2; i++){
+        const el = document.querySelector(`[data-key="drive10-${i}"]`);
+        if (el) el.classList.toggle('used', i <= l.drive10.used);
+      }
+    })
+    .catch(() => null);
+}
+
+// счётчики сервера на «сейчас»: идущую активность досчитываем от as_of
+function serverCounters(s){
+  const dt = Math.max(0, Date.now() - s.as_of);
+  const driving = s.activity === 'drive';
+  const other = s.activity === 'other';
+  const driveToday = s.drive_today*1000 + (driving ? dt : 0);
+  const otherToday = s.other_today*1000 + (other ? dt : 0);
+  return {
+    driveToday, otherToday,
+    workToday: driveToday + otherToday,
+    contDrive: s.continuous_drive*1000 + (driving ? dt : 0),
+  };
+}
+
+function localCounters(){
   const driveToday = durationMs('DRIVE');
   const otherToday = durationMs('OTHER_WORK');
-  const workToday  = driveToday + otherToday;
+  return {
+    driveToday, otherToday,
+    workToday: driveToday + otherToday,
+    // непрерывное вождение до перерыва
+    contDrive: computeContinuousDrive(window.events, window.current),
+  };
+}
 
-  // непрерывное вождение до перерыва
-  const contDrive = computeContinuousDrive(window.events, window.current);
+function recompute(){
+  const s = serverBacked() ? window.serverSummary : null;
+  const { driveToday, otherToday, workToday, contDrive } = s ? serverCounters(s) : localCounters();
 
   // правила/подсказки
   if (contDrive >= 4.5*60*60*1000) notify('Нужен перерыв 45 мин');
@@ -96,7 +191,7 @@ function promptUseToken10(){
   if (!el) return;
   if (confirm('Превышено 9ч за рулём. Списать жетон 10ч?')){
     el.classList.add('used');
-    // при необходимости — сохранить состояние жетонов в localStorage
+    // сервер запишет жетон в журнал при закрытии смены; до того — только в DOM
   }
 }
 
@@ -132,6 +227,9 @@ window.addEventListener('DOMContentLoaded', () => {
 
   renderStatus();
   recompute();
+  fetchAccess().then(() => Promise.all([fetchSummary(), fetchLedger()]));
+  setInterval(fetchSummary, SUMMARY_REFRESH_MS);  // без входа — ничего не делает
+  setInterval(fetchAccess, ACCESS_REFRESH_MS);
 });
 
 // простой статус в UI (элемент #tt-status и #tt-summary опциональны)
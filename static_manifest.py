@@ -0,0 +1,135 @@
+# static_manifest.py
+# Манифест статики SPA: один раз обходим FRONT_DIR, запоминаем размеры, mtime,
+# ETag и content-type, а index.html держим в памяти. Поиск файла — обычный dict,
+# без stat'а и исключений на каждый клиентский роут.
+
+from __future__ import annotations
+
+import os, time, hashlib, mimetypes, threading
+from typing import NamedTuple
+
+from flask import Response, request, send_file
+
+# как часто (сек) проверяем, не поменялась ли папка фронта
+RECHECK_SEC = float(os.getenv("TT_STATIC_RECHECK_SEC", "2"))
+# файлы больше этого размера не хэшируем целиком — ETag из размера и mtime
+HASH_LIMIT = 1024 * 1024
+
+
+class StaticEntry(NamedTuple):
+    path: str        # абсолютный путь на диске
+    size: int
+    mtime: float
+    etag: str
+    mimetype: str
+
+
+def _etag_for(path: str, size: int, mtime_ns: int) -> str:
+    if size > HASH_LIMIT:
+        return f"{size:x}-{mtime_ns:x}"
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class StaticManifest:
+    """
+    Снимок файлов под root. Пересобирается сам, если изменились каталоги
+    (добавили/удалили файлы) или index.html (Vite перезаписывает его на месте).
+    """
+
+    def __init__(self, root: str, index_name: str = "index.html"):
+        self.root = os.path.abspath(root)
+        self.index_name = index_name
+        self._lock = threading.Lock()
+        self._entries: dict[str, StaticEntry] = {}
+        self._index_body = b""
+        self._index_etag = ""
+        self._signature: tuple = ()
+        self._checked_at = 0.0
+        self.rebuild()
+
+    # ---------- сборка ----------
+    def _scan_signature(self) -> tuple:
+        """mtime всех каталогов + index.html: дёшево и ловит любую пересборку фронта."""
+        sig = []
+        for dirpath, dirnames, _ in os.walk(self.root):
+            dirnames.sort()
+            try:
+                sig.append((dirpath, os.stat(dirpath).st_mtime_ns))
+            except OSError:
+                pass
+        try:
+            sig.append((self.index_name, os.stat(os.path.join(self.root, self.index_name)).st_mtime_ns))
+        except OSError:
+            pass
+        return tuple(sig)
+
+    def rebuild(self) -> None:
+        entries: dict[str, StaticEntry] = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                full = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(full)
+                except OSError:
+                    continue
+                rel = os.path.relpath(full, self.root).replace(os.sep, "/")
+                mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                entries[rel] = StaticEntry(
+                    path=full,
+                    size=st.st_size,
+                    mtime=st.st_mtime,
+                    etag=_etag_for(full, st.st_size, st.st_mtime_ns),
+                    mimetype=mimetype,
+                )
+
+        index_body, index_etag = b"", ""
+        index_entry = entries.get(self.index_name)
+        if index_entry:
+            with open(index_entry.path, "rb") as f:
+                index_body = f.read()
+            index_etag = hashlib.sha1(index_body).hexdigest()
+
+        with self._lock:
+            self._entries = entries
+            self._index_body = index_body
+            self._index_etag = index_etag
+            self._signature = self._scan_signature()
+            self._checked_at = time.monotonic()
+
+    def _maybe_rebuild(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < RECHECK_SEC:
+            return
+        self._checked_at = now
+        if self._scan_signature() != self._signature:
+            self.rebuild()
+
+    # ---------- поиск ----------
+    def lookup(self, rel_path: str) -> StaticEntry | None:
+        self._maybe_rebuild()
+        return self._entries.get(rel_path)
+
+    @property
+    def index(self) -> tuple[bytes, str]:
+        """(тело index.html, ETag)."""
+        self._maybe_rebuild()
+        return self._index_body, self._index_etag
+
+    # ---------- ответы ----------
+    def send(self, entry: StaticEntry):
+        return send_file(
+            entry.path,
+            mimetype=entry.mimetype,
+            etag=entry.etag,
+            last_modified=entry.mtime,
+            conditional=True,
+        )
+
+    def send_index(self):
+        body, etag = self.index
+        if not body:
+            return "index.html not found", 404
+        resp = Response(body, mimetype="text/html")
+        resp.set_etag(etag)
+        return resp.make_conditional(request)
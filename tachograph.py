@@ -0,0 +1,441 @@
+# tachograph.py
+# Импорт файлов выгрузки тахографа (.DDD) в shifts: карта водителя и
+# бортовое устройство (VU), поколение 1 (Annex 1B); у карты поколения 2
+# активность лежит в том же EF 0504 и тоже читается. Блоки VU поколения 2
+# (TREP 0x21..) не разбираются — DDDError.
+#
+# Файл читается потоком, кусками: память не зависит от его размера.
+# - Карта: записи TLV (FID 2 байта, тип 1, длина 2). Читаются только
+#   Identification (0520 — номер карты) и Driver_Activity_Data (0504 —
+#   кольцевой буфер суточных записей), остальное пропускается.
+# - VU: блоки 76 TREP; их длина считается по счётчикам записей внутри, из
+#   Activities (TREP 02) берутся вставки карт и смены активности за сутки.
+#   По умолчанию — слот водителя со вставленной картой; card= — только
+#   периоды, когда в каком-либо слоте стояла эта карта.
+#
+# Смена активности (ActivityChangeInfo, 2 байта): s (слот) c (экипаж)
+# p (карта не вставлена) aa (00 отдых, 01 готовность, 10 работа, 11 вождение)
+# и минута суток UTC. Отдых -> rest, вождение -> drive, готовность и работа
+# -> other (своих видов у shifts нет). Периоды без карты (p=1) пропускаются.
+# Соседние периоды одного вида склеиваются и через полночь.
+#
+# Запись пачками по TT_DDD_BATCH периодов, пачка — одна транзакция. Уже
+# записанное не дублируется: из периода вычитаются пересечения с
+# существующими сменами пользователя (открытая смена — до бесконечности),
+# остатки короче TT_DDD_MIN_SEC отбрасываются — повторный импорт того же
+# файла ничего не добавляет. Потом итоги, ledger и алерты пользователя
+# пересчитываются заново (rebuild.rebuild_user). Файл, испорченный после
+# нескольких записанных пачек, — 422 с error и счётчиками записанного; кэш
+# «сегодня» и fleet обновляются так же, как после успешного импорта.
+#
+#   POST /api/import/ddd[?user_id=][&card=]  тело — файл или multipart "file"
+#   python tachograph.py import FILE --user ID [--card N] [--db PATH]
+
+from __future__ import annotations
+
+import os, sys, time, struct, logging, argparse
+from datetime import datetime, timezone, timedelta
+
+from flask import request, jsonify
+
+from auth import require_auth
+from db import raw_connect
+from compliance import parse_ts
+
+log = logging.getLogger("triketime.tachograph")
+
+BATCH   = int(os.getenv("TT_DDD_BATCH", "5000"))
+MIN_SEC = float(os.getenv("TT_DDD_MIN_SEC", "60"))
+CHUNK   = 64 * 1024
+DAY     = 86400
+
+ACTIVITIES = ("rest", "other", "other", "drive")   # aa: отдых, готовность, работа, вождение
+FAR_FUTURE = float("inf")
+
+# карта
+FID_IDENTIFICATION = 0x0520
+FID_ACTIVITY       = 0x0504
+DATA_TYPES         = (0, 2)                       # 1, 3 — подписи
+
+# VU gen1: размер блока TREP = постоянная часть + записи по счётчикам
+_U8, _U16 = struct.Struct(">B"), struct.Struct(">H")
+_IW_RECORD = 129
+_CARD_NUMBER = slice(74, 90)                       # fullCardNumber: тип, страна, номер
+_IW_INSERT, _IW_SLOT, _IW_WITHDRAW = 94, 101, 102   # после имени (72), номера (18), срока (4)
+
+
+class DDDError(ValueError):
+    """Файл не разобран: обрезан, неизвестный формат или блок."""
+
+
+class _Reader:
+    """Последовательное чтение потока с подсчётом позиции."""
+
+    def __init__(self, f):
+        self.f = f
+        self.pos = 0
+        self._ahead = b""
+
+    def peek(self) -> bytes:
+        if not self._ahead:
+            self._ahead = self.f.read(1)
+        return self._ahead
+
+    def read(self, n: int) -> bytes:
+        out = self._ahead[:n]
+        self._ahead = self._ahead[n:]
+        while len(out) < n:
+            got = self.f.read(n - len(out))
+            if not got:
+                raise DDDError(f"truncated at byte {self.pos + len(out)}, wanted {n}")
+            out += got
+        self.pos += n
+        return out
+
+    def skip(self, n: int) -> None:
+        while n > 0:
+            step = min(n, CHUNK)
+            self.read(step)
+            n -= step
+
+    def count(self, st: struct.Struct, size: int, extra: int = 0) -> int:
+        """Счётчик записей st, затем пропустить столько записей по size (+ extra)."""
+        n = st.unpack(self.read(st.size))[0]
+        self.skip(n * size + extra)
+        return n
+
+
+# ---------- сутки -> периоды ----------
+def _changes(data: bytes, n: int):
+    """(s, p, activity, минута) из n записей ActivityChangeInfo."""
+    for (v,) in struct.iter_unpack(">H", data[:2 * n]):
+        yield v >> 15, (v >> 13) & 1, ACTIVITIES[(v >> 11) & 3], v & 0x7FF
+
+
+def _day_segments(day_ts: int, changes, now_ts: float):
+    """Смены одного слота за сутки -> (начало, конец, вид), без периодов без карты."""
+    out = []
+    prev = None
+    for p, activity, minute in changes:
+        if prev is not None and minute > prev[0]:
+            out.append((day_ts + prev[0] * 60, day_ts + minute * 60, prev[1], prev[2]))
+        if prev is None or minute >= prev[0]:
+            prev = (min(minute, 1440), activity, p)
+    if prev is not None and prev[0] < 1440:
+        out.append((day_ts + prev[0] * 60, day_ts + DAY, prev[1], prev[2]))
+    return [(s, min(e, now_ts), a) for s, e, a, p in out if not p and s < now_ts]
+
+
+def _merge(segments):
+    """Склеить соседние периоды одного вида (в т.ч. через полночь)."""
+    cur = None
+    for s, e, a in segments:
+        if cur and a == cur[2] and s == cur[1]:
+            cur = (cur[0], e, a)
+            continue
+        if cur:
+            yield cur
+        cur = (s, e, a)
+    if cur:
+        yield cur
+
+
+# ---------- карта ----------
+def _card_segments(r: _Reader, now_ts: float, info: dict):
+    seen = False
+    while r.peek():
+        fid, kind, size = struct.unpack(">HBH", r.read(5))
+        if kind not in DATA_TYPES or (seen and fid == FID_ACTIVITY):
+            r.skip(size)
+        elif fid == FID_IDENTIFICATION and size >= 17:
+            data = r.read(size)
+            info.setdefault("card", data[1:17].decode("latin-1").strip())
+        elif fid == FID_ACTIVITY:
+            # в файле поколения 2 та же активность повторяется — берём первую
+            seen = True
+            yield from _card_activity(r.read(size), now_ts, info)
+        else:
+            r.skip(size)
+    if not seen:
+        raise DDDError("no driver activity data (EF 0504) in card file")
+
+
+def _card_activity(data: bytes, now_ts: float, info: dict):
+    """Кольцевой буфер суточных записей от самой старой до самой новой."""
+    oldest, newest = struct.unpack(">HH", data[:4])
+    ring = data[4:]
+    size = len(ring)
+    if not size or oldest >= size or newest >= size:
+        return
+    ring2 = ring + ring                             # запись может переходить через конец буфера
+    pos, days = oldest, 0
+    while days <= size // 12:
+        _, length, date = struct.unpack(">HHI", ring2[pos:pos + 8])
+        if length < 12 or length > size:
+            raise DDDError(f"bad card activity record at ring offset {pos}")
+        n = (length - 12) // 2
+        rec = ring2[pos + 12:pos + 12 + 2 * n]
+        days += 1
+        yield from _day_segments(date, ((p, a, m) for _, p, a, m in _changes(rec, n)), now_ts)
+        if pos == newest:
+            break
+        pos = (pos + length) % size
+    info["days"] = info.get("days", 0) + days
+
+
+# ---------- бортовое устройство ----------
+def _vu_segments(r: _Reader, now_ts: float, info: dict, card: str | None):
+    while r.peek():
+        sid, trep = r.read(2)
+        if sid != 0x76:
+            raise DDDError(f"expected VU block 76xx at byte {r.pos - 2}, got {sid:02x}{trep:02x}")
+        if trep == 0x01:                            # overview
+            r.skip(491)
+            r.count(_U8, 98)
+            r.count(_U8, 31, 128)
+        elif trep == 0x02:                          # activities
+            yield from _vu_activity_day(r, now_ts, info, card)
+        elif trep == 0x03:                          # events and faults
+            r.count(_U8, 82)
+            r.count(_U8, 83)
+            r.skip(9)
+            r.count(_U8, 31)
+            r.count(_U8, 98, 128)
+        elif trep == 0x04:                          # detailed speed
+            r.count(_U16, 64, 128)
+        elif trep == 0x05:                          # technical data
+            r.skip(136)
+            r.count(_U8, 167, 128)
+        else:
+            raise DDDError(f"VU block 76{trep:02x} at byte {r.pos - 2} is not supported (only generation 1)")
+
+
+def _vu_activity_day(r: _Reader, now_ts: float, info: dict, card: str | None):
+    date = struct.unpack(">I", r.read(4))[0]
+    r.skip(3)                                       # одометр на полночь
+    n_iw = _U16.unpack(r.read(2))[0]
+    windows = []                                    # (слот, вставлена, вынута) нужной карты
+    for _ in range(n_iw):
+        iw = r.read(_IW_RECORD)
+        if card is not None and iw[_CARD_NUMBER].decode("latin-1").strip() == card:
+            t_in, t_out = struct.unpack(">I", iw[_IW_INSERT:_IW_INSERT + 4])[0], \
+                struct.unpack(">I", iw[_IW_WITHDRAW:_IW_WITHDRAW + 4])[0]
+            windows.append((iw[_IW_SLOT], t_in, t_out if t_out != 0xFFFFFFFF and t_out else FAR_FUTURE))
+    n = _U16.unpack(r.read(2))[0]
+    changes = r.read(2 * n)
+    r.count(_U8, 28)
+    r.count(_U16, 5, 128)
+    info["days"] = info.get("days", 0) + 1
+
+    by_slot = ([], [])
+    for s, p, a, m in _changes(changes, n):
+        by_slot[s].append((p, a, m))
+    if card is None:
+        yield from _day_segments(date, by_slot[0], now_ts)
+        return
+    for slot in (0, 1):
+        cut = [(lo, hi) for sl, lo, hi in windows if sl == slot]
+        if not cut:
+            continue
+        for s, e, a in _day_segments(date, by_slot[slot], now_ts):
+            for lo, hi in cut:
+                if min(e, hi) > max(s, lo):
+                    yield max(s, lo), min(e, hi), a
+
+
+def segments(f, now_ts: float | None = None, card: str | None = None, info: dict | None = None):
+    """
+    Поток периодов (начало, конец unix, вид) из файла f (бинарный, читается
+    последовательно). Вид файла — по первому байту (76 — VU). info
+    заполняется по ходу: kind, days, card, bytes.
+    """
+    now_ts = now_ts if now_ts is not None else time.time()
+    info = info if info is not None else {}
+    r = _Reader(f)
+    if not r.peek():
+        raise DDDError("empty file")
+    info["kind"] = "vu" if r.peek()[0] == 0x76 else "card"
+    raw = _vu_segments(r, now_ts, info, card) if info["kind"] == "vu" else _card_segments(r, now_ts, info)
+    try:
+        yield from _merge(raw)
+    except struct.error as e:
+        raise DDDError(f"malformed record near byte {r.pos}: {e}") from None
+    info["bytes"] = r.pos
+
+
+# ---------- запись ----------
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def _day_bound(ts: float, days: int) -> str:
+    """Граница по дате для сравнения строк start_time в любом виде (с запасом на пояса)."""
+    return (datetime.fromtimestamp(ts, timezone.utc).date() + timedelta(days=days)).isoformat()
+
+
+def _existing(conn, user_id: int, lo: float, hi: float) -> list[tuple[float, float]]:
+    """
+    Смены пользователя, которые могут пересекать [lo, hi): начатые в эти
+    даты и последняя начатая раньше (смены пользователя друг друга не
+    перекрывают). Открытая — до бесконечности.
+    """
+    rows = conn.execute(
+        "SELECT start_time, end_time FROM shifts WHERE user_id = ? AND start_time >= ? AND start_time < ?",
+        (user_id, _day_bound(lo, -1), _day_bound(hi, 2))).fetchall()
+    rows += conn.execute(
+        "SELECT start_time, end_time FROM shifts WHERE user_id = ? AND start_time < ? "
+        "ORDER BY start_time DESC LIMIT 1", (user_id, _day_bound(lo, -1))).fetchall()
+    out = []
+    for s, e in rows:
+        s = parse_ts(s)
+        e = parse_ts(e) if e is not None else FAR_FUTURE
+        if s is not None and e is not None and e > lo and s < hi:
+            out.append((s, e))
+    out.sort()
+    return out
+
+
+def _subtract(batch, taken):
+    """
+    Периоды пачки (по возрастанию начала) минус занятые интервалы и друг
+    друга (один день в нескольких выгрузках); короткие остатки — прочь.
+    """
+    j, done = 0, -FAR_FUTURE
+    for s, e, a in batch:
+        s = max(s, done)
+        done = max(done, e)
+        while j < len(taken) and taken[j][1] <= s:
+            j += 1
+        k = j
+        while s < e and k < len(taken) and taken[k][0] < e:
+            ts, te = taken[k]
+            if ts > s and ts - s >= MIN_SEC:
+                yield s, ts, a
+            s = max(s, te)
+            k += 1
+        if e - s >= MIN_SEC:
+            yield s, e, a
+
+
+def _flush(conn, user_id: int, batch) -> tuple[int, int]:
+    batch.sort()
+    lo, hi = batch[0][0], max(e for _, e, _ in batch)
+    rows = [(user_id, _iso(s), _iso(e), a) for s, e, a in _subtract(batch, _existing(conn, user_id, lo, hi))]
+    conn.executemany("INSERT INTO shifts(user_id, start_time, end_time, activity) VALUES(?, ?, ?, ?)", rows)
+    conn.commit()
+    return len(batch), len(rows)
+
+
+def import_file(conn, user_id: int, f, now_ts: float | None = None, card: str | None = None,
+                batch_size: int = BATCH) -> dict:
+    """
+    Разобрать f и дописать недостающие периоды в shifts пользователя, затем
+    пересчитать его производные данные. Кэш «сегодня» и fleet обновляет
+    вызывающий (маршрут ниже). Если файл испорчен посередине, уже записанные
+    пачки остаются (и пересчитываются), а ошибка возвращается в "error"
+    вместе со счётчиками — повтор с исправленным файлом допишет остальное.
+    """
+    import ledger, rebuild
+
+    now_ts = now_ts if now_ts is not None else time.time()
+    info: dict = {}
+    parsed = inserted = 0
+    batch = []
+    error = None
+    t0 = time.perf_counter()
+    try:
+        for seg in segments(f, now_ts, card, info):
+            batch.append(seg)
+            if len(batch) >= batch_size:
+                p, i = _flush(conn, user_id, batch)
+                parsed, inserted, batch = parsed + p, inserted + i, []
+        if batch:
+            p, i = _flush(conn, user_id, batch)
+            parsed, inserted = parsed + p, inserted + i
+    except DDDError as e:
+        error = str(e)
+    except BaseException:
+        # не ошибка файла (БД и т.п.): записанное всё равно пересчитать, исходную ошибку — наверх
+        conn.rollback()
+        if inserted:
+            try:
+                rebuild.rebuild_user(conn, user_id, now_ts)
+                conn.commit()
+            except Exception:
+                log.exception("ddd import user %s: rebuild after failed import", user_id)
+            ledger._forget(user_id)
+        raise
+    if inserted:
+        rebuild.rebuild_user(conn, user_id, now_ts)
+        conn.commit()
+        ledger._forget(user_id)
+    res = {**info, "periods": parsed, "inserted": inserted, "skipped": parsed - inserted,
+           "took_ms": round((time.perf_counter() - t0) * 1000, 1)}
+    if error is not None:
+        res["error"] = error
+    return res
+
+
+def init_app(app, forget_summary) -> None:
+    import transitions
+
+    @app.route("/api/import/ddd", methods=["POST"])
+    @require_auth()
+    # без query_budget: число запросов растёт с длиной файла (2 на пачку + пересчёт)
+    def api_import_ddd():
+        """Файл тахографа водителя; ?user_id= — за другого (админ/диспетчер), ?card= — для VU."""
+        user_id = request.user_id
+        if request.args.get("user_id"):
+            if request.user_role not in ("admin", "dispatcher"):
+                return jsonify(error="forbidden"), 403
+            try:
+                user_id = int(request.args["user_id"])
+            except ValueError:
+                return jsonify(error="user_id must be an integer"), 422
+        upload = request.files.get("file")
+        stream = upload.stream if upload is not None else request.stream
+        with raw_connect() as conn:
+            res = import_file(conn, user_id, stream, time.time(), request.args.get("card") or None)
+            active = conn.execute(
+                "SELECT activity FROM shifts WHERE user_id = ? AND end_time IS NULL ORDER BY id DESC LIMIT 1",
+                (user_id,)).fetchone()
+        if res["inserted"]:
+            forget_summary(user_id)
+            transitions.publish(user_id, (active[0] or "drive") if active else None, time.time())
+        log.info("ddd import user %s: %s", user_id, res)
+        # испорченный файл — 422, но со счётчиками того, что успело записаться
+        return jsonify(user_id=user_id, **res), 422 if "error" in res else 200
+
+
+def main(argv=None):
+    from db import DB_PATH, create_tables
+    from sqlalchemy import create_engine
+
+    ap = argparse.ArgumentParser(description="Импорт файлов тахографа (.DDD) в shifts")
+    ap.add_argument("command", choices=["import"])
+    ap.add_argument("file")
+    ap.add_argument("--user", type=int, required=True)
+    ap.add_argument("--card", help="номер карты: из файла VU брать только её периоды")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--batch", type=int, default=BATCH)
+    args = ap.parse_args(argv)
+
+    create_tables(create_engine(f"sqlite:///{args.db}"))
+    conn = raw_connect(args.db)
+    try:
+        with open(args.file, "rb") as f:
+            res = import_file(conn, args.user, f, card=args.card, batch_size=args.batch)
+    finally:
+        conn.close()
+    mb = res.get("bytes", 0) / 1e6
+    print(f"{args.file}: {res.get('kind')}, {res.get('days', 0)} days, {mb:.1f} MB; "
+          f"{res['periods']:,} periods, {res['inserted']:,} inserted, {res['skipped']:,} already present "
+          f"in {res['took_ms'] / 1000:.1f}s")
+    if "error" in res:
+        print(f"{args.file}: {res['error']}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
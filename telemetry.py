@@ -0,0 +1,448 @@
+# telemetry.py
+# Приём GPS-телеметрии (время, широта, долгота, скорость) пачками от
+# приложения водителя, ~1 Гц, и её хранение.
+#
+# Пачка проверяется целиком операциями NumPy (конечность, диапазоны, время
+# не старше TT_TELEMETRY_MAX_AGE_SEC и не из будущего), сортируется, повторы
+# по времени — и внутри пачки, и с уже сохранёнными — отбрасываются.
+# Отсчёты квантуются в целые (мс, 1e-6 градуса, 0.1 км/ч), и каждая колонка
+# хранится как первое значение + разности соседних в самом узком целом типе,
+# куда они влезают: при 1 Гц это 2 байта на время и координаты и 1 на
+# скорость — около 7 байт на отсчёт вместо 32 (плюс 36 байт заголовка на
+# пачку; bench/bench_telemetry.py: 8.9 при пачках по 10). Пачка пишется строкой
+# telemetry_chunks (не длиннее часа — чтение по индексу (user_id, res, t0)).
+#
+# Хранение по уровням (res — шаг в секундах): сырые ~1 Гц (res 0) старше
+# TT_TELEMETRY_RAW_DAYS сворачиваются в уровень 10 с, тот старше
+# TT_TELEMETRY_10S_DAYS — в 1 мин. Свёртка: одна точка на интервал (первая,
+# скорость — средняя за интервал), затем Douglas–Peucker по синхронному
+# расстоянию (точка сравнивается с положением на упрощённом отрезке в тот же
+# момент — так остаются и повороты, и смены скорости) с допуском в метрах.
+# Обрабатываются целые сутки UTC, строки нового уровня — по суткам; водители
+# идут пачками по TT_TELEMETRY_COMPACT_USERS, каждая — одна транзакция,
+# в которой исходные строки удаляются. Свёртку делает поток
+# "tt-telemetry-retention" раз в TT_TELEMETRY_RETENTION_SEC или
+# python telemetry.py compact. Чтение берёт все уровни за период и само
+# выбирает шаг: не больше TT_TELEMETRY_MAX_POINTS интервалов в ответе (для
+# длинных периодов — шаг крупнее 1 мин, ceil(период / MAX_POINTS); концы
+# треков сохраняются сверх этого). Явный res мельче такого шага укрупняется.
+#
+# Принятые отсчёты после записи получают подписчики on_samples: средняя
+# скорость в feature_store.py (признак avgSpeed классификатора), motion.py.
+#
+#   POST /api/telemetry  {"t": [мс], "lat": [...], "lon": [...], "speed": [км/ч]}
+#                        или {"samples": [[мс, lat, lon, км/ч], ...]}
+#   GET  /api/telemetry?from=ISO&to=ISO[&res=0|10|60][&user_id=] — колонки за период
+
+from __future__ import annotations
+
+import os, sys, math, time, struct, logging, argparse, threading
+
+import numpy as np
+from flask import request, jsonify
+
+from auth import require_auth
+from db import raw_connect
+from compliance import parse_ts
+from query_log import query_budget
+
+log = logging.getLogger("triketime.telemetry")
+
+MAX_BATCH     = int(os.getenv("TT_TELEMETRY_MAX_BATCH", "3600"))
+MAX_AGE_S     = int(os.getenv("TT_TELEMETRY_MAX_AGE_SEC", str(7 * 86400)))
+MAX_SKEW_S    = 120
+MAX_SPEED_KMH = 250.0
+
+RETENTION     = os.getenv("TT_TELEMETRY_RETENTION", "1") != "0"
+RETENTION_SEC = float(os.getenv("TT_TELEMETRY_RETENTION_SEC", "3600"))
+RAW_DAYS      = float(os.getenv("TT_TELEMETRY_RAW_DAYS", "14"))
+T10_DAYS      = float(os.getenv("TT_TELEMETRY_10S_DAYS", "60"))
+COMPACT_USERS = int(os.getenv("TT_TELEMETRY_COMPACT_USERS", "20"))
+MAX_POINTS    = int(os.getenv("TT_TELEMETRY_MAX_POINTS", "5000"))
+# допуск Douglas–Peucker на уровне, метры
+TOLERANCE_M   = {10: float(os.getenv("TT_TELEMETRY_DP_10S_M", "5")),
+                 60: float(os.getenv("TT_TELEMETRY_DP_1MIN_M", "20"))}
+TIERS = (0, 10, 60)
+# наибольший разброс t0..t1 строки уровня — на столько чтение ищет назад
+CHUNK_SPAN_MS = {0: 3600 * 1000, 10: 86400 * 1000, 60: 86400 * 1000}
+GAP_MS = 300 * 1000          # разрыв дольше — новый трек, его концы сохраняются
+
+COLUMNS = ("t", "lat", "lon", "speed")
+# множители квантования: мс, 1e-6 градуса (~0.1 м), 0.1 км/ч
+_QUANT = np.array([1, 1e6, 1e6, 10], dtype=np.float64)
+_HEADER = struct.Struct("<I4s4q")
+_DTYPES = (np.int8, np.int16, np.int32, np.int64)
+
+
+class TelemetryError(ValueError):
+    pass
+
+
+_listeners: list = []
+
+
+def on_samples(fn) -> None:
+    """fn(user_id, t секунд, км/ч) — принятые отсчёты после записи, по времени."""
+    _listeners.append(fn)
+
+
+# ---------- кодирование ----------
+def _narrowest(d: np.ndarray):
+    if not len(d):
+        return np.int8
+    lo, hi = int(d.min()), int(d.max())
+    for dt in _DTYPES:
+        info = np.iinfo(dt)
+        if info.min <= lo and hi <= info.max:
+            return dt
+    return np.int64
+
+
+def encode(q: np.ndarray) -> bytes:
+    """(4, n) int64 квантованных колонок -> заголовок + разности колонок."""
+    n = q.shape[1]
+    deltas = np.diff(q, axis=1)
+    dtypes = [_narrowest(d) for d in deltas]
+    head = _HEADER.pack(n, "".join(np.dtype(dt).char for dt in dtypes).encode(), *(int(v) for v in q[:, 0]))
+    return head + b"".join(d.astype(dt).tobytes() for d, dt in zip(deltas, dtypes))
+
+
+def decode(data: bytes) -> np.ndarray:
+    """Обратно к (4, n) int64."""
+    n, chars, *first = _HEADER.unpack_from(data)
+    out = np.empty((4, n), dtype=np.int64)
+    pos = _HEADER.size
+    for i, ch in enumerate(chars.decode()):
+        dt = np.dtype(ch)
+        d = np.frombuffer(data, dtype=dt, count=n - 1, offset=pos)
+        pos += d.nbytes
+        out[i, 0] = first[i]
+        np.cumsum(d, dtype=np.int64, out=out[i, 1:])
+        out[i, 1:] += first[i]
+    return out
+
+
+# ---------- приём ----------
+def parse_batch(body: dict) -> np.ndarray:
+    """JSON запроса -> (4, n) float64 (t мс, lat, lon, км/ч)."""
+    try:
+        if "samples" in body:
+            a = np.asarray(body["samples"], dtype=np.float64).T
+        else:
+            a = np.array([np.asarray(body[c], dtype=np.float64) for c in COLUMNS])
+    except (KeyError, TypeError, ValueError):
+        raise TelemetryError("expected t, lat, lon, speed columns or samples [[t, lat, lon, speed], ...]")
+    if a.ndim != 2 or a.shape[0] != 4:
+        raise TelemetryError("expected t, lat, lon, speed columns or samples [[t, lat, lon, speed], ...]")
+    if a.shape[1] > MAX_BATCH:
+        raise TelemetryError(f"at most {MAX_BATCH} samples per batch")
+    return a
+
+
+def validate(a: np.ndarray, now_ts: float) -> np.ndarray:
+    """Маска годных отсчётов."""
+    t, lat, lon, speed = a
+    return (np.isfinite(a).all(axis=0)
+            & (t >= (now_ts - MAX_AGE_S) * 1000) & (t <= (now_ts + MAX_SKEW_S) * 1000)
+            & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+            & (speed >= 0) & (speed <= MAX_SPEED_KMH))
+
+
+def _stored_times(conn, user_id: int, t_lo: int, t_hi: int) -> np.ndarray:
+    rows = conn.execute(
+        "SELECT data FROM telemetry_chunks WHERE user_id = ? AND res = 0 AND t0 BETWEEN ? AND ? AND t1 >= ?",
+        (user_id, t_lo - CHUNK_SPAN_MS[0], t_hi, t_lo)).fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate([decode(r[0])[0] for r in rows])
+
+
+def ingest(conn, user_id: int, a: np.ndarray, now_ts: float) -> dict:
+    """
+    Проверить и записать пачку (без commit). Возвращает счётчики и годные
+    отсчёты (t в секундах, скорость) — для скользящих средних.
+    """
+    ok = validate(a, now_ts)
+    rejected = int((~ok).sum())
+    q = np.rint(a[:, ok] * _QUANT[:, None]).astype(np.int64)
+    q = q[:, np.argsort(q[0], kind="stable")]
+    keep = np.ones(q.shape[1], dtype=bool)
+    keep[1:] = q[0, 1:] != q[0, :-1]
+    if keep.any():
+        keep &= ~np.isin(q[0], _stored_times(conn, user_id, int(q[0, 0]), int(q[0, -1])))
+    duplicates = int((~keep).sum())
+    q = q[:, keep]
+    if q.shape[1]:
+        # не длиннее часа на строку — чтобы чтение по t0 не искало далеко назад
+        _insert(conn, user_id, 0, q)
+    return {"accepted": int(q.shape[1]), "rejected": rejected, "duplicates": duplicates,
+            "t": q[0] / 1000.0, "speed": q[3] / 10.0}
+
+
+def _insert(conn, user_id: int, res: int, q: np.ndarray) -> None:
+    """Строки уровня res: отсчёты режутся по границам его CHUNK_SPAN_MS."""
+    bucket = q[0] // CHUNK_SPAN_MS[res]
+    cuts = np.flatnonzero(np.diff(bucket)) + 1
+    conn.executemany(
+        "INSERT INTO telemetry_chunks (user_id, res, t0, t1, n, data) VALUES (?, ?, ?, ?, ?, ?)",
+        [(user_id, res, int(c[0, 0]), int(c[0, -1]), c.shape[1], encode(c)) for c in np.split(q, cuts, axis=1)])
+
+
+# ---------- свёртка по уровням ----------
+def downsample(q: np.ndarray, res: int) -> np.ndarray:
+    """
+    Одна точка на res секунд (q по времени): первая в интервале, скорость —
+    средняя за него. Последняя точка трека (и перед разрывом дольше GAP_MS)
+    остаётся как есть — иначе хвост трека обрезался бы до res секунд.
+    """
+    bucket = q[0] // (res * 1000)
+    first = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    speed = np.rint(np.add.reduceat(q[3], first) / np.diff(np.r_[first, q.shape[1]]))
+    ends = np.r_[np.flatnonzero(np.diff(q[0]) > GAP_MS), q.shape[1] - 1]
+    idx = np.union1d(first, ends)
+    out = q[:, idx].copy()
+    is_first = np.isin(idx, first)
+    out[3, is_first] = speed
+    return out
+
+
+def simplify(q: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """
+    Маска точек после Douglas–Peucker по синхронному расстоянию. Концы
+    треков (и у разрывов дольше GAP_MS) остаются всегда.
+    """
+    n = q.shape[1]
+    keep = np.zeros(n, dtype=bool)
+    if n <= 2:
+        keep[:] = True
+        return keep
+    t = q[0].astype(np.float64)
+    lat = q[1] / 1e6
+    # метры в равнопромежуточной проекции около средней широты
+    x = q[2] / 1e6 * 111_320.0 * np.cos(np.radians(lat.mean()))
+    y = lat * 110_540.0
+    breaks = np.flatnonzero(np.diff(q[0]) > GAP_MS)
+    starts, ends = np.r_[0, breaks + 1], np.r_[breaks, n - 1]
+    keep[starts] = keep[ends] = True
+    stack = [(i, j) for i, j in zip(starts.tolist(), ends.tolist()) if j - i > 1]
+    while stack:
+        i, j = stack.pop()
+        f = (t[i + 1:j] - t[i]) / (t[j] - t[i])
+        d = np.hypot(x[i + 1:j] - x[i] - f * (x[j] - x[i]), y[i + 1:j] - y[i] - f * (y[j] - y[i]))
+        m = int(d.argmax())
+        if d[m] <= tolerance_m:
+            continue
+        m += i + 1
+        keep[m] = True
+        if m - i > 1:
+            stack.append((i, m))
+        if j - m > 1:
+            stack.append((m, j))
+    return keep
+
+
+def _compact_user(conn, user_id: int, src: int, dst: int, cutoff_ms: int) -> tuple[int, int, int]:
+    rows = conn.execute(
+        "SELECT id, data FROM telemetry_chunks WHERE user_id = ? AND res = ? AND t1 < ? ORDER BY t0",
+        (user_id, src, cutoff_ms)).fetchall()
+    if not rows:
+        return 0, 0, 0
+    q = np.concatenate([decode(r[1]) for r in rows], axis=1)
+    q = q[:, np.argsort(q[0], kind="stable")]
+    q = q[:, np.r_[True, q[0, 1:] != q[0, :-1]]]
+    out = downsample(q, dst)
+    out = out[:, simplify(out, TOLERANCE_M[dst])]
+    _insert(conn, user_id, dst, out)
+    conn.executemany("DELETE FROM telemetry_chunks WHERE id = ?", [(r[0],) for r in rows])
+    return len(rows), q.shape[1], out.shape[1]
+
+
+def compact(conn, now_ts: float, users_per_batch: int = COMPACT_USERS) -> dict:
+    """
+    Свернуть всё, что старше сроков уровней. Граница — начало суток UTC, и
+    не моложе окна приёма (MAX_AGE_S + сутки): свёрнутые сутки больше не
+    пополняются. Возвращает {"0->10": {"users", "chunks", "points_in", "points_out"}, ...}.
+    """
+    stats = {}
+    for src, dst, age_s in ((0, 10, max(RAW_DAYS * 86400, MAX_AGE_S + 86400)), (10, 60, T10_DAYS * 86400)):
+        cutoff_ms = int((now_ts - age_s) // 86400 * 86400 * 1000)
+        users = [r[0] for r in conn.execute(
+            "SELECT DISTINCT user_id FROM telemetry_chunks WHERE res = ? AND t1 < ?", (src, cutoff_ms))]
+        st = stats[f"{src}->{dst}"] = {"users": len(users), "chunks": 0, "points_in": 0, "points_out": 0}
+        for k in range(0, len(users), users_per_batch):
+            # чтение внутри транзакции записи: параллельная свёртка из другого воркера ждёт
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for user_id in users[k:k + users_per_batch]:
+                    chunks, p_in, p_out = _compact_user(conn, user_id, src, dst, cutoff_ms)
+                    st["chunks"] += chunks
+                    st["points_in"] += p_in
+                    st["points_out"] += p_out
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+    return stats
+
+
+class Retention:
+    def __init__(self, every: float = RETENTION_SEC):
+        self.every = every
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="tt-telemetry-retention", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.every):
+            try:
+                conn = raw_connect()
+                try:
+                    stats = compact(conn, time.time())
+                finally:
+                    conn.close()
+                if any(st["chunks"] for st in stats.values()):
+                    log.info("telemetry retention: %s", stats)
+            except Exception:
+                log.exception("telemetry retention failed")
+
+
+# ---------- чтение ----------
+def last_sample(conn, user_id: int) -> tuple[float, float, float, float] | None:
+    """Последний сырой отсчёт водителя (t мс, lat, lon, км/ч) или None."""
+    row = conn.execute(
+        "SELECT data FROM telemetry_chunks WHERE user_id = ? AND res = 0 ORDER BY t0 DESC LIMIT 1",
+        (user_id,)).fetchone()
+    if row is None:
+        return None
+    q = decode(row[0])
+    return tuple(float(v) for v in q[:, -1] / _QUANT)
+
+
+_READ = " UNION ALL ".join(
+    f"SELECT data FROM telemetry_chunks WHERE user_id = ? AND res = {res} AND t0 BETWEEN ? AND ? AND t1 >= ?"
+    for res in TIERS)
+
+
+def pick_res(span_s: float) -> int:
+    """
+    Самый мелкий шаг, при котором за span_s выходит не больше MAX_POINTS
+    точек: уровень хранения, а если и 1 мин мало — ceil(span_s / MAX_POINTS).
+    """
+    for res in TIERS:
+        if span_s / max(res, 1) <= MAX_POINTS:
+            return res
+    return max(TIERS[-1], math.ceil(span_s / MAX_POINTS))
+
+
+def read(conn, user_id: int, t_from_ms: int, t_to_ms: int, res: int = 0) -> np.ndarray:
+    """(4, n) float64 отсчётов за [from, to] со всех уровней, по времени; res > 0 — прорежено до шага res."""
+    args = []
+    for tier in TIERS:
+        args += [user_id, t_from_ms - CHUNK_SPAN_MS[tier], t_to_ms, t_from_ms]
+    rows = conn.execute(_READ, args).fetchall()
+    if not rows:
+        return np.empty((4, 0), dtype=np.float64)
+    q = np.concatenate([decode(r[0]) for r in rows], axis=1)
+    q = q[:, (q[0] >= t_from_ms) & (q[0] <= t_to_ms)]
+    q = q[:, np.argsort(q[0], kind="stable")]
+    if res and q.shape[1]:
+        q = downsample(q, res)
+    return q / _QUANT[:, None]
+
+
+retention = Retention()
+
+
+def init_app(app, store) -> None:
+    on_samples(store.add_samples)
+    if RETENTION:
+        retention.start()
+
+    @app.route("/api/telemetry", methods=["POST"])
+    @require_auth()
+    # 2 + переключение активности из motion.py (start_activity, как /api/activity/start)
+    @query_budget(10)
+    def api_telemetry_post():
+        """Пачка отсчётов водителя; ответ — сколько принято и его средняя скорость."""
+        try:
+            a = parse_batch(request.get_json(force=True) or {})
+        except TelemetryError as e:
+            return jsonify(error=str(e)), 422
+        user_id = request.user_id
+        with raw_connect() as conn:
+            res = ingest(conn, user_id, a, time.time())
+            conn.commit()
+        if res["accepted"]:
+            for fn in _listeners:
+                try:
+                    fn(user_id, res["t"], res["speed"])
+                except Exception:
+                    log.exception("telemetry listener %r failed", fn)
+        avg = store.avg_speed(user_id)
+        return jsonify(accepted=res["accepted"], rejected=res["rejected"], duplicates=res["duplicates"],
+                       avg_speed_kmh=round(avg, 1) if avg is not None else None), 200
+
+    @app.route("/api/telemetry", methods=["GET"])
+    @require_auth()
+    @query_budget(1)
+    def api_telemetry_get():
+        """?from=ISO &to=ISO (по умолчанию последний час) &user_id= (админ/диспетчер)."""
+        user_id = request.user_id
+        if request.args.get("user_id"):
+            if request.user_role not in ("admin", "dispatcher"):
+                return jsonify(error="forbidden"), 403
+            try:
+                user_id = int(request.args["user_id"])
+            except ValueError:
+                return jsonify(error="user_id must be an integer"), 422
+        now_ts = time.time()
+        t_to = parse_ts(request.args.get("to")) if request.args.get("to") else now_ts
+        t_from = parse_ts(request.args.get("from")) if request.args.get("from") else t_to - 3600
+        if t_from is None or t_to is None or t_from > t_to:
+            return jsonify(error="from and to must be ISO times, from <= to"), 422
+        res = request.args.get("res")
+        if res is not None and not (res.isdigit() and int(res) in TIERS):
+            return jsonify(error="invalid res", allowed=list(TIERS)), 422
+        # не больше MAX_POINTS точек и при явном res: мелкий шаг за длинный период укрупняется
+        res = max(int(res or 0), pick_res(t_to - t_from))
+        with raw_connect() as conn:
+            cols = read(conn, user_id, int(t_from * 1000), int(t_to * 1000), res)
+        return jsonify(user_id=user_id, res=res, n=cols.shape[1],
+                       **{c: (v.astype(np.int64) if c == "t" else v).tolist() for c, v in zip(COLUMNS, cols)}), 200
+
+
+def main(argv=None):
+    from db import DB_PATH, create_tables
+    from sqlalchemy import create_engine
+
+    ap = argparse.ArgumentParser(description="Хранение телеметрии")
+    ap.add_argument("command", choices=["compact"])
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--now", help="ISO-время вместо текущего (сроки уровней считаются от него)")
+    args = ap.parse_args(argv)
+
+    now_ts = parse_ts(args.now) if args.now else time.time()
+    if now_ts is None:
+        ap.error("--now must be an ISO time")
+    create_tables(create_engine(f"sqlite:///{args.db}"))
+    conn = raw_connect(args.db)
+    t0 = time.perf_counter()
+    try:
+        stats = compact(conn, now_ts)
+    finally:
+        conn.close()
+    for tier, st in stats.items():
+        print(f"{tier}: {st['users']} users, {st['chunks']:,} chunks, "
+              f"{st['points_in']:,} -> {st['points_out']:,} points")
+    print(f"{args.db}: compacted in {time.perf_counter() - t0:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
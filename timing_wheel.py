@@ -0,0 +1,92 @@
+# timing_wheel.py
+# Иерархическое колесо таймеров: миллионы отложенных дедлайнов, вставка и
+# отмена за O(1), срабатывание — по тикам. Уровень L держит таймеры, которые
+# наступят в пределах SLOTS**(L+1) тиков; при обороте младшего колеса слот
+# старшего «осыпается» вниз. Всё, что дальше горизонта, ждёт в overflow.
+#
+# Колесо не потокобезопасно — им владеет один поток (см. alerts.py).
+
+from __future__ import annotations
+
+from typing import Any, Hashable
+
+
+class TimingWheel:
+    def __init__(self, tick: float = 1.0, slots: int = 64, levels: int = 4, now: float = 0.0):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.current = int(now // tick)           # последний обработанный тик
+        self._span = [slots ** level for level in range(levels + 1)]
+        self._wheels: list[list[dict]] = [[{} for _ in range(slots)] for _ in range(levels)]
+        self._overflow: dict = {}
+        # key -> корзина, в которой лежит таймер (для отмены за O(1))
+        self._where: dict[Hashable, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key) -> bool:
+        return key in self._where
+
+    def _bucket(self, at: int) -> dict:
+        for level in range(self.levels):
+            span = self._span[level + 1]
+            if at // span == self.current // span:
+                return self._wheels[level][(at // self._span[level]) % self.slots]
+        return self._overflow
+
+    def _place(self, key, at: int, payload, earliest: int | None = None) -> None:
+        """earliest — самый ранний тик слота: снаружи следующий, при осыпании — текущий."""
+        bucket = self._bucket(max(at, self.current + 1 if earliest is None else earliest))
+        bucket[key] = (at, payload)
+        self._where[key] = bucket
+
+    def schedule(self, key: Hashable, deadline: float, payload: Any = None) -> None:
+        """Поставить (или переставить) таймер key на время deadline."""
+        self.cancel(key)
+        self._place(key, int(-(-deadline // self.tick)), payload)
+
+    def cancel(self, key: Hashable) -> bool:
+        bucket = self._where.pop(key, None)
+        if bucket is None:
+            return False
+        del bucket[key]
+        return True
+
+    def deadline(self, key: Hashable) -> float | None:
+        bucket = self._where.get(key)
+        return bucket[key][0] * self.tick if bucket is not None else None
+
+    def _cascade(self, bucket: dict) -> None:
+        items = list(bucket.items())
+        bucket.clear()
+        # тик self.current ещё не сработал (слот 0 разбирается после осыпания) —
+        # таймер на него должен сработать сейчас, а не тиком позже
+        for key, (at, payload) in items:
+            self._place(key, at, payload, self.current)
+
+    def advance(self, now: float) -> list[tuple[Hashable, float, Any]]:
+        """Прокрутить колесо до now; вернуть сработавшие (key, deadline, payload)."""
+        target = int(now // self.tick)
+        fired = []
+        while self.current < target:
+            if not self._where:
+                self.current = target
+                break
+            self.current += 1
+            cur = self.current
+            # сверху вниз: осыпавшиеся таймеры могут попасть в слот, который
+            # осыпается следующим
+            if cur % self._span[self.levels] == 0 and self._overflow:
+                self._cascade(self._overflow)
+            for level in range(self.levels - 1, 0, -1):
+                if cur % self._span[level] == 0:
+                    self._cascade(self._wheels[level][(cur // self._span[level]) % self.slots])
+            bucket = self._wheels[0][cur % self.slots]
+            if bucket:
+                for key, (at, payload) in bucket.items():
+                    del self._where[key]
+                    fired.append((key, at * self.tick, payload))
+                bucket.clear()
+        return fired
@@ -0,0 +1,204 @@
+# train_classifier.py
+# Обучение весов классификатора активности (classifier.py, ai-helper.js) по
+# истории смен вместо фиктивных.
+#
+# Примеры строятся так, как модель используется: приложение показывает
+# активность k (начата в s_k), а водитель в момент t делает то, что записано
+# в смене на t. Для каждой смены берём точки внутри неё (метка — она сама) и
+# внутри следующей, если та начинается не позже чем через MAX_GAP_S (метка —
+# следующая, «забыл переключить»). Признаки — как в ai-helper.js: время с s_k
+# как stopMin или contDriveMin, час t в TT_TZ, скорость 0, one-hot активности k.
+#
+# Смены читаются кусками по (user_id, start_time), веса — мини-батчевый
+# градиентный спуск multinomial logistic regression, так что память не
+# зависит от размера таблицы. Водители с user_id % 10 == 0 — отложенная
+# выборка: на ней считаются точность и log loss (и для старых весов).
+# Итог — JSON с номером версии; предыдущие версии остаются рядом
+# (activity_model.v<N>.json).
+#
+#   python train_classifier.py [--db database.db] [--epochs 3] [--out activity_model.json]
+
+from __future__ import annotations
+
+import os, sys, json, time, sqlite3, argparse
+from datetime import datetime, timezone
+
+import numpy as np
+
+from compliance import DAY_TZ
+from classifier import MODEL_PATH, W as BUILTIN_W, features, predict_proba, load_model, model_json
+
+MAX_GAP_S = 2 * 3600
+HOLDOUT = 10
+# признаки в минутах — для спуска переводим в часы (и скорость в 50 км/ч);
+# на выходе масштаб вносится в веса, и они снова для сырых признаков
+SCALE = np.array([1, 1 / 60, 1 / 60, 1, 1, 1 / 50, 1, 1, 1], dtype=np.float64)
+
+_ROWS = """
+    SELECT user_id,
+           CASE activity WHEN 'rest' THEN 1 WHEN 'other' THEN 2 ELSE 0 END,
+           (julianday(start_time) - 2440587.5) * 86400.0,
+           (julianday(end_time) - 2440587.5) * 86400.0
+    FROM shifts
+    WHERE user_id IS NOT NULL AND end_time IS NOT NULL
+    ORDER BY user_id, start_time
+"""
+
+_hour_offsets: dict[int, int] = {}
+
+
+def local_hour(ts: np.ndarray) -> np.ndarray:
+    """Час суток в DAY_TZ; смещение считается раз на каждый час UTC."""
+    utc_hour = np.floor(ts / 3600).astype(np.int64)
+    uniq, inv = np.unique(utc_hour, return_inverse=True)
+    off = np.empty(len(uniq), dtype=np.int64)
+    for i, h in enumerate(uniq.tolist()):
+        o = _hour_offsets.get(h)
+        if o is None:
+            o = _hour_offsets[h] = int(datetime.fromtimestamp(h * 3600, DAY_TZ).utcoffset().total_seconds())
+        off[i] = o
+    return ((ts + off[inv]) // 3600 % 24).astype(np.int64)
+
+
+def chunks(conn, size: int):
+    """Колонки (user, act, start, end) кусками; смены одного водителя подряд."""
+    cur = conn.execute(_ROWS)
+    while True:
+        rows = cur.fetchmany(size)
+        if not rows:
+            return
+        a = np.array(rows, dtype=np.float64)
+        ok = np.isfinite(a[:, 2]) & np.isfinite(a[:, 3]) & (a[:, 3] > a[:, 2])
+        a = a[ok]
+        yield a[:, 0].astype(np.int64), a[:, 1].astype(np.int8), a[:, 2], a[:, 3]
+
+
+def samples(user, act, start, end, rng, per_segment: int):
+    """(user, X, y) по куску смен: точки внутри смены и внутри следующей."""
+    n = len(user)
+    has_next = np.zeros(n, dtype=bool)
+    has_next[:-1] = (user[1:] == user[:-1]) & (start[1:] - end[:-1] <= MAX_GAP_S) & (start[1:] >= end[:-1])
+    nxt = np.minimum(np.arange(n) + 1, n - 1)
+
+    idx = np.repeat(np.arange(n), per_segment)
+    t_in = start[idx] + rng.random(len(idx)) * (end[idx] - start[idx])
+    y_in = act[idx]
+    j = np.repeat(np.flatnonzero(has_next), per_segment)
+    t_nx = start[nxt[j]] + rng.random(len(j)) * (end[nxt[j]] - start[nxt[j]])
+    y_nx = act[nxt[j]]
+
+    seg = np.concatenate([idx, j])
+    t = np.concatenate([t_in, t_nx])
+    y = np.concatenate([y_in, y_nx]).astype(np.int64)
+    code = act[seg].astype(np.int8) + 1                 # classifier: 1 drive, 2 rest, 3 other
+    elapsed = t - start[seg]
+    x = features(np.where(code != 1, elapsed, 0), np.where(code == 1, elapsed, 0), local_hour(t), 0.0, code)
+    # классы: 0 DRIVE, 1 BREAK, 2 OTHER_WORK — те же коды, что у активности
+    return user[seg], x, y
+
+
+def _log_loss(p: np.ndarray, y: np.ndarray) -> float:
+    return float(-np.log(np.clip(p[np.arange(len(y)), y], 1e-12, None)).sum())
+
+
+def train(db_path: str, epochs: int = 3, batch: int = 512, lr: float = 0.5, l2: float = 1e-4,
+          chunk: int = 50_000, per_segment: int = 2, seed: int = 1, log=print) -> dict:
+    """Возвращает {"W": (3, 9) для сырых признаков, "rows", "samples", "metrics"}."""
+    rng = np.random.default_rng(seed)
+    w = np.zeros_like(BUILTIN_W)
+    step = 0
+    rows = n_train = 0
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        for epoch in range(epochs):
+            last = epoch == epochs - 1
+            val = {"n": 0, "hit": 0, "loss": 0.0, "base_hit": 0, "base_loss": 0.0}
+            t0 = time.perf_counter()
+            for user, act, start, end in chunks(conn, chunk):
+                rows += len(user) if epoch == 0 else 0
+                users, x, y = samples(user, act, start, end, rng, per_segment)
+                hold = users % HOLDOUT == 0
+                if last and hold.any():
+                    xv, yv = x[hold], y[hold]
+                    p = predict_proba(xv, w * SCALE)
+                    pb = predict_proba(xv, BUILTIN_W)
+                    val["n"] += len(yv)
+                    val["hit"] += int((p.argmax(1) == yv).sum())
+                    val["loss"] += _log_loss(p, yv)
+                    val["base_hit"] += int((pb.argmax(1) == yv).sum())
+                    val["base_loss"] += _log_loss(pb, yv)
+                xs, ys = x[~hold] * SCALE, y[~hold]
+                order = rng.permutation(len(ys))
+                for i in range(0, len(order), batch):
+                    b = order[i:i + batch]
+                    p = predict_proba(xs[b], w)
+                    p[np.arange(len(b)), ys[b]] -= 1
+                    grad = p.T @ xs[b] / len(b)
+                    grad[:, 1:] += l2 * w[:, 1:]
+                    w -= lr / (1 + 1e-4 * step) * grad
+                    step += 1
+                n_train += len(ys) if epoch == 0 else 0
+            log(f"epoch {epoch + 1}/{epochs}: {time.perf_counter() - t0:.1f}s, step {step}")
+    finally:
+        conn.close()
+    n = max(1, val["n"])
+    return {
+        "W": w * SCALE, "rows": rows, "samples": n_train,
+        "metrics": {
+            "holdout_samples": val["n"],
+            "accuracy": round(val["hit"] / n, 4), "log_loss": round(val["loss"] / n, 4),
+            "builtin_accuracy": round(val["base_hit"] / n, 4), "builtin_log_loss": round(val["base_loss"] / n, 4),
+        },
+    }
+
+
+def export(result: dict, out: str, params: dict) -> dict:
+    """Пишет out (текущая версия) и out с .v<N> рядом; N — следующая после текущей."""
+    try:
+        version = load_model(out)["version"] + 1
+    except (ValueError, KeyError):
+        version = 1
+    doc = {
+        **model_json({"version": version, "W": result["W"]}),
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+        "rows": result["rows"], "samples": result["samples"],
+        "params": params, "metrics": result["metrics"],
+    }
+    root, ext = os.path.splitext(out)
+    for path in (f"{root}.v{version}{ext}", out):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(doc, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+    return doc
+
+
+def main(argv=None):
+    from db import DB_PATH
+
+    ap = argparse.ArgumentParser(description="Обучение классификатора активности по истории смен")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--out", default=MODEL_PATH)
+    ap.add_argument("--epochs", type=int, default=3)
+    ap.add_argument("--batch", type=int, default=512)
+    ap.add_argument("--lr", type=float, default=0.5)
+    ap.add_argument("--l2", type=float, default=1e-4)
+    ap.add_argument("--chunk", type=int, default=50_000, help="смен за одно чтение")
+    ap.add_argument("--per-segment", type=int, default=2, help="точек на смену и на переход")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args(argv)
+
+    params = {k: getattr(args, k) for k in ("epochs", "batch", "lr", "l2", "per_segment", "seed")}
+    t0 = time.perf_counter()
+    result = train(args.db, args.epochs, args.batch, args.lr, args.l2, args.chunk, args.per_segment, args.seed,
+                   log=lambda msg: print(msg, file=sys.stderr))
+    doc = export(result, args.out, params)
+    m = doc["metrics"]
+    print(f"{args.out}: version {doc['version']}, {doc['rows']:,} shifts, {doc['samples']:,} samples "
+          f"in {time.perf_counter() - t0:.1f}s; holdout accuracy {m['accuracy']} "
+          f"(built-in weights {m['builtin_accuracy']}), log loss {m['log_loss']} ({m['builtin_log_loss']})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
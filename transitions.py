@@ -0,0 +1,30 @@
+# transitions.py
+# Переходы активности водителя (start/stop) для подписчиков внутри процесса:
+# алерты, статус автопарка и т.п. Публикуются после commit, так что
+# подписчик видит в БД уже новое состояние.
+#
+#   @transitions.subscribe
+#   def on_transition(user_id, activity, ts): ...   # activity=None — остановка
+
+from __future__ import annotations
+
+import logging
+
+log = logging.getLogger("triketime.transitions")
+
+_subscribers: list = []
+
+
+def subscribe(fn):
+    """Регистрирует fn(user_id, activity, ts); можно использовать как декоратор."""
+    _subscribers.append(fn)
+    return fn
+
+
+def publish(user_id: int | None, activity: str | None, ts: float) -> None:
+    """Сообщить всем подписчикам о переходе; ошибка одного не мешает остальным."""
+    for fn in _subscribers:
+        try:
+            fn(user_id, activity, ts)
+        except Exception:
+            log.exception("transition subscriber %r failed", fn)